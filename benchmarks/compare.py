@@ -0,0 +1,58 @@
+"""
+Compare two benchmark results saved by benchmarks.run.
+
+usage:
+    python -m benchmarks.compare base.json new.json --threshold 0.10
+"""
+
+import json
+import argparse
+
+
+def parse_args():
+    arg_parser = argparse.ArgumentParser(description="Compare stage times of two benchmark results")
+    arg_parser.add_argument("base", type=str, help="path of base results")
+    arg_parser.add_argument("new", type=str, help="path of new results")
+    arg_parser.add_argument(
+        "--threshold", type=float, default=0.10, help="relative slowdown to be reported as regression"
+    )
+    arg_parser.add_argument("--steps", default=False, action="store_true", help="compare sub-steps too")
+    return arg_parser.parse_args()
+
+
+def compare(base: dict[str, float], new: dict[str, float], threshold: float) -> tuple[list[str], int]:
+    """
+
+    :param base: name -> seconds
+    :param new: name -> seconds
+    :param threshold:
+    :return: lines of report, and number of regressions
+    """
+    lines = [f"{'name':<48s} {'base(s)':>10s} {'new(s)':>10s} {'change':>9s}"]
+    regressions = 0
+    for name in sorted(set(base) | set(new)):
+        t0, t1 = base.get(name), new.get(name)
+        if t0 is None or t1 is None:
+            lines.append(f"{name:<48s} {t0 or float('nan'):>10.3f} {t1 or float('nan'):>10.3f} {'n/a':>9s}")
+            continue
+        change = t1 / t0 - 1 if t0 > 0 else 0.0
+        flag = ""
+        if change > threshold:
+            flag, regressions = " <- regression", regressions + 1
+        lines.append(f"{name:<48s} {t0:>10.3f} {t1:>10.3f} {change:>+9.1%}{flag}")
+    return lines, regressions
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    with open(args.base, "r") as f:
+        res_base = json.load(f)
+    with open(args.new, "r") as f:
+        res_new = json.load(f)
+    if res_base["synthetic"] != res_new["synthetic"]:
+        print(f"Warning: synthetic data differ, base = {res_base['synthetic']}, new = {res_new['synthetic']}")
+    print(f"base = {res_base['commit']}, new = {res_new['commit']}")
+    key = "steps" if args.steps else "stages"
+    report, n = compare(res_base[key], res_new[key], args.threshold)
+    print("\n".join(report))
+    raise SystemExit(1 if n > 0 else 0)
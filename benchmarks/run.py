@@ -0,0 +1,369 @@
+"""
+Benchmark every stage of the project on synthetic data.
+
+usage:
+    python -m benchmarks.run --root /tmp/cta_bench --instrus 10 --days 500 --minutes 60
+    python -m benchmarks.compare base.json new.json
+
+Results are saved to {root}/results/{commit}-{N}x{T}x{M}.json, in which stage times
+could be compared across commits.
+"""
+
+import os
+import json
+import time
+import shutil
+import argparse
+import subprocess
+import datetime as dt
+from dataclasses import asdict
+from husfort.qsqlite import CDbStruct
+from husfort.qcalendar import CCalendar
+from husfort.qlog import define_logger
+from typedef import CCfgProj, CCfgConst
+from typedefs.typedef_instrus import TUniverse, CCfgAvlbUnvrs
+from typedefs.typedef_css import CCfgCss, CCfgICov, CCfgMkt
+from typedefs.typedef_returns import CCfgTst
+from config import load_config, FACTOR_ALGS_DIR
+from solutions.factor_registry import CCfgFactors
+from solutions.db_generator import get_avlb_db, get_css_db, get_icov_db, get_market_db
+from solutions.perf import enable_perf, summarize_perf
+from benchmarks.synthetic import (
+    CCfgSynthetic,
+    gen_universe,
+    gen_synthetic_data,
+    get_preprocess_table,
+    get_minute_bar_table,
+)
+
+
+def parse_args():
+    arg_parser = argparse.ArgumentParser(description="Benchmark stages of this project on synthetic data")
+    arg_parser.add_argument("--root", type=str, required=True, help="root dir for synthetic data and outputs")
+    arg_parser.add_argument("--instrus", type=int, default=10, help="number of instruments")
+    arg_parser.add_argument("--days", type=int, default=500, help="number of trade days")
+    arg_parser.add_argument("--minutes", type=int, default=60, help="number of minutes per day")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--db-struct", type=str, default=None, help="use tables of the real db_struct.yaml")
+    arg_parser.add_argument("--reuse", default=False, action="store_true", help="reuse synthetic data in root")
+    arg_parser.add_argument("--mp", default=False, action="store_true", help="use multiprocess where supported")
+    arg_parser.add_argument(
+        "--stages",
+        type=str,
+        nargs="*",
+        default=None,
+        help="stages to run, default is all: avlb mkt css icov test_return factor ic vt",
+    )
+    return arg_parser.parse_args()
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except FileNotFoundError:
+        return "unknown"
+
+
+def gen_proj_cfg(root: str, universe: TUniverse, config: dict) -> CCfgProj:
+    data_dir = os.path.join(root, "data")
+    return CCfgProj(
+        calendar_path=os.path.join(data_dir, "calendar.csv"),
+        root_dir=data_dir,
+        db_struct_path="",
+        alternative_dir=os.path.join(data_dir, "alternative"),
+        market_index_path=os.path.join(data_dir, "index.xlsx"),
+        by_instru_pos_dir=os.path.join(data_dir, "position"),
+        by_instru_pre_dir=os.path.join(data_dir, "preprocess"),
+        by_instru_min_dir=os.path.join(data_dir, "minute_bar"),
+        instru_info_path="",
+        project_root_dir=os.path.join(root, "project"),
+        universe=universe,
+        avlb_unvrs=CCfgAvlbUnvrs(**config["available"]),
+        css=CCfgCss(**config["css"]),
+        icov=CCfgICov(**config["icov"]),
+        mkt=CCfgMkt(**config["mkt"]),
+        const=CCfgConst(**config["CONST"]),
+        tst=CCfgTst(**config["tst"]),
+    )
+
+
+class CBenchmark:
+    def __init__(
+        self,
+        proj_cfg: CCfgProj,
+        cfg_factors: CCfgFactors,
+        db_struct_preprocess: CDbStruct,
+        db_struct_minute_bar: CDbStruct,
+        calendar: CCalendar,
+        bgn_date: str,
+        stp_date: str,
+        call_multiprocess: bool,
+    ):
+        self.proj_cfg = proj_cfg
+        self.cfg_factors = cfg_factors
+        self.db_struct_preprocess = db_struct_preprocess
+        self.db_struct_minute_bar = db_struct_minute_bar
+        self.calendar = calendar
+        self.bgn_date, self.stp_date = bgn_date, stp_date
+        self.call_multiprocess = call_multiprocess
+        self.db_struct_avlb = get_avlb_db(proj_cfg.avlb_dir)
+        self.db_struct_css = get_css_db(proj_cfg.css_dir, proj_cfg.sectors)
+        self.db_struct_icov = get_icov_db(proj_cfg.icov_dir)
+        self.db_struct_mkt = get_market_db(proj_cfg.mkt_dir, proj_cfg.sectors)
+        self.timings: dict[str, float] = {}
+
+    def timeit(self, stage: str, func, *args, **kwargs):
+        t0 = time.perf_counter()
+        func(*args, **kwargs)
+        self.timings[stage] = time.perf_counter() - t0
+        print(f"{stage:<32s} {self.timings[stage]:>10.3f} s")
+        return 0
+
+    @property
+    def factor_bgn_date(self) -> str:
+        # factors need a buffer of data before, as production does
+        return self.calendar.get_next_date(self.bgn_date, shift=300)
+
+    @property
+    def qtest_bgn_date(self) -> str:
+        return self.calendar.get_next_date(self.factor_bgn_date, shift=20)
+
+    def run_avlb(self):
+        from solutions.avlb import main_available
+
+        self.timeit(
+            "avlb",
+            main_available,
+            bgn_date=self.bgn_date,
+            stp_date=self.stp_date,
+            universe=self.proj_cfg.universe,
+            cfg_avlb_unvrs=self.proj_cfg.avlb_unvrs,
+            db_struct_preprocess=self.db_struct_preprocess,
+            db_struct_avlb=self.db_struct_avlb,
+            calendar=self.calendar,
+        )
+
+    def run_mkt(self):
+        from solutions.mkt import main_market
+
+        self.timeit(
+            "mkt",
+            main_market,
+            bgn_date=self.bgn_date,
+            stp_date=self.stp_date,
+            calendar=self.calendar,
+            db_struct_avlb=self.db_struct_avlb,
+            db_struct_mkt=self.db_struct_mkt,
+            path_mkt_idx_data=self.proj_cfg.market_index_path,
+            mkt_idxes=self.proj_cfg.mkt.idxes,
+            sectors=self.proj_cfg.sectors,
+        )
+
+    def run_css(self):
+        from solutions.css import CCrossSectionCalculator
+
+        css = CCrossSectionCalculator(
+            cfg_css=self.proj_cfg.css,
+            db_struct_avlb=self.db_struct_avlb,
+            db_struct_css=self.db_struct_css,
+            db_struct_mkt=self.db_struct_mkt,
+            sectors=self.proj_cfg.sectors,
+        )
+        bgn_date = self.calendar.get_next_date(self.bgn_date, shift=self.proj_cfg.css.buffer_win)
+        self.timeit("css", css.main, bgn_date=bgn_date, stp_date=self.stp_date, calendar=self.calendar)
+
+    def run_icov(self):
+        from solutions.icov import CICOV
+
+        icov = CICOV(
+            cfg_icov=self.proj_cfg.icov,
+            universe=self.proj_cfg.universe,
+            db_struct_preprocess=self.db_struct_preprocess,
+            db_struct_icov=self.db_struct_icov,
+        )
+        bgn_date = self.calendar.get_next_date(self.bgn_date, shift=self.proj_cfg.icov.win)
+        self.timeit("icov", icov.main, bgn_date=bgn_date, stp_date=self.stp_date, calendar=self.calendar)
+
+    def run_test_return(self):
+        from solutions.test_return import CTestReturnsByInstru, CTestReturnsAvlb
+
+        for ret in self.proj_cfg.all_rets:
+            test_returns_by_instru = CTestReturnsByInstru(
+                ret=ret,
+                universe=self.proj_cfg.universe,
+                test_returns_by_instru_dir=self.proj_cfg.test_returns_by_instru_dir,
+                db_struct_preprocess=self.db_struct_preprocess,
+            )
+            self.timeit(
+                f"test_return/{ret.ret_name}/by_instru",
+                test_returns_by_instru.main,
+                self.bgn_date,
+                self.stp_date,
+                self.calendar,
+            )
+            test_returns_avlb = CTestReturnsAvlb(
+                ret=ret,
+                universe=self.proj_cfg.universe,
+                test_returns_by_instru_dir=self.proj_cfg.test_returns_by_instru_dir,
+                test_returns_avlb_raw_dir=self.proj_cfg.test_returns_avlb_raw_dir,
+                db_struct_avlb=self.db_struct_avlb,
+            )
+            self.timeit(
+                f"test_return/{ret.ret_name}/avlb",
+                test_returns_avlb.main,
+                self.bgn_date,
+                self.stp_date,
+                self.calendar,
+            )
+
+    def run_factor(self):
+        from solutions.factor import CFactorsAvlb, pick_factor
+
+        for fclass in self.cfg_factors.classes:
+            cfg, fac = pick_factor(
+                fclass=fclass,
+                cfg_factors=self.cfg_factors,
+                factors_by_instru_dir=self.proj_cfg.factors_by_instru_dir,
+                universe=self.proj_cfg.universe,
+                preprocess=self.db_struct_preprocess,
+                minute_bar=self.db_struct_minute_bar,
+                db_struct_pos=None,
+                db_struct_forex=None,
+                db_struct_macro=None,
+                db_struct_mkt=self.db_struct_mkt,
+                instru_mgr=None,
+            )
+            self.timeit(
+                f"factor/{fclass}/by_instru",
+                fac.main,
+                bgn_date=self.factor_bgn_date,
+                stp_date=self.stp_date,
+                calendar=self.calendar,
+                call_multiprocess=self.call_multiprocess,
+                processes=None,
+            )
+            fac_avlb = CFactorsAvlb(
+                factor_grp=cfg,
+                universe=self.proj_cfg.universe,
+                factors_by_instru_dir=self.proj_cfg.factors_by_instru_dir,
+                factors_avlb_raw_dir=self.proj_cfg.factors_avlb_raw_dir,
+                factors_avlb_sig_dir=self.proj_cfg.factors_avlb_sig_dir,
+                factors_avlb_ewa_dir=self.proj_cfg.factors_avlb_ewa_dir,
+                db_struct_avlb=self.db_struct_avlb,
+            )
+            self.timeit(f"factor/{fclass}/avlb", fac_avlb.main, self.factor_bgn_date, self.stp_date, self.calendar)
+
+    def run_qtests(self, test_type: str):
+        from solutions.qtests import main_qtests
+
+        tests_dir, factors_avlb_dir, rets = {
+            "ic": (self.proj_cfg.ic_tests_dir, self.proj_cfg.factors_avlb_raw_dir, self.proj_cfg.ic_rets),
+            "vt": (self.proj_cfg.vt_tests_dir, self.proj_cfg.factors_avlb_ewa_dir, self.proj_cfg.vt_rets),
+        }[test_type]
+        for fclass in self.cfg_factors.classes:
+            self.timeit(
+                f"{test_type}/{fclass}",
+                main_qtests,
+                rets=rets,
+                factor_grp=self.cfg_factors.get_cfg(fclass),
+                aux_args_list=[(factors_avlb_dir, self.proj_cfg.test_returns_avlb_raw_dir)],
+                tests_dir=tests_dir,
+                universe=self.proj_cfg.universe,
+                bgn_date=self.qtest_bgn_date,
+                stp_date=self.calendar.get_next_date(self.stp_date, shift=-10),
+                calendar=self.calendar,
+                test_type=test_type,
+                call_multiprocess=self.call_multiprocess,
+                cost_rate=self.proj_cfg.const.COST_RATE_VT,
+            )
+
+    def main(self, stages: list[str], has_mkt_idx: bool):
+        runners = {
+            "avlb": self.run_avlb,
+            "mkt": self.run_mkt,
+            "css": self.run_css,
+            "icov": self.run_icov,
+            "test_return": self.run_test_return,
+            "factor": self.run_factor,
+            "ic": lambda: self.run_qtests("ic"),
+            "vt": lambda: self.run_qtests("vt"),
+        }
+        for stage in stages:
+            if stage in ("mkt", "css") and not has_mkt_idx:
+                print(f"{stage:<32s} {'skipped, no excel writer to generate market index':>10s}")
+                continue
+            runners[stage]()
+        return 0
+
+
+if __name__ == "__main__":
+    define_logger()
+    args = parse_args()
+    cfg_syn = CCfgSynthetic(n_instrus=args.instrus, n_days=args.days, n_minutes=args.minutes, seed=args.seed)
+    config = load_config()
+    proj_cfg = gen_proj_cfg(args.root, universe=gen_universe(cfg_syn.n_instrus), config=config)
+    db_struct_preprocess = CDbStruct(
+        db_save_dir=proj_cfg.by_instru_pre_dir,
+        db_name="preprocess.db",  # each instrument is saved to its own db by copy_to_another
+        table=get_preprocess_table(args.db_struct),
+    )
+    db_struct_minute_bar = CDbStruct(
+        db_save_dir=proj_cfg.by_instru_min_dir,
+        db_name="minute_bar.db",
+        table=get_minute_bar_table(args.db_struct),
+    )
+
+    # --- synthetic data
+    if args.reuse:
+        has_mkt_idx = os.path.exists(proj_cfg.market_index_path)
+    else:
+        shutil.rmtree(args.root, ignore_errors=True)
+        t0 = time.perf_counter()
+        _, has_mkt_idx = gen_synthetic_data(
+            cfg=cfg_syn,
+            calendar_path=proj_cfg.calendar_path,
+            db_struct_preprocess=db_struct_preprocess,
+            db_struct_minute_bar=db_struct_minute_bar,
+            market_index_path=proj_cfg.market_index_path,
+            mkt_idxes=proj_cfg.mkt.idxes,
+        )
+        print(f"{'synthetic data generated':<32s} {time.perf_counter() - t0:>10.3f} s")
+
+    # --- outputs of last benchmark are always removed, since most stages only append
+    shutil.rmtree(proj_cfg.project_root_dir, ignore_errors=True)
+    os.makedirs(proj_cfg.project_root_dir)
+    calendar = CCalendar(proj_cfg.calendar_path)
+    trade_dates = calendar.get_iter_list(cfg_syn.bgn_date, calendar.get_next_date(cfg_syn.bgn_date, cfg_syn.n_days))
+    bgn_date = calendar.get_next_date(cfg_syn.bgn_date, shift=proj_cfg.avlb_unvrs.buffer_win)
+    stp_date = trade_dates[-1]
+
+    commit = get_commit()
+    run_id = enable_perf(os.path.join(args.root, "perf"), prefix=f"{commit}-")
+    benchmark = CBenchmark(
+        proj_cfg=proj_cfg,
+        cfg_factors=CCfgFactors(FACTOR_ALGS_DIR, config["factors"], config["factor_decay_default"]),
+        db_struct_preprocess=db_struct_preprocess,
+        db_struct_minute_bar=db_struct_minute_bar,
+        calendar=calendar,
+        bgn_date=bgn_date,
+        stp_date=stp_date,
+        call_multiprocess=args.mp,
+    )
+    stages = args.stages or ["avlb", "mkt", "css", "icov", "test_return", "factor", "ic", "vt"]
+    benchmark.main(stages=stages, has_mkt_idx=has_mkt_idx)
+
+    # --- save results
+    steps = summarize_perf(os.path.join(args.root, "perf"), run_id)
+    results = {
+        "commit": commit,
+        "time": dt.datetime.now().isoformat(),
+        "synthetic": asdict(cfg_syn),
+        "call_multiprocess": args.mp,
+        "stages": benchmark.timings,
+        "steps": {f"{stage}/{step}": row["wall"] for (stage, step), row in steps.iterrows()},
+    }
+    os.makedirs(results_dir := os.path.join(args.root, "results"), exist_ok=True)
+    results_path = os.path.join(results_dir, f"{commit}-{args.instrus}x{args.days}x{args.minutes}.json")
+    with open(results_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"results saved to {results_path}")
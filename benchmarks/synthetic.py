@@ -0,0 +1,221 @@
+"""
+Synthetic futures data for benchmarks.
+
+Shards are written with the same CDbStruct / CSqlTable machinery as the real data, so
+the stages under test read them exactly as they read production data. If the real
+db_struct.yaml is given, its preprocess and fMinuteBar tables are used, and columns
+unknown to this generator are left as NULL.
+"""
+
+import os
+import yaml
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+from husfort.qsqlite import CDbStruct, CSqlTable, CSqlVar, CMgrSqlDb
+from husfort.qutility import check_and_makedirs
+from typedefs.typedef_instrus import TUniverse, TInstruName, CCfgInstru
+
+SECTORS: list[tuple[str, str]] = [
+    ("C", "AUG"),
+    ("C", "MTL"),
+    ("C", "OIL"),
+    ("C", "CHM"),
+    ("C", "BLK"),
+    ("C", "AGR"),
+]
+
+
+@dataclass(frozen=True)
+class CCfgSynthetic:
+    n_instrus: int
+    n_days: int
+    n_minutes: int  # minutes per day
+    bgn_date: str = "20120104"
+    seed: int = 0
+
+    @property
+    def buffer_days(self) -> int:
+        # calendar must extend beyond data, because stages look forward for stop dates and test returns
+        return 30
+
+
+def gen_universe(n_instrus: int) -> TUniverse:
+    universe: TUniverse = {}
+    for i in range(n_instrus):
+        sector0, sector1 = SECTORS[i % len(SECTORS)]
+        universe[TInstruName(f"S{i:02d}.SHF")] = CCfgInstru(sectorL0=sector0, sectorL1=sector1)
+    return universe
+
+
+def gen_calendar(cfg: CCfgSynthetic) -> list[str]:
+    dates = pd.bdate_range(start=cfg.bgn_date, periods=cfg.n_days + cfg.buffer_days)
+    return [d.strftime("%Y%m%d") for d in dates]
+
+
+def save_calendar(trade_dates: list[str], calendar_path: str):
+    check_and_makedirs(os.path.dirname(calendar_path))
+    pd.DataFrame({"trade_date": trade_dates}).to_csv(calendar_path, index=False)
+    return 0
+
+
+def get_preprocess_table(db_struct_path: str | None = None) -> CSqlTable:
+    if db_struct_path is not None:
+        with open(db_struct_path, "r") as f:
+            return CSqlTable(cfg=yaml.safe_load(f)["preprocess"]["table"])
+    return CSqlTable(
+        name="preprocess",
+        primary_keys=[CSqlVar("trade_date", "TEXT")],
+        value_columns=[
+            CSqlVar("ticker_major", "TEXT"),
+            CSqlVar("closeI", "REAL"),
+            CSqlVar("oi_major", "REAL"),
+            CSqlVar("vol_major", "REAL"),
+            CSqlVar("amount_major", "REAL"),
+            CSqlVar("return_c_major", "REAL"),
+            CSqlVar("return_o_major", "REAL"),
+            CSqlVar("basis_rate", "REAL"),
+        ],
+    )
+
+
+def get_minute_bar_table(db_struct_path: str | None = None) -> CSqlTable:
+    if db_struct_path is not None:
+        with open(db_struct_path, "r") as f:
+            return CSqlTable(cfg=yaml.safe_load(f)["fMinuteBar"]["table"])
+    return CSqlTable(
+        name="fMinuteBar",
+        primary_keys=[CSqlVar("trade_date", "TEXT"), CSqlVar("timestamp", "INTEGER")],
+        value_columns=[
+            CSqlVar("ticker", "TEXT"),
+            CSqlVar("close", "REAL"),
+            CSqlVar("pre_close", "REAL"),
+            CSqlVar("oi", "REAL"),
+            CSqlVar("vol", "REAL"),
+        ],
+    )
+
+
+def fit_table(data: pd.DataFrame, table: CSqlTable) -> pd.DataFrame:
+    """
+
+    :param data: synthetic data
+    :param table:
+    :return: data with exactly the columns of table, columns not generated are filled with None
+    """
+    res = data.reindex(columns=table.vars.names)
+    return res.astype(object).where(res.notna(), None)
+
+
+def gen_preprocess_by_instru(
+    instru: str, trade_dates: list[str], rng: np.random.Generator, listed_offset: int = 0
+) -> pd.DataFrame:
+    n = len(trade_dates) - listed_offset
+    ret_c = rng.normal(0, 0.015, n)
+    ret_o = ret_c + rng.normal(0, 0.003, n)
+    close = 3000 * np.exp(np.cumsum(ret_c))
+    basis = np.zeros(n)
+    for t in range(1, n):  # AR(1), persistent as real basis is
+        basis[t] = 0.97 * basis[t - 1] + rng.normal(0, 0.004)
+    amount = np.exp(rng.normal(13, 1.2, n))  # a few days below amount_threshold
+    dates = trade_dates[listed_offset:]
+    return pd.DataFrame(
+        {
+            "trade_date": dates,
+            "ticker_major": [f"{instru.split('.')[0]}{d[2:4]}{(int(d[4:6]) - 1) // 3 * 3 + 1:02d}" for d in dates],
+            "closeI": close,
+            "oi_major": np.exp(rng.normal(11, 0.3, n)),
+            "vol_major": np.exp(rng.normal(10, 0.5, n)),
+            "amount_major": amount,
+            "return_c_major": ret_c,
+            "return_o_major": ret_o,
+            "basis_rate": basis,
+        }
+    )
+
+
+def gen_minute_bar_by_instru(preprocess: pd.DataFrame, n_minutes: int, rng: np.random.Generator) -> pd.DataFrame:
+    n_days = len(preprocess)
+    n = n_days * n_minutes
+    # minute returns sum up roughly to daily return
+    ret = rng.normal(0, 1, (n_days, n_minutes)) * 0.015 / np.sqrt(n_minutes)
+    close = preprocess["closeI"].to_numpy()[:, None] * np.exp(np.cumsum(ret, axis=1) - ret.sum(axis=1, keepdims=True))
+    pre_close = np.concatenate([close[:, :1] * np.exp(-ret[:, :1]), close[:, :-1]], axis=1)
+    oi = preprocess["oi_major"].to_numpy()[:, None] + np.cumsum(rng.normal(0, 50, (n_days, n_minutes)), axis=1)
+    vol = np.abs(rng.normal(0, 1, (n_days, n_minutes))) * preprocess["vol_major"].to_numpy()[:, None] / n_minutes
+    minutes = np.arange(n_minutes)
+    return pd.DataFrame(
+        {
+            "trade_date": np.repeat(preprocess["trade_date"].to_numpy(), n_minutes),
+            "timestamp": (np.repeat(preprocess["trade_date"].astype(np.int64).to_numpy(), n_minutes) * 10000
+                          + np.tile(900 + minutes // 60 * 100 + minutes % 60, n_days)),
+            "ticker": np.repeat(preprocess["ticker_major"].to_numpy(), n_minutes),
+            "close": close.reshape(n),
+            "pre_close": pre_close.reshape(n),
+            "oi": oi.reshape(n),
+            "vol": vol.reshape(n),
+        }
+    )
+
+
+def save_shard(data: pd.DataFrame, db_struct: CDbStruct):
+    check_and_makedirs(db_struct.db_save_dir)
+    sqldb = CMgrSqlDb(
+        db_save_dir=db_struct.db_save_dir,
+        db_name=db_struct.db_name,
+        table=db_struct.table,
+        mode="a",
+    )
+    sqldb.update(update_data=fit_table(data, db_struct.table))
+    return 0
+
+
+def gen_market_index(trade_dates: list[str], mkt_idxes: list[str], path: str, rng: np.random.Generator) -> bool:
+    """
+    Market index is read from a xlsx file with one sheet for each index, header at the second row.
+
+    :return: False if no excel writer is installed, then stages depending on it should be skipped
+    """
+    try:
+        import openpyxl  # noqa: F401
+    except ImportError:
+        return False
+    check_and_makedirs(os.path.dirname(path))
+    with pd.ExcelWriter(path) as writer:
+        for mkt_idx in mkt_idxes:
+            df = pd.DataFrame(
+                {
+                    "Date": pd.to_datetime(trade_dates, format="%Y%m%d"),
+                    "pct_chg": rng.normal(0, 1.2, len(trade_dates)),
+                }
+            )
+            df.to_excel(writer, sheet_name=mkt_idx, index=False, startrow=1)
+    return True
+
+
+def gen_synthetic_data(
+    cfg: CCfgSynthetic,
+    calendar_path: str,
+    db_struct_preprocess: CDbStruct,
+    db_struct_minute_bar: CDbStruct,
+    market_index_path: str,
+    mkt_idxes: list[str],
+) -> tuple[TUniverse, bool]:
+    """
+
+    :return: universe, and whether market index is generated
+    """
+    rng = np.random.default_rng(cfg.seed)
+    universe = gen_universe(cfg.n_instrus)
+    trade_dates = gen_calendar(cfg)
+    save_calendar(trade_dates, calendar_path)
+    data_dates = trade_dates[: cfg.n_days]
+    for i, instru in enumerate(universe):
+        # some instruments are listed later, like real ones
+        listed_offset = 0 if i % 4 else min(cfg.n_days // 4, 120)
+        preprocess = gen_preprocess_by_instru(instru, data_dates, rng, listed_offset=listed_offset)
+        save_shard(preprocess, db_struct_preprocess.copy_to_another(another_db_name=f"{instru}.db"))
+        minute_bar = gen_minute_bar_by_instru(preprocess, cfg.n_minutes, rng)
+        save_shard(minute_bar, db_struct_minute_bar.copy_to_another(another_db_name=f"{instru}.db"))
+    has_mkt_idx = gen_market_index(data_dates, mkt_idxes, market_index_path, rng)
+    return universe, has_mkt_idx
@@ -1,100 +1,164 @@
+"""
+Project configuration, built lazily: nothing is parsed at import.
+
+Access the objects as attributes, like 'from config import proj_cfg', or via the getters below.
+Each of them is built at the first access and cached for the process.
+"""
+
 import yaml
-from husfort.qutility import check_and_mkdir
-from husfort.qsqlite import CDbStruct, CSqlTable
-from typedefs.typedef_instrus import TUniverse, TInstruName, CCfgInstru, CCfgAvlbUnvrs
-from typedefs.typedef_css import CCfgCss, CCfgICov, CCfgMkt
-from typedefs.typedef_returns import CCfgTst
-from typedef import CCfgProj, CCfgDbStruct, CCfgConst
-from solutions.factor import CCfgFactors
+from functools import cache
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typedefs.typedef_instrus import TUniverse
+    from typedef import CCfgProj, CCfgDbStruct
+    from solutions.factor_registry import CCfgFactors
+
+CONFIG_PATH = "config.yaml"
+FACTOR_ALGS_DIR = "factor_algs_activated"
+
 
 # ---------- project configuration ----------
 
-with open("config.yaml", "r") as f:
-    _config = yaml.safe_load(f)
-
-universe = TUniverse({TInstruName(k): CCfgInstru(**v) for k, v in _config["universe"].items()})
-
-proj_cfg = CCfgProj(
-    # --- shared data path
-    calendar_path=_config["path"]["calendar_path"],
-    root_dir=_config["path"]["root_dir"],
-    db_struct_path=_config["path"]["db_struct_path"],
-    alternative_dir=_config["path"]["alternative_dir"],
-    market_index_path=_config["path"]["market_index_path"],
-    by_instru_pos_dir=_config["path"]["by_instru_pos_dir"],
-    by_instru_pre_dir=_config["path"]["by_instru_pre_dir"],
-    by_instru_min_dir=_config["path"]["by_instru_min_dir"],
-    instru_info_path=_config["path"]["instru_info_path"],
-    # --- project data root dir
-    project_root_dir=_config["path"]["project_root_dir"],
-    # --- global settings
-    universe=universe,
-    avlb_unvrs=CCfgAvlbUnvrs(**_config["available"]),
-    css=CCfgCss(**_config["css"]),
-    icov=CCfgICov(**_config["icov"]),
-    mkt=CCfgMkt(**_config["mkt"]),
-    const=CCfgConst(**_config["CONST"]),
-    tst=CCfgTst(**_config["tst"]),
-)
-
-check_and_mkdir(proj_cfg.project_root_dir)
+
+@cache
+def load_config() -> dict:
+    with open(CONFIG_PATH, "r") as f:
+        return yaml.safe_load(f)
+
+
+@cache
+def get_universe() -> "TUniverse":
+    from typedefs.typedef_instrus import TUniverse, TInstruName, CCfgInstru
+
+    _config = load_config()
+    return TUniverse({TInstruName(k): CCfgInstru(**v) for k, v in _config["universe"].items()})
+
+
+@cache
+def get_proj_cfg() -> "CCfgProj":
+    from husfort.qutility import check_and_mkdir
+    from typedefs.typedef_instrus import CCfgAvlbUnvrs
+    from typedefs.typedef_css import CCfgCss, CCfgICov, CCfgMkt
+    from typedefs.typedef_returns import CCfgTst
+    from typedefs.typedef_factors import CCfgScreen
+    from typedef import CCfgProj, CCfgConst, CCfgLoaders, CCfgSqliteRead
+
+    _config = load_config()
+    proj_cfg = CCfgProj(
+        # --- shared data path
+        calendar_path=_config["path"]["calendar_path"],
+        root_dir=_config["path"]["root_dir"],
+        db_struct_path=_config["path"]["db_struct_path"],
+        alternative_dir=_config["path"]["alternative_dir"],
+        market_index_path=_config["path"]["market_index_path"],
+        by_instru_pos_dir=_config["path"]["by_instru_pos_dir"],
+        by_instru_pre_dir=_config["path"]["by_instru_pre_dir"],
+        by_instru_min_dir=_config["path"]["by_instru_min_dir"],
+        instru_info_path=_config["path"]["instru_info_path"],
+        # --- project data root dir
+        project_root_dir=_config["path"]["project_root_dir"],
+        # --- global settings
+        universe=get_universe(),
+        avlb_unvrs=CCfgAvlbUnvrs(**_config["available"]),
+        css=CCfgCss(**_config["css"]),
+        icov=CCfgICov(**_config["icov"]),
+        mkt=CCfgMkt(**_config["mkt"]),
+        const=CCfgConst(**_config["CONST"]),
+        tst=CCfgTst(**_config["tst"]),
+        trade_date_dtype=_config["db_schema"]["trade_date"],
+        by_instru_layout=_config["db_schema"]["by_instru_layout"],
+        screen=CCfgScreen(**_config["screen"]) if "screen" in _config else None,
+        loaders=CCfgLoaders(**_config["loaders"]),
+        sqlite_read=CCfgSqliteRead(**_config["sqlite_read"]),
+    )
+    check_and_mkdir(proj_cfg.project_root_dir)
+    return proj_cfg
+
 
 # --- factors ---
-cfg_factors = CCfgFactors(
-    algs_dir="factor_algs_activated",
-    cfg_data=_config["factors"],
-    factor_decay_default=_config["factor_decay_default"],
-)
+@cache
+def get_cfg_factors() -> "CCfgFactors":
+    from solutions.factor_registry import CCfgFactors
+
+    _config = load_config()
+    return CCfgFactors(
+        algs_dir=FACTOR_ALGS_DIR,
+        cfg_data=_config["factors"],
+        factor_decay_default=_config["factor_decay_default"],
+    )
+
 
 # ---------- databases structure ----------
-with open(proj_cfg.db_struct_path, "r") as f:
-    _db_struct = yaml.safe_load(f)
-
-db_struct_cfg = CCfgDbStruct(
-    macro=CDbStruct(
-        db_save_dir=proj_cfg.alternative_dir,
-        db_name=_db_struct["macro"]["db_name"],
-        table=CSqlTable(cfg=_db_struct["macro"]["table"]),
-    ),
-    forex=CDbStruct(
-        db_save_dir=proj_cfg.alternative_dir,
-        db_name=_db_struct["forex"]["db_name"],
-        table=CSqlTable(cfg=_db_struct["forex"]["table"]),
-    ),
-    fmd=CDbStruct(
-        db_save_dir=proj_cfg.root_dir,
-        db_name=_db_struct["fmd"]["db_name"],
-        table=CSqlTable(cfg=_db_struct["fmd"]["table"]),
-    ),
-    position=CDbStruct(
-        db_save_dir=proj_cfg.by_instru_pos_dir,
-        db_name=_db_struct["position"]["db_name"],
-        table=CSqlTable(cfg=_db_struct["position"]["table"]),
-    ),
-    basis=CDbStruct(
-        db_save_dir=proj_cfg.root_dir,
-        db_name=_db_struct["basis"]["db_name"],
-        table=CSqlTable(cfg=_db_struct["basis"]["table"]),
-    ),
-    stock=CDbStruct(
-        db_save_dir=proj_cfg.root_dir,
-        db_name=_db_struct["stock"]["db_name"],
-        table=CSqlTable(cfg=_db_struct["stock"]["table"]),
-    ),
-    preprocess=CDbStruct(
-        db_save_dir=proj_cfg.by_instru_pre_dir,
-        db_name=_db_struct["preprocess"]["db_name"],
-        table=CSqlTable(cfg=_db_struct["preprocess"]["table"]),
-    ),
-    minute_bar=CDbStruct(
-        db_save_dir=proj_cfg.by_instru_min_dir,
-        db_name=_db_struct["fMinuteBar"]["db_name"],
-        table=CSqlTable(cfg=_db_struct["fMinuteBar"]["table"]),
-    ),
-)
+@cache
+def get_db_struct_cfg() -> "CCfgDbStruct":
+    from husfort.qsqlite import CDbStruct, CSqlTable
+    from typedef import CCfgDbStruct
+
+    proj_cfg = get_proj_cfg()
+    with open(proj_cfg.db_struct_path, "r") as f:
+        _db_struct = yaml.safe_load(f)
+
+    return CCfgDbStruct(
+        macro=CDbStruct(
+            db_save_dir=proj_cfg.alternative_dir,
+            db_name=_db_struct["macro"]["db_name"],
+            table=CSqlTable(cfg=_db_struct["macro"]["table"]),
+        ),
+        forex=CDbStruct(
+            db_save_dir=proj_cfg.alternative_dir,
+            db_name=_db_struct["forex"]["db_name"],
+            table=CSqlTable(cfg=_db_struct["forex"]["table"]),
+        ),
+        fmd=CDbStruct(
+            db_save_dir=proj_cfg.root_dir,
+            db_name=_db_struct["fmd"]["db_name"],
+            table=CSqlTable(cfg=_db_struct["fmd"]["table"]),
+        ),
+        position=CDbStruct(
+            db_save_dir=proj_cfg.by_instru_pos_dir,
+            db_name=_db_struct["position"]["db_name"],
+            table=CSqlTable(cfg=_db_struct["position"]["table"]),
+        ),
+        basis=CDbStruct(
+            db_save_dir=proj_cfg.root_dir,
+            db_name=_db_struct["basis"]["db_name"],
+            table=CSqlTable(cfg=_db_struct["basis"]["table"]),
+        ),
+        stock=CDbStruct(
+            db_save_dir=proj_cfg.root_dir,
+            db_name=_db_struct["stock"]["db_name"],
+            table=CSqlTable(cfg=_db_struct["stock"]["table"]),
+        ),
+        preprocess=CDbStruct(
+            db_save_dir=proj_cfg.by_instru_pre_dir,
+            db_name=_db_struct["preprocess"]["db_name"],
+            table=CSqlTable(cfg=_db_struct["preprocess"]["table"]),
+        ),
+        minute_bar=CDbStruct(
+            db_save_dir=proj_cfg.by_instru_min_dir,
+            db_name=_db_struct["fMinuteBar"]["db_name"],
+            table=CSqlTable(cfg=_db_struct["fMinuteBar"]["table"]),
+        ),
+    )
+
+
+_LAZY_ATTRS = {
+    "universe": get_universe,
+    "proj_cfg": get_proj_cfg,
+    "cfg_factors": get_cfg_factors,
+    "db_struct_cfg": get_db_struct_cfg,
+}
+
+
+def __getattr__(name: str):
+    if name in _LAZY_ATTRS:
+        return _LAZY_ATTRS[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == "__main__":
     print("--- Project Configuration ---")
-    print(proj_cfg)
+    print(get_proj_cfg())
     print("--- Factors ---")
-    print(cfg_factors)
+    print(get_cfg_factors())
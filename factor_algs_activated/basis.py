@@ -2,8 +2,8 @@ import numpy as np
 import pandas as pd
 from husfort.qcalendar import CCalendar
 from typedefs.typedef_factors import CCfgFactorGrpWin, TFactorNames, TFactorName
-from solutions.factor import CFactorsByInstru
-from math_tools.rolling import cal_rolling_beta
+from solutions.factor import CFactorsPanel
+from math_tools.rolling import cal_rolling_multi_wins
 
 
 class CCfgFactorGrpBASIS(CCfgFactorGrpWin):
@@ -22,35 +22,43 @@ class CCfgFactorGrpBASIS(CCfgFactorGrpWin):
         return self.names_vanilla + self.names_res + self.names_diff
 
 
-class CFactorBASIS(CFactorsByInstru):
+class CFactorBASIS(CFactorsPanel):
+    inputs = {
+        "preprocess": ["ticker_major", "basis_rate", "return_c_major"],
+    }
+
     def __init__(self, factor_grp: CCfgFactorGrpBASIS, **kwargs):
         if not isinstance(factor_grp, CCfgFactorGrpBASIS):
             raise TypeError("factor_grp must be CCfgFactorGrpBASIS")
         super().__init__(factor_grp=factor_grp, **kwargs)
         self.cfg = factor_grp
 
-    def cal_factor_by_instru(self, instru: str, bgn_date: str, stp_date: str, calendar: CCalendar) -> pd.DataFrame:
-        buffer_bgn_date = self.cfg.buffer_bgn_date(bgn_date, calendar)
-        x, y = "basis_rate", "return_c_major"
-        adj_data = self.load_preprocess(
-            instru,
-            bgn_date=buffer_bgn_date,
-            stp_date=stp_date,
-            values=["trade_date", "ticker_major", x, y],
+    def cal_factor_panel(
+        self,
+        panel: dict[str, pd.DataFrame],
+        bgn_date: str,
+        stp_date: str,
+        calendar: CCalendar,
+    ) -> dict[TFactorName, pd.DataFrame]:
+        x = panel["basis_rate"].astype(np.float64)
+        y = panel["return_c_major"].astype(np.float64)
+        stats = cal_rolling_multi_wins(
+            x,
+            wins=self.cfg.args.wins,
+            y=y,
+            min_periods={win: int(2 * win / 3) for win in self.cfg.args.wins},
+            present=self.get_present(panel),
         )
+        res: dict[TFactorName, pd.DataFrame] = {}
         for win, name_vanilla, name_res in zip(self.cfg.args.wins, self.cfg.names_vanilla, self.cfg.names_res):
-            adj_data[name_vanilla] = adj_data[x].rolling(window=win, min_periods=int(2 * win / 3)).mean()
-            beta = cal_rolling_beta(df=adj_data, x=x, y=y, rolling_window=win)
-            adj_data[name_res] = adj_data[y] - adj_data[x] * beta
+            res[name_vanilla] = stats["mean"][win]
+            res[name_res] = y - x * stats["beta"][win]
 
-        w0, w1 = self.cfg.args.wins
+        w0, w1 = self.cfg.args.wins[:2]
         n0, n1 = self.cfg.name_vanilla(w0), self.cfg.name_vanilla(w1)
-        adj_data[self.cfg.name_diff()] = adj_data[n0] * np.sqrt(w0 / w1) - adj_data[n1]
+        res[self.cfg.name_diff()] = res[n0] * np.sqrt(w0 / w1) - res[n1]
 
-        w0, w1 = self.cfg.args.wins
+        w0, w1 = self.cfg.args.wins[:2]
         n0, n1 = self.cfg.name_res(w0), self.cfg.name_res(w1)
-        adj_data[self.cfg.name_diff2()] = adj_data[n0] * np.sqrt(w0 / w1) - adj_data[n1]
-
-        self.rename_ticker(adj_data)
-        factor_data = self.get_factor_data(adj_data, bgn_date)
-        return factor_data
+        res[self.cfg.name_diff2()] = res[n0] * np.sqrt(w0 / w1) - res[n1]
+        return res
@@ -8,6 +8,7 @@ from husfort.qcalendar import CCalendar
 from typedefs.typedef_factors import CCfgFactorGrpWin, TFactorNames
 from solutions.factor import CFactorsByInstru
 from math_tools.robust import robust_ret_alg, robust_div
+from math_tools.rolling import cal_rolling_multi_wins
 
 
 class CCfgFactorGrpREOC(CCfgFactorGrpWin):
@@ -20,6 +21,11 @@ class CCfgFactorGrpREOC(CCfgFactorGrpWin):
 
 
 class CFactorREOC(CFactorsByInstru):
+    inputs = {
+        "preprocess": ["ticker_major", "closeI", "oi_major", "vol_major"],
+        "minute_bar": ["close", "pre_close", "oi", "vol"],
+    }
+
     def __init__(self, factor_grp: CCfgFactorGrpREOC, **kwargs):
         if not isinstance(factor_grp, CCfgFactorGrpREOC):
             raise TypeError("factor_grp must be CCfgFactorGrpREOC")
@@ -37,23 +43,24 @@ class CFactorREOC(CFactorsByInstru):
         else:
             return 0.0
 
-    def cal_factor_by_instru(self, instru: str, bgn_date: str, stp_date: str, calendar: CCalendar) -> pd.DataFrame:
-        buffer_bgn_date = self.cfg.buffer_bgn_date(bgn_date, calendar)
-        maj_data = self.load_preprocess(
-            instru,
-            bgn_date=buffer_bgn_date,
-            stp_date=stp_date,
-            values=["trade_date", "ticker_major", "closeI", "oi_major", "vol_major"],
-        )
-        maj_data = maj_data.set_index("trade_date")
-        minb_data = self.load_minute_bar(instru, bgn_date=buffer_bgn_date, stp_date=stp_date)
+    def cal_factor_from_inputs(
+        self,
+        instru: str,
+        inputs: dict[str, pd.DataFrame],
+        bgn_date: str,
+        stp_date: str,
+        calendar: CCalendar,
+    ) -> pd.DataFrame:
+        maj_data = inputs["preprocess"].set_index("trade_date")
+        minb_data = inputs["minute_bar"]
         minb_data["simple"] = robust_ret_alg(minb_data["close"], minb_data["pre_close"], scale=1e4)
         minb_data["doi"] = minb_data["oi"].diff().abs()
         minb_data["eff"] = robust_div(minb_data["doi"], minb_data["vol"], nan_val=0)
         reoc = minb_data.groupby(by="trade_date").apply(self.cal_reoc)
+        stats = cal_rolling_multi_wins(reoc, wins=self.cfg.args.wins)
         for win, name_vanilla, name_vol in zip(self.cfg.args.wins, self.cfg.names_vanilla, self.cfg.names_vol):
-            maj_data[name_vanilla] = reoc.rolling(win).sum()
-            maj_data[name_vol] = reoc.rolling(win).std()
+            maj_data[name_vanilla] = stats["sum"][win]
+            maj_data[name_vol] = stats["std"][win]
         w0, w1 = 240, 3
         n0, n1 = self.cfg.name_vanilla(w0), self.cfg.name_vanilla(w1)
         maj_data[self.cfg.name_diff()] = maj_data[n0] * np.sqrt(w1 / w0) - maj_data[n1]
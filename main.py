@@ -1,12 +1,12 @@
 import argparse
-from solutions.factor import CCfgFactors
+from solutions.startup import SWITCH_REQUIREMENTS
 
 
-def parse_args(cfg_facs: CCfgFactors):
+def parse_args(factor_classes: list[str]):
     arg_parser = argparse.ArgumentParser(
         description="This project is designed to do a CTA strategy research and backtesting."
     )
-    arg_parser.add_argument("--bgn", type=str, help="begin date, format = [YYYYMMDD]", required=True)
+    arg_parser.add_argument("--bgn", type=str, help="begin date, format = [YYYYMMDD], required except for 'startup'")
     arg_parser.add_argument("--stp", type=str, help="stop  date, format = [YYYYMMDD]")
     arg_parser.add_argument(
         "--nomp",
@@ -23,6 +23,13 @@ def parse_args(cfg_facs: CCfgFactors):
         action="store_true",
         help="whether to print more details, effective only when sub function = (feature_selection,)",
     )
+    arg_parser.add_argument(
+        "--perf",
+        default=False,
+        action="store_true",
+        help="record time, memory and rows of each step to json lines in project_root_dir/perf, "
+        "and print a summary at the end",
+    )
 
     arg_parser_subs = arg_parser.add_subparsers(
         title="Position argument to call sub functions",
@@ -32,6 +39,13 @@ def parse_args(cfg_facs: CCfgFactors):
         required=True,
     )
 
+    # switch: panel
+    arg_parser_subs.add_parser(
+        name="panel",
+        help="Build memory-mapped panels from preprocess shards, which are then used by other switches. "
+        "Run it after shards are updated, before other switches",
+    )
+
     # switch: available
     arg_parser_subs.add_parser(name="avlb", help="Calculate available universe")
 
@@ -54,7 +68,13 @@ def parse_args(cfg_facs: CCfgFactors):
         type=str,
         help="factor class to run",
         required=True,
-        choices=cfg_facs.classes,
+        choices=factor_classes,
+    )
+    arg_parser_sub.add_argument(
+        "--noshards",
+        default=False,
+        action="store_true",
+        help="not saving by-instrument databases, results are passed to available factors directly",
     )
 
     # switch: ic
@@ -64,7 +84,13 @@ def parse_args(cfg_facs: CCfgFactors):
         type=str,
         help="factor class to test",
         required=True,
-        choices=cfg_facs.classes,
+        choices=factor_classes,
+    )
+    arg_parser_sub.add_argument(
+        "--nosummary",
+        default=False,
+        action="store_true",
+        help="not making reports and plots after calculation, run switch 'summary' later for all classes at once",
     )
 
     # switch: vt
@@ -74,22 +100,218 @@ def parse_args(cfg_facs: CCfgFactors):
         type=str,
         help="factor class to test",
         required=True,
-        choices=cfg_facs.classes,
+        choices=factor_classes,
+    )
+    arg_parser_sub.add_argument(
+        "--nosummary",
+        default=False,
+        action="store_true",
+        help="not making reports and plots after calculation, run switch 'summary' later for all classes at once",
+    )
+
+    # switch: summary
+    arg_parser_sub = arg_parser_subs.add_parser(name="summary", help="Make reports and plots of ic_tests or vt_tests")
+    arg_parser_sub.add_argument("--type", type=str, help="type of tests", required=True, choices=("ic", "vt"))
+    arg_parser_sub.add_argument(
+        "--fclass",
+        type=str,
+        nargs="*",
+        help="factor classes to summarize, default is all",
+        choices=factor_classes,
+    )
+
+    # switch: screen
+    arg_parser_sub = arg_parser_subs.add_parser(
+        name="screen", help="Screen variants of a factor class on the grid in config.yaml, without saving factors"
+    )
+    arg_parser_sub.add_argument(
+        "--fclass",
+        type=str,
+        help="factor class to screen",
+        required=True,
+        choices=factor_classes,
+    )
+
+    # switch: repair
+    arg_parser_sub = arg_parser_subs.add_parser(
+        name="repair",
+        help="Find dates missing in outputs between bgn and stp, then recompute and splice only them, "
+        "instead of removing and rebuilding all outputs",
+    )
+    arg_parser_sub.add_argument(
+        "--fclass",
+        type=str,
+        nargs="*",
+        help="factor classes to repair, with their by-instrument and available factors, ic_tests and vt_tests",
+        choices=factor_classes,
+    )
+    arg_parser_sub.add_argument(
+        "--icov",
+        default=False,
+        action="store_true",
+        help="repair covariance of instruments",
+    )
+
+    # switch: backfill
+    arg_parser_sub = arg_parser_subs.add_parser(
+        name="backfill",
+        help="Backfill an instrument newly added to universe, outputs of other instruments are recomputed "
+        "only on dates when it is available",
+    )
+    arg_parser_sub.add_argument("--instru", type=str, help="instrument added to universe, like 'AO.SHF'", required=True)
+    arg_parser_sub.add_argument(
+        "--fclass",
+        type=str,
+        nargs="*",
+        help="factor classes to backfill, with their available factors, ic_tests and vt_tests",
+        choices=factor_classes,
+    )
+    arg_parser_sub.add_argument(
+        "--nomarket",
+        default=False,
+        action="store_true",
+        help="not backfilling avlb, mkt, css, icov and test returns, which are backfilled by a former run",
+    )
+
+    # switch: update
+    arg_parser_sub = arg_parser_subs.add_parser(
+        name="update",
+        help="Update all stages from the last date of each output to the last date its sources allow. "
+        "'--bgn' is the begin date of outputs not built yet, '--stp' limits dates updated, default is no limit",
+    )
+    arg_parser_sub.add_argument(
+        "--fclass",
+        type=str,
+        nargs="*",
+        help="factor classes to update, with their available factors, ic_tests and vt_tests, default is all",
+        choices=factor_classes,
+    )
+    arg_parser_sub.add_argument(
+        "--dryrun",
+        default=False,
+        action="store_true",
+        help="only print tasks to be run, with last dates of outputs predicted",
+    )
+
+    # switch: startup
+    arg_parser_sub = arg_parser_subs.add_parser(
+        name="startup",
+        help="Report config build time and import time of modules for another switch, without running it. "
+        "For example: 'python main.py startup --target factor --fclass MTM', no '--bgn' is needed",
+    )
+    arg_parser_sub.add_argument(
+        "--target",
+        type=str,
+        help="switch to be profiled",
+        required=True,
+        choices=list(SWITCH_REQUIREMENTS),
+    )
+    arg_parser_sub.add_argument(
+        "--fclass",
+        type=str,
+        nargs="*",
+        help="factor classes registered by the target switch, for targets using factor classes",
+        choices=factor_classes,
     )
 
-    return arg_parser.parse_args()
+    args = arg_parser.parse_args()
+    if args.switch != "startup" and args.bgn is None:
+        arg_parser.error("the following arguments are required: --bgn")
+    return args
+
+
+def build_factor_stack(fclass: str, instru_mgr, db_struct_mkt, db_struct_avlb) -> tuple:
+    """
+
+    :param fclass: factor class, like "MTM"
+    :param instru_mgr: CInstruMgr
+    :param db_struct_mkt: db struct of market returns
+    :param db_struct_avlb: db struct of available universe
+    :return: (fac, fac_avlb, qtests), the by-instrument factor, its avlb stage and its ic and vt tests
+    """
+    from config import proj_cfg, db_struct_cfg, cfg_factors
+    from solutions.factor import CFactorsAvlb, pick_factor
+    from solutions.qtests import gen_qtests
+
+    cfg, fac = pick_factor(
+        fclass=fclass,
+        cfg_factors=cfg_factors,
+        factors_by_instru_dir=proj_cfg.factors_by_instru_dir,
+        universe=proj_cfg.universe,
+        preprocess=db_struct_cfg.preprocess,
+        minute_bar=db_struct_cfg.minute_bar,
+        db_struct_pos=db_struct_cfg.position,
+        db_struct_forex=db_struct_cfg.forex,
+        db_struct_macro=db_struct_cfg.macro,
+        db_struct_mkt=db_struct_mkt,
+        instru_mgr=instru_mgr,
+    )
+    fac_avlb = CFactorsAvlb(
+        factor_grp=cfg,
+        universe=proj_cfg.universe,
+        factors_by_instru_dir=proj_cfg.factors_by_instru_dir,
+        factors_avlb_raw_dir=proj_cfg.factors_avlb_raw_dir,
+        factors_avlb_sig_dir=proj_cfg.factors_avlb_sig_dir,
+        factors_avlb_ewa_dir=proj_cfg.factors_avlb_ewa_dir,
+        db_struct_avlb=db_struct_avlb,
+    )
+    qtests = []
+    for test_type, tests_dir, factors_avlb_dir, rets in [
+        ("ic", proj_cfg.ic_tests_dir, proj_cfg.factors_avlb_raw_dir, proj_cfg.ic_rets),
+        ("vt", proj_cfg.vt_tests_dir, proj_cfg.factors_avlb_ewa_dir, proj_cfg.vt_rets),
+    ]:
+        qtests += gen_qtests(
+            rets=rets,
+            factor_grp=cfg,
+            aux_args_list=[(factors_avlb_dir, proj_cfg.test_returns_avlb_raw_dir)],
+            tests_dir=tests_dir,
+            universe=proj_cfg.universe,
+            test_type=test_type,  # type:ignore
+            cost_rate=proj_cfg.const.COST_RATE_VT,
+        )
+    return fac, fac_avlb, qtests
 
 
 if __name__ == "__main__":
+    from config import FACTOR_ALGS_DIR
+    from solutions.factor_registry import discover_factor_classes
+
+    args = parse_args(factor_classes=discover_factor_classes(FACTOR_ALGS_DIR))
+    if args.switch == "startup":
+        from solutions.startup import profile_startup
+
+        print(profile_startup(switch=args.target, fclass=args.fclass))
+        raise SystemExit(0)
+
     from loguru import logger
-    from config import proj_cfg, db_struct_cfg, cfg_factors
+    from config import proj_cfg
     from husfort.qlog import define_logger
     from husfort.qcalendar import CCalendar
+    from solutions.db_generator import set_trade_date_dtype, set_by_instru_layout
     from solutions.db_generator import get_avlb_db, get_css_db, get_icov_db, get_market_db
+    from solutions.panel_store import set_panel_store_dir
+    from solutions.concurrency import set_loader_backend
+    from solutions.shared_inputs import enable_shared_cache
+    from solutions.db_io import set_sqlite_read
 
     define_logger()
+    set_trade_date_dtype(proj_cfg.trade_date_dtype)
+    set_by_instru_layout(proj_cfg.by_instru_layout)
+    set_panel_store_dir(proj_cfg.panel_store_dir)
+    set_loader_backend(proj_cfg.loaders.backend, proj_cfg.loaders.workers)  # type:ignore
+    if args.switch in ("factor", "repair", "backfill", "update"):
+        # only switches calculating factors by instrument read shared inputs in workers
+        enable_shared_cache()
+    set_sqlite_read(
+        immutable=proj_cfg.sqlite_read.immutable,
+        mmap_size_mb=proj_cfg.sqlite_read.mmap_size_mb,
+        cache_size_mb=proj_cfg.sqlite_read.cache_size_mb,
+    )
+    if args.perf:
+        from solutions.perf import enable_perf
+
+        perf_run_id = enable_perf(proj_cfg.perf_dir, prefix=f"{args.switch}-")
     calendar = CCalendar(proj_cfg.calendar_path)
-    args = parse_args(cfg_facs=cfg_factors)
     bgn_date, stp_date = args.bgn, args.stp or calendar.get_next_date(args.bgn, shift=1)
 
     # ---------- databases structure ----------
@@ -98,7 +320,20 @@ if __name__ == "__main__":
     db_struct_icov = get_icov_db(proj_cfg.icov_dir)
     db_struct_mkt = get_market_db(proj_cfg.mkt_dir, proj_cfg.sectors)
 
-    if args.switch == "avlb":
+    if args.switch == "panel":
+        from config import db_struct_cfg
+        from solutions.panel_store import build_panel_store
+
+        build_panel_store(
+            store_dir=proj_cfg.panel_store_dir,
+            db_struct_preprocess=db_struct_cfg.preprocess,
+            universe=proj_cfg.universe,
+            bgn_date=bgn_date,
+            stp_date=stp_date,
+            calendar=calendar,
+        )
+    elif args.switch == "avlb":
+        from config import db_struct_cfg
         from solutions.avlb import main_available
 
         main_available(
@@ -122,6 +357,7 @@ if __name__ == "__main__":
         )
         css.main(bgn_date=bgn_date, stp_date=stp_date, calendar=calendar)
     elif args.switch == "icov":
+        from config import db_struct_cfg
         from solutions.icov import CICOV
 
         icov = CICOV(
@@ -145,6 +381,7 @@ if __name__ == "__main__":
             sectors=proj_cfg.sectors,
         )
     elif args.switch == "test_return":
+        from config import db_struct_cfg
         from solutions.test_return import CTestReturnsByInstru, CTestReturnsAvlb
 
         for ret in proj_cfg.all_rets:
@@ -164,7 +401,8 @@ if __name__ == "__main__":
             )
             test_returns_avlb.main(bgn_date, stp_date, calendar)
     elif args.switch == "factor":
-        from solutions.factor import CFactorsAvlb, pick_factor
+        from config import db_struct_cfg, cfg_factors
+        from solutions.factor import CFactorsAvlb, CFactorsPanel, pick_factor
         from husfort.qinstruments import CInstruMgr
 
         instru_mgr = CInstruMgr(instru_info_path=proj_cfg.instru_info_path, key="tushareId")
@@ -181,13 +419,6 @@ if __name__ == "__main__":
             db_struct_mkt=db_struct_mkt,
             instru_mgr=instru_mgr,
         )
-        fac.main(
-            bgn_date=bgn_date,
-            stp_date=stp_date,
-            calendar=calendar,
-            call_multiprocess=not args.nomp,
-            processes=args.processes,
-        )
         fac_avlb = CFactorsAvlb(
             factor_grp=cfg,
             universe=proj_cfg.universe,
@@ -197,8 +428,27 @@ if __name__ == "__main__":
             factors_avlb_ewa_dir=proj_cfg.factors_avlb_ewa_dir,
             db_struct_avlb=db_struct_avlb,
         )
-        fac_avlb.main(bgn_date, stp_date, calendar)
+        if isinstance(fac, CFactorsPanel):
+            ref_fac_data = fac.main_panel(
+                bgn_date=bgn_date,
+                stp_date=stp_date,
+                calendar=calendar,
+                save_shards=not args.noshards,
+                ref_bgn_date=fac_avlb.get_ref_bgn_date(bgn_date, calendar),
+            )
+        else:
+            ref_fac_data = fac.main_handoff(
+                bgn_date=bgn_date,
+                stp_date=stp_date,
+                calendar=calendar,
+                call_multiprocess=not args.nomp,
+                processes=args.processes,
+                save_shards=not args.noshards,
+                ref_bgn_date=fac_avlb.get_ref_bgn_date(bgn_date, calendar),
+            )
+        fac_avlb.main(bgn_date, stp_date, calendar, ref_fac_data=ref_fac_data)
     elif args.switch in ("ic", "vt"):
+        from config import cfg_factors
         from solutions.qtests import main_qtests, TICTestAuxArgs
 
         factor_grp = cfg_factors.get_cfg(factor_class=args.fclass)
@@ -220,12 +470,243 @@ if __name__ == "__main__":
             factor_grp=factor_grp,
             aux_args_list=aux_args_list,
             tests_dir=tests_dir,
+            universe=proj_cfg.universe,
             bgn_date=bgn_date,
             stp_date=stp_date,
             calendar=calendar,
             test_type=args.switch,
             call_multiprocess=not args.nomp,
             cost_rate=proj_cfg.const.COST_RATE_VT,
+            summary=not args.nosummary,
+        )
+    elif args.switch == "summary":
+        from config import cfg_factors
+        from solutions.qtests import gen_qtests, main_qtests_summary
+
+        tests_dir, factors_avlb_dir, rets = {
+            "ic": (proj_cfg.ic_tests_dir, proj_cfg.factors_avlb_raw_dir, proj_cfg.ic_rets),
+            "vt": (proj_cfg.vt_tests_dir, proj_cfg.factors_avlb_ewa_dir, proj_cfg.vt_rets),
+        }[args.type]
+        tests = []
+        for fclass in args.fclass or cfg_factors.classes:
+            tests += gen_qtests(
+                rets=rets,
+                factor_grp=cfg_factors.get_cfg(factor_class=fclass),
+                aux_args_list=[(factors_avlb_dir, proj_cfg.test_returns_avlb_raw_dir)],
+                tests_dir=tests_dir,
+                universe=proj_cfg.universe,
+                test_type=args.type,
+                cost_rate=proj_cfg.const.COST_RATE_VT,
+            )
+        main_qtests_summary(tests, bgn_date, stp_date, call_multiprocess=not args.nomp)
+    elif args.switch == "screen":
+        # checked before factors and loaders are built
+        if proj_cfg.screen is None:
+            raise ValueError("screen is not set in config.yaml, add it with block_size, top_k and grids")
+        if args.fclass not in proj_cfg.screen.grids:
+            raise ValueError(f"No grid for {args.fclass} in screen of config.yaml, add it to screen.grids")
+
+        from config import db_struct_cfg, cfg_factors
+        from solutions.factor import pick_factor
+        from solutions.screen import CFactorScreener
+        from husfort.qinstruments import CInstruMgr
+
+        instru_mgr = CInstruMgr(instru_info_path=proj_cfg.instru_info_path, key="tushareId")
+        _, fac = pick_factor(
+            fclass=args.fclass,
+            cfg_factors=cfg_factors,
+            factors_by_instru_dir=proj_cfg.factors_by_instru_dir,
+            universe=proj_cfg.universe,
+            preprocess=db_struct_cfg.preprocess,
+            minute_bar=db_struct_cfg.minute_bar,
+            db_struct_pos=db_struct_cfg.position,
+            db_struct_forex=db_struct_cfg.forex,
+            db_struct_macro=db_struct_cfg.macro,
+            db_struct_mkt=db_struct_mkt,
+            instru_mgr=instru_mgr,
+        )
+        screener = CFactorScreener(
+            fac=fac,
+            cfg_screen=proj_cfg.screen,
+            universe=proj_cfg.universe,
+            db_struct_avlb=db_struct_avlb,
+            test_returns_avlb_raw_dir=proj_cfg.test_returns_avlb_raw_dir,
+            ic_rets=proj_cfg.ic_rets,
+            vt_rets=proj_cfg.vt_rets,
+            cost_rate=proj_cfg.const.COST_RATE_VT,
+            screen_dir=proj_cfg.screen_dir,
+        )
+        screener.main(bgn_date, stp_date, calendar)
+    elif args.switch == "repair":
+        from config import db_struct_cfg
+        from solutions.icov import CICOV
+        from solutions.repair import main_repair_factor, repair_icov
+        from solutions.factor import share_inputs
+        from husfort.qinstruments import CInstruMgr
+
+        if args.icov:
+            icov = CICOV(
+                cfg_icov=proj_cfg.icov,
+                universe=proj_cfg.universe,
+                db_struct_preprocess=db_struct_cfg.preprocess,
+                db_struct_icov=db_struct_icov,
+            )
+            repair_icov(icov, bgn_date, stp_date, calendar)
+
+        instru_mgr = CInstruMgr(instru_info_path=proj_cfg.instru_info_path, key="tushareId")
+        factors = [
+            build_factor_stack(fclass, instru_mgr, db_struct_mkt, db_struct_avlb) for fclass in args.fclass or []
+        ]
+        share_inputs([fac for fac, _, _ in factors])
+        for fac, fac_avlb, qtests in factors:
+            main_repair_factor(
+                fac=fac,
+                fac_avlb=fac_avlb,
+                qtests=qtests,
+                db_struct_preprocess=db_struct_cfg.preprocess,
+                bgn_date=bgn_date,
+                stp_date=stp_date,
+                calendar=calendar,
+            )
+    elif args.switch == "backfill":
+        from config import db_struct_cfg
+        from solutions.css import CCrossSectionCalculator
+        from solutions.icov import CICOV
+        from solutions.test_return import CTestReturnsByInstru, CTestReturnsAvlb
+        from solutions.backfill import main_backfill_market, main_backfill_factor
+        from solutions.factor import share_inputs
+        from husfort.qinstruments import CInstruMgr
+
+        if args.instru not in proj_cfg.universe:
+            raise ValueError(f"{args.instru} is not in universe, add it to config.yaml first")
+        if not args.nomarket:
+            main_backfill_market(
+                instru=args.instru,
+                bgn_date=bgn_date,
+                stp_date=stp_date,
+                calendar=calendar,
+                universe=proj_cfg.universe,
+                cfg_avlb_unvrs=proj_cfg.avlb_unvrs,
+                db_struct_preprocess=db_struct_cfg.preprocess,
+                db_struct_avlb=db_struct_avlb,
+                db_struct_mkt=db_struct_mkt,
+                path_mkt_idx_data=proj_cfg.market_index_path,
+                mkt_idxes=proj_cfg.mkt.idxes,
+                sectors=proj_cfg.sectors,
+                css=CCrossSectionCalculator(
+                    cfg_css=proj_cfg.css,
+                    db_struct_avlb=db_struct_avlb,
+                    db_struct_css=db_struct_css,
+                    db_struct_mkt=db_struct_mkt,
+                    sectors=proj_cfg.sectors,
+                ),
+                icov=CICOV(
+                    cfg_icov=proj_cfg.icov,
+                    universe=proj_cfg.universe,
+                    db_struct_preprocess=db_struct_cfg.preprocess,
+                    db_struct_icov=db_struct_icov,
+                ),
+                test_returns=[
+                    (
+                        CTestReturnsByInstru(
+                            ret=ret,
+                            universe=proj_cfg.universe,
+                            test_returns_by_instru_dir=proj_cfg.test_returns_by_instru_dir,
+                            db_struct_preprocess=db_struct_cfg.preprocess,
+                        ),
+                        CTestReturnsAvlb(
+                            ret=ret,
+                            universe=proj_cfg.universe,
+                            test_returns_by_instru_dir=proj_cfg.test_returns_by_instru_dir,
+                            test_returns_avlb_raw_dir=proj_cfg.test_returns_avlb_raw_dir,
+                            db_struct_avlb=db_struct_avlb,
+                        ),
+                    )
+                    for ret in proj_cfg.all_rets
+                ],
+            )
+
+        instru_mgr = CInstruMgr(instru_info_path=proj_cfg.instru_info_path, key="tushareId")
+        factors = [
+            build_factor_stack(fclass, instru_mgr, db_struct_mkt, db_struct_avlb) for fclass in args.fclass or []
+        ]
+        share_inputs([fac for fac, _, _ in factors])
+        for fac, fac_avlb, qtests in factors:
+            main_backfill_factor(
+                instru=args.instru,
+                fac=fac,
+                fac_avlb=fac_avlb,
+                qtests=qtests,
+                bgn_date=bgn_date,
+                stp_date=stp_date,
+                calendar=calendar,
+            )
+    elif args.switch == "update":
+        from config import db_struct_cfg, cfg_factors
+        from solutions.css import CCrossSectionCalculator
+        from solutions.icov import CICOV
+        from solutions.test_return import CTestReturnsByInstru, CTestReturnsAvlb
+        from solutions.update import main_update
+        from solutions.factor import share_inputs
+        from husfort.qinstruments import CInstruMgr
+
+        instru_mgr = CInstruMgr(instru_info_path=proj_cfg.instru_info_path, key="tushareId")
+        factors = [
+            build_factor_stack(fclass, instru_mgr, db_struct_mkt, db_struct_avlb)
+            for fclass in args.fclass or cfg_factors.classes
+        ]
+        share_inputs([fac for fac, _, _ in factors])
+        main_update(
+            bgn_date=bgn_date,
+            stp_date=args.stp,
+            calendar=calendar,
+            dry_run=args.dryrun,
+            universe=proj_cfg.universe,
+            cfg_avlb_unvrs=proj_cfg.avlb_unvrs,
+            db_struct_preprocess=db_struct_cfg.preprocess,
+            db_struct_avlb=db_struct_avlb,
+            db_struct_mkt=db_struct_mkt,
+            db_struct_css=db_struct_css,
+            path_mkt_idx_data=proj_cfg.market_index_path,
+            mkt_idxes=proj_cfg.mkt.idxes,
+            sectors=proj_cfg.sectors,
+            css=CCrossSectionCalculator(
+                cfg_css=proj_cfg.css,
+                db_struct_avlb=db_struct_avlb,
+                db_struct_css=db_struct_css,
+                db_struct_mkt=db_struct_mkt,
+                sectors=proj_cfg.sectors,
+            ),
+            icov=CICOV(
+                cfg_icov=proj_cfg.icov,
+                universe=proj_cfg.universe,
+                db_struct_preprocess=db_struct_cfg.preprocess,
+                db_struct_icov=db_struct_icov,
+            ),
+            test_returns=[
+                (
+                    CTestReturnsByInstru(
+                        ret=ret,
+                        universe=proj_cfg.universe,
+                        test_returns_by_instru_dir=proj_cfg.test_returns_by_instru_dir,
+                        db_struct_preprocess=db_struct_cfg.preprocess,
+                    ),
+                    CTestReturnsAvlb(
+                        ret=ret,
+                        universe=proj_cfg.universe,
+                        test_returns_by_instru_dir=proj_cfg.test_returns_by_instru_dir,
+                        test_returns_avlb_raw_dir=proj_cfg.test_returns_avlb_raw_dir,
+                        db_struct_avlb=db_struct_avlb,
+                    ),
+                )
+                for ret in proj_cfg.all_rets
+            ],
+            factors=factors,
         )
     else:
         logger.error(f"switch = {args.switch} is not implemented yet.")
+
+    if args.perf:
+        from solutions.perf import summarize_perf
+
+        print(summarize_perf(proj_cfg.perf_dir, perf_run_id).to_string(float_format="{:.3f}".format))
@@ -3,48 +3,18 @@ import pandas as pd
 
 
 def cal_rolling_corr(df: pd.DataFrame, x: str, y: str, rolling_window: int) -> pd.Series:
-    xyb: pd.Series = (df[x] * df[y]).rolling(window=rolling_window).mean()
-    xxb: pd.Series = (df[x] * df[x]).rolling(window=rolling_window).mean()
-    yyb: pd.Series = (df[y] * df[y]).rolling(window=rolling_window).mean()
-    xb: pd.Series = df[x].rolling(window=rolling_window).mean()
-    yb: pd.Series = df[y].rolling(window=rolling_window).mean()
-    cov_xy: pd.Series = xyb - xb * yb
-    cov_xx: pd.Series = xxb - xb * xb
-    cov_yy: pd.Series = yyb - yb * yb
-
-    # due to float number precision, cov_xx or cov_yy could be slightly negative
-    cov_xx = cov_xx.mask(cov_xx < 1e-10, other=0)
-    cov_yy = cov_yy.mask(cov_yy < 1e-10, other=0)
-
-    sqrt_cov_xx_yy: pd.Series = np.sqrt(cov_xx * cov_yy)
-    s: pd.Series = cov_xy / sqrt_cov_xx_yy.where(sqrt_cov_xx_yy > 0, np.nan)
-    return s
+    return cal_rolling_moments(df[x], df[y], rolling_window=rolling_window)["corr"]
 
 
 def cal_rolling_beta(df: pd.DataFrame, x: str, y: str, rolling_window: int) -> pd.Series:
-    xyb: pd.Series = (df[x] * df[y]).rolling(window=rolling_window).mean()
-    xxb: pd.Series = (df[x] * df[x]).rolling(window=rolling_window).mean()
-    xb: pd.Series = df[x].rolling(window=rolling_window).mean()
-    yb: pd.Series = df[y].rolling(window=rolling_window).mean()
-    cov_xy: pd.Series = xyb - xb * yb
-    cov_xx: pd.Series = xxb - xb * xb
-    s: pd.Series = cov_xy / cov_xx.where(cov_xx > 0, np.nan)
-    return s
+    return cal_rolling_moments(df[x], df[y], rolling_window=rolling_window)["beta"]
 
 
 def cal_rolling_beta_alpha_res(
         df: pd.DataFrame, x: str, y: str, rolling_window: int,
 ) -> tuple[pd.Series, pd.Series, pd.Series]:
-    xyb: pd.Series = (df[x] * df[y]).rolling(window=rolling_window).mean()
-    xxb: pd.Series = (df[x] * df[x]).rolling(window=rolling_window).mean()
-    xb: pd.Series = df[x].rolling(window=rolling_window).mean()
-    yb: pd.Series = df[y].rolling(window=rolling_window).mean()
-    cov_xy: pd.Series = xyb - xb * yb
-    cov_xx: pd.Series = xxb - xb * xb
-    beta: pd.Series = cov_xy / cov_xx.where(cov_xx > 0, np.nan)
-    alpha: pd.Series = yb - beta * xb
-    res: pd.Series = df[y] - beta * df[x] - alpha
-    return beta, alpha, res
+    moments = cal_rolling_moments(df[x], df[y], rolling_window=rolling_window)
+    return moments["beta"], moments["alpha"], moments["res"]
 
 
 def cal_rolling_beta_res(
@@ -59,6 +29,248 @@ def cal_rolling_beta_res(
     return beta, res
 
 
+"""
+--- rolling moments from prefix sums ---
+All windows are derived from one set of prefix sums, so the cost is O(T) for each window,
+whatever the number of statistics, and 2d input is processed column-wise in one call.
+For a panel of instruments on the union of their dates, a mask of rows present in each column
+makes windows of a column span its own rows only, so results are the same as for each column alone.
+To keep precision, data is centred before summation and prefix sums carry a compensation
+term, so there is no cancellation like in E[xy] - E[x]E[y] on low volatility series.
+"""
+
+# second central moments below this fraction of the centred sum of squares are rounding noise
+ZERO_VAR_RTOL = 1e-12
+
+
+def cal_compensated_cumsum(x: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+
+    :param x: 1d or 2d array, summed along axis 0, no nan is allowed
+    :return: (hi, lo), prefix sums with a leading row of 0, and the accumulated rounding errors of hi,
+             hi[t] + lo[t] = x[0] + ... + x[t-1]
+    """
+    zeros = np.zeros((1,) + x.shape[1:])
+    hi = np.concatenate([zeros, np.cumsum(x, axis=0)], axis=0)
+    # error-free transformation (TwoSum) of each addition hi[t] = fl(hi[t-1] + x[t-1])
+    prev, b = hi[:-1], hi[1:] - hi[:-1]
+    err = (prev - (hi[1:] - b)) + (x - b)
+    lo = np.concatenate([zeros, np.cumsum(err, axis=0)], axis=0)
+    return hi, lo
+
+
+def cal_window_heads(win: int, n_rows: int, present: np.ndarray | None = None) -> np.ndarray:
+    """
+
+    :param win:
+    :param n_rows: T
+    :param present: optional, T x N bool, rows of each column, absent rows are not counted in windows
+    :return: rows of prefix sums where windows begin, T for all columns, or T x N if present is given
+    """
+    t = np.arange(1, n_rows + 1)
+    if present is None:
+        return np.maximum(t - win, 0)
+    m = np.cumsum(present, axis=0) - win  # own rows before the window
+    _, rows = np.nonzero(present.T)  # own rows of each column, sorted by column then row
+    if len(rows) == 0:
+        return np.zeros(present.shape, dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(present.sum(axis=0))[:-1]])
+    idx = np.clip(offsets[None, :] + m - 1, 0, len(rows) - 1)
+    return np.where(m > 0, rows[idx] + 1, 0)
+
+
+def cal_window_sum(prefix: tuple[np.ndarray, np.ndarray], win: int, heads: np.ndarray | None = None) -> np.ndarray:
+    """
+
+    :param prefix: (hi, lo) from cal_compensated_cumsum, with T + 1 rows
+    :param win:
+    :param heads: from cal_window_heads, default is windows over all rows
+    :return: T rows, sum of the last win rows, or of all rows available when t < win - 1
+    """
+    hi, lo = prefix
+    if heads is None:
+        heads = cal_window_heads(win, len(hi) - 1)
+    if heads.ndim == 1:
+        return (hi[1:] - hi[heads]) + (lo[1:] - lo[heads])
+    return (hi[1:] - np.take_along_axis(hi, heads, axis=0)) + (lo[1:] - np.take_along_axis(lo, heads, axis=0))
+
+
+def _get_min_periods(min_periods: int | dict[int, int] | None, win: int) -> int:
+    if min_periods is None:
+        return win
+    if isinstance(min_periods, dict):
+        return min_periods.get(win, win)
+    return min_periods
+
+
+def _cal_ref(v: np.ndarray, ok: np.ndarray) -> np.ndarray:
+    # mean of valid values for each column, used to centre the data
+    n = ok.sum(axis=0)
+    return np.where(ok, v, 0.0).sum(axis=0) / np.maximum(n, 1)
+
+
+def _cal_pair_prefixes(xv: np.ndarray, yv: np.ndarray) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """
+
+    :param xv: 1d or 2d array
+    :param yv: same shape as xv
+    :return: prefix sums of n, x, y, xx, xy, yy, counted on rows where both x and y are not nan,
+             x and y are centred by their own means.
+    """
+    ok = ~np.isnan(xv) & ~np.isnan(yv)
+    xp = np.where(ok, xv - _cal_ref(xv, ok), 0.0)
+    yp = np.where(ok, yv - _cal_ref(yv, ok), 0.0)
+    return {
+        "n": cal_compensated_cumsum(ok.astype(np.float64)),
+        "x": cal_compensated_cumsum(xp),
+        "y": cal_compensated_cumsum(yp),
+        "xx": cal_compensated_cumsum(xp * xp),
+        "xy": cal_compensated_cumsum(xp * yp),
+        "yy": cal_compensated_cumsum(yp * yp),
+    }
+
+
+def _cal_pair_moments(
+        prefixes: dict[str, tuple[np.ndarray, np.ndarray]], win: int, min_periods: int, heads: np.ndarray | None = None,
+) -> dict[str, np.ndarray]:
+    """
+
+    :param heads: from cal_window_heads
+    :return: n, means of centred x and y, and co-moments (sums of products of deviations) in the window.
+             Rows with less than min_periods (or 2) valid pairs are nan.
+    """
+    n = cal_window_sum(prefixes["n"], win, heads).round()
+    sx, sy = cal_window_sum(prefixes["x"], win, heads), cal_window_sum(prefixes["y"], win, heads)
+    sxx, sxy, syy = [cal_window_sum(prefixes[k], win, heads) for k in ("xx", "xy", "yy")]
+    ok = (n >= max(min_periods, 1)) & (n > 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mx, my = sx / n, sy / n
+        cxx, cyy = sxx - sx * mx, syy - sy * my
+        cxy = sxy - sx * my
+    cxx = np.where(cxx <= sxx * ZERO_VAR_RTOL, 0.0, cxx)
+    cyy = np.where(cyy <= syy * ZERO_VAR_RTOL, 0.0, cyy)
+    nan = np.nan
+    return {
+        "n": n,
+        "mx": np.where(ok, mx, nan),
+        "my": np.where(ok, my, nan),
+        "cxx": np.where(ok, cxx, nan),
+        "cxy": np.where(ok, cxy, nan),
+        "cyy": np.where(ok, cyy, nan),
+    }
+
+
+def cal_rolling_moments(
+        x: pd.DataFrame | pd.Series,
+        y: pd.DataFrame | pd.Series,
+        rolling_window: int,
+        min_periods: int | None = None,
+) -> dict[str, pd.DataFrame | pd.Series]:
+    """
+
+    :param x: a series, or a frame with one column for each instrument
+    :param y: same shape, index and columns as x
+    :param rolling_window:
+    :param min_periods: valid pairs (both x and y are not nan) required in a window, default is rolling_window
+    :return: a dict with keys
+             "cov", "var_x", "var_y": with ddof = 1, as pandas
+             "corr":
+             "beta", "alpha": y = alpha + beta * x in the window
+             "res": y - alpha - beta * x, of the last row in the window
+             each value has the same type, index and columns as x.
+             corr and beta are nan if the variance of the window is zero.
+    """
+    xv, yv = x.to_numpy(dtype=np.float64), y.to_numpy(dtype=np.float64)
+    ok = ~np.isnan(xv) & ~np.isnan(yv)
+    x_ref, y_ref = _cal_ref(xv, ok), _cal_ref(yv, ok)
+    m = _cal_pair_moments(
+        prefixes=_cal_pair_prefixes(xv, yv),
+        win=rolling_window,
+        min_periods=rolling_window if min_periods is None else min_periods,
+    )
+    n, cxx, cxy, cyy = m["n"], m["cxx"], m["cxy"], m["cyy"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sqrt_cxx_cyy = np.sqrt(cxx * cyy)
+        corr = cxy / np.where(sqrt_cxx_cyy > 0, sqrt_cxx_cyy, np.nan)
+        beta = cxy / np.where(cxx > 0, cxx, np.nan)
+    alpha = (m["my"] + y_ref) - beta * (m["mx"] + x_ref)
+    res = {
+        "cov": cxy / (n - 1),
+        "var_x": cxx / (n - 1),
+        "var_y": cyy / (n - 1),
+        "corr": corr,
+        "beta": beta,
+        "alpha": alpha,
+        "res": yv - alpha - beta * xv,
+    }
+    if isinstance(x, pd.Series):
+        return {k: pd.Series(v, index=x.index) for k, v in res.items()}
+    return {k: pd.DataFrame(v, index=x.index, columns=x.columns) for k, v in res.items()}
+
+
+def cal_rolling_multi_wins(
+        x: pd.Series | pd.DataFrame,
+        wins: list[int],
+        y: pd.Series | pd.DataFrame | None = None,
+        min_periods: int | dict[int, int] | None = None,
+        min_periods_pair: int | dict[int, int] | None = None,
+        present: pd.DataFrame | None = None,
+) -> dict[str, pd.DataFrame]:
+    """
+
+    :param x: a series, or a frame with one column for each instrument
+    :param wins: like [3, 5, 10, 20, 40, 60, 120, 240]
+    :param y: optional, must share the same index (and columns) with x
+    :param min_periods: for statistics of x, same meaning as in pd.Series.rolling, default is win.
+                        could be a dict like {win: min_periods} to set it for each window.
+    :param min_periods_pair: for statistics of (x, y), counted on rows where both x and y are not nan.
+    :param present: optional, bool frame like x, rows of each column when x is a panel on the union of
+                    dates. Windows of a column are over its own rows, and absent rows are nan.
+    :return: a dict of pd.DataFrame with index = x.index and columns = wins, or (win, column) for a frame,
+             so that res[key][win] is a series or a frame like x.
+             keys = ["sum", "mean", "std"] for x, plus ["cov", "beta"] if y is provided.
+             std and cov are with ddof = 1, beta is the slope of y regressed on x.
+    """
+    xv = x.to_numpy(dtype=np.float64)
+    present_v = None if present is None else present.to_numpy(dtype=bool)
+    heads = {win: None if present_v is None else cal_window_heads(win, len(xv), present_v) for win in wins}
+    x_ok = ~np.isnan(xv)
+    x_ref = _cal_ref(xv, x_ok)
+    xc = np.where(x_ok, xv - x_ref, 0.0)
+    n_x = cal_compensated_cumsum(x_ok.astype(np.float64))
+    s_x = cal_compensated_cumsum(xc)
+    s_xx = cal_compensated_cumsum(xc * xc)
+
+    res: dict[str, dict[int, np.ndarray]] = {"sum": {}, "mean": {}, "std": {}}
+    for win in wins:
+        n = cal_window_sum(n_x, win, heads[win]).round()
+        sx, sxx = cal_window_sum(s_x, win, heads[win]), cal_window_sum(s_xx, win, heads[win])
+        ok = n >= max(_get_min_periods(min_periods, win), 1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean_c = sx / n
+            var = np.maximum(sxx - sx * mean_c, 0) / (n - 1)
+        res["sum"][win] = np.where(ok, sx + n * x_ref, np.nan)
+        res["mean"][win] = np.where(ok, mean_c + x_ref, np.nan)
+        res["std"][win] = np.where(ok & (n > 1), np.sqrt(var), np.nan)
+
+    if y is not None:
+        prefixes = _cal_pair_prefixes(xv, y.to_numpy(dtype=np.float64))
+        res["cov"], res["beta"] = {}, {}
+        for win in wins:
+            m = _cal_pair_moments(prefixes, win, _get_min_periods(min_periods_pair, win), heads[win])
+            with np.errstate(divide="ignore", invalid="ignore"):
+                res["cov"][win] = m["cxy"] / (m["n"] - 1)
+                res["beta"][win] = m["cxy"] / np.where(m["cxx"] > 0, m["cxx"], np.nan)
+
+    if present_v is not None:
+        res = {k: {win: np.where(present_v, v, np.nan) for win, v in by_win.items()} for k, by_win in res.items()}
+    if isinstance(x, pd.Series):
+        return {k: pd.DataFrame(v, index=x.index) for k, v in res.items()}
+    frames = {k: {win: pd.DataFrame(v, index=x.index, columns=x.columns) for win, v in by_win.items()}
+              for k, by_win in res.items()}
+    return {k: pd.concat(by_win, axis=1) for k, by_win in frames.items()}
+
+
 def cal_top_corr(sub_data: pd.DataFrame, x: str, y: str, sort_var: str, top_size: int, ascending: bool = False):
     sorted_data = sub_data.sort_values(by=sort_var, ascending=ascending)
     top_data = sorted_data.head(top_size)
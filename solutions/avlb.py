@@ -1,20 +1,20 @@
 import pandas as pd
-from husfort.qutility import check_and_makedirs, qtimer
+from functools import partial
+from husfort.qutility import qtimer
 from husfort.qcalendar import CCalendar
-from husfort.qsqlite import CDbStruct, CMgrSqlDb
+from husfort.qsqlite import CDbStruct
 from typedefs.typedef_instrus import TUniverse
 from typedef import CCfgAvlbUnvrs
+from solutions.perf import perf_step
+from solutions.db_io import check_continuity, save_bulk
+from solutions.panel_store import read_preprocess
+from solutions.concurrency import map_loaders
 
 
-def load_major(db_struct_instru: CDbStruct, bgn_date: str, stp_date: str) -> pd.DataFrame:
-    sqldb = CMgrSqlDb(
-        db_save_dir=db_struct_instru.db_save_dir,
-        db_name=db_struct_instru.db_name,
-        table=db_struct_instru.table,
-        mode="r",
+def load_major(db_struct_preprocess: CDbStruct, instru: str, bgn_date: str, stp_date: str) -> pd.DataFrame:
+    return read_preprocess(
+        db_struct_preprocess, instru, bgn_date, stp_date, value_columns=["trade_date", "return_c_major", "amount_major"]
     )
-    amt_data = sqldb.read_by_range(bgn_date, stp_date, value_columns=["trade_date", "return_c_major", "amount_major"])
-    return amt_data
 
 
 def reformat(raw_data: pd.DataFrame) -> pd.DataFrame:
@@ -46,9 +46,12 @@ def get_available_universe(
     win_start_date = calendar.get_next_date(bgn_date, -cfg_avlb_unvrs.buffer_win + 1)
     win_vol, win_vol_min = cfg_avlb_unvrs.wins_volatility
     amt_data, amt_ma_data, return_data, volatility = {}, {}, {}, {}
-    for instru in universe:
-        db_struct_instru = db_struct_preprocess.copy_to_another(another_db_name=f"{instru}.db")
-        instru_major_data = load_major(db_struct_instru=db_struct_instru, bgn_date=win_start_date, stp_date=stp_date)
+    with perf_step("avlb", "load") as rec:
+        major_data: list[pd.DataFrame] = map_loaders(
+            partial(load_major, db_struct_preprocess, bgn_date=win_start_date, stp_date=stp_date), universe
+        )
+        rec.rows_out = sum(len(d) for d in major_data)
+    for instru, instru_major_data in zip(universe, major_data):
         selected_major_data = reformat(instru_major_data)
         amt_ma_data[instru] = selected_major_data["amount"].fillna(0).rolling(window=cfg_avlb_unvrs.win).mean()
         amt_data[instru] = selected_major_data["amount"].fillna(0)
@@ -88,23 +91,20 @@ def main_available(
     db_struct_avlb: CDbStruct,
     calendar: CCalendar,
 ):
-    check_and_makedirs(db_struct_avlb.db_save_dir)
-    sqldb = CMgrSqlDb(
-        db_save_dir=db_struct_avlb.db_save_dir,
-        db_name=db_struct_avlb.db_name,
-        table=db_struct_avlb.table,
-        mode="a",
-    )
-    if sqldb.check_continuity(bgn_date, calendar) == 0:
-        new_data = get_available_universe(
-            bgn_date=bgn_date,
-            stp_date=stp_date,
-            db_struct_preprocess=db_struct_preprocess,
-            db_struct_avlb=db_struct_avlb,
-            universe=universe,
-            cfg_avlb_unvrs=cfg_avlb_unvrs,
-            calendar=calendar,
-        )
+    if check_continuity(db_struct_avlb, bgn_date, calendar) == 0:
+        with perf_step("avlb", "cal") as rec:
+            new_data = get_available_universe(
+                bgn_date=bgn_date,
+                stp_date=stp_date,
+                db_struct_preprocess=db_struct_preprocess,
+                db_struct_avlb=db_struct_avlb,
+                universe=universe,
+                cfg_avlb_unvrs=cfg_avlb_unvrs,
+                calendar=calendar,
+            )
+            rec.rows_out = len(new_data)
         print(new_data)
-        sqldb.update(update_data=new_data)
+        with perf_step("avlb", "save") as rec:
+            rec.rows_in = len(new_data)
+            save_bulk(db_struct_avlb, new_data)
     return 0
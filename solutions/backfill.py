@@ -0,0 +1,178 @@
+"""
+Backfill of an instrument newly added to the universe in config.yaml.
+
+Each stage treats the universe as a whole, so a new instrument used to mean rebuilding all outputs.
+Switch 'backfill' computes by-instrument outputs only for the new instrument, then recomputes cross
+sectional outputs only on dates when it is available, and splices them in as repairs do:
+    avlb:           rows of the new instrument are inserted
+    mkt:            dates when it is available
+    css:            dates when it is available, and the buffer window after them
+    icov:           pairs of the new instrument are inserted, other pairs are kept
+    test returns:   by-instrument ones of the new instrument, available ones on base dates when it is available
+    factors:        by-instrument ones of the new instrument, available ones on dates when it is available,
+                    and the moving average window after them
+    ic and vt tests: dates depending on repaired available factors, see solutions.repair
+By-instrument factors of other instruments are kept, even if they read market data, which changes
+with the new instrument.
+"""
+
+from loguru import logger
+from husfort.qutility import SFG, SFY, qtimer
+from husfort.qsqlite import CDbStruct
+from husfort.qcalendar import CCalendar
+from typedefs.typedef_instrus import TUniverse
+from typedef import CCfgAvlbUnvrs
+from solutions.perf import perf_step
+from solutions.db_io import save_bulk, read_by_range
+from solutions.avlb import get_available_universe
+from solutions.mkt import main_market
+from solutions.css import CCrossSectionCalculator
+from solutions.icov import CICOV
+from solutions.test_return import CTestReturnsByInstru, CTestReturnsAvlb
+from solutions.factor import CFactorsByInstru, CFactorsAvlb
+from solutions.repair import TDateRange, to_ranges, lag_ranges, log_ranges, repair_factors_avlb, repair_qtests
+
+
+def get_avlb_ranges(
+    db_struct_avlb: CDbStruct, instru: str, bgn_date: str, stp_date: str, calendar: CCalendar
+) -> list[TDateRange]:
+    """
+
+    :return: ranges of consecutive trade dates when instru is available
+    """
+    avlb_data = read_by_range(db_struct_avlb, bgn_date, stp_date, value_columns=["trade_date", "instrument"])
+    avlb_dates = set(avlb_data.loc[avlb_data["instrument"] == instru, "trade_date"])
+    return to_ranges(avlb_dates, calendar.get_iter_list(bgn_date, stp_date), stp_date)
+
+
+def backfill_avlb(
+    instru: str,
+    bgn_date: str,
+    stp_date: str,
+    universe: TUniverse,
+    cfg_avlb_unvrs: CCfgAvlbUnvrs,
+    db_struct_preprocess: CDbStruct,
+    db_struct_avlb: CDbStruct,
+    calendar: CCalendar,
+) -> list[TDateRange]:
+    """
+    Whether an instrument is available depends only on its own data, so rows of other instruments are kept
+
+    :return: ranges of consecutive trade dates when instru is available
+    """
+    with perf_step("backfill", "avlb", tag=instru) as rec:
+        new_data = get_available_universe(
+            bgn_date=bgn_date,
+            stp_date=stp_date,
+            db_struct_preprocess=db_struct_preprocess,
+            db_struct_avlb=db_struct_avlb,
+            universe={instru: universe[instru]},
+            cfg_avlb_unvrs=cfg_avlb_unvrs,
+            calendar=calendar,
+        )
+        rec.rows_in = save_bulk(db_struct_avlb, new_data)
+    ranges = to_ranges(set(new_data["trade_date"]), calendar.get_iter_list(bgn_date, stp_date), stp_date)
+    log_ranges(f"avlb/{instru}", ranges)
+    return ranges
+
+
+@qtimer
+def main_backfill_market(
+    instru: str,
+    bgn_date: str,
+    stp_date: str,
+    calendar: CCalendar,
+    universe: TUniverse,
+    cfg_avlb_unvrs: CCfgAvlbUnvrs,
+    db_struct_preprocess: CDbStruct,
+    db_struct_avlb: CDbStruct,
+    db_struct_mkt: CDbStruct,
+    path_mkt_idx_data: str,
+    mkt_idxes: list[str],
+    sectors: list[str],
+    css: CCrossSectionCalculator,
+    icov: CICOV,
+    test_returns: list[tuple[CTestReturnsByInstru, CTestReturnsAvlb]],
+):
+    """
+    Backfill stages which do not depend on factors, in order of dependency
+
+    :param instru: an instrument newly added to universe
+    :param bgn_date:
+    :param stp_date:
+    :param calendar:
+    :param universe: with instru
+    :param cfg_avlb_unvrs:
+    :param db_struct_preprocess:
+    :param db_struct_avlb:
+    :param db_struct_mkt:
+    :param path_mkt_idx_data:
+    :param mkt_idxes:
+    :param sectors:
+    :param css:
+    :param icov:
+    :param test_returns: by-instrument and available test returns of each return
+    :return:
+    """
+    ranges = backfill_avlb(
+        instru, bgn_date, stp_date, universe, cfg_avlb_unvrs, db_struct_preprocess, db_struct_avlb, calendar
+    )
+    for range_bgn_date, range_stp_date in ranges:
+        main_market(
+            bgn_date=range_bgn_date,
+            stp_date=range_stp_date,
+            calendar=calendar,
+            db_struct_avlb=db_struct_avlb,
+            db_struct_mkt=db_struct_mkt,
+            path_mkt_idx_data=path_mkt_idx_data,
+            mkt_idxes=mkt_idxes,
+            sectors=sectors,
+            splice=True,
+        )
+    for range_bgn_date, range_stp_date in lag_ranges(ranges, 0, css.cfg_css.buffer_win, stp_date, calendar):
+        css.main(range_bgn_date, range_stp_date, calendar, splice=True)
+    icov.backfill_instru(instru, bgn_date, stp_date, calendar)
+    for test_returns_by_instru, test_returns_avlb in test_returns:
+        test_returns_by_instru.process_for_instru(instru, bgn_date, stp_date, calendar)
+        # available test returns are saved by base dates, ret.shift trade dates before
+        shift = test_returns_avlb.ret.shift
+        for range_bgn_date, range_stp_date in lag_ranges(ranges, shift, shift, stp_date, calendar):
+            test_returns_avlb.main(range_bgn_date, range_stp_date, calendar, splice=True)
+    logger.info(f"Backfill of {SFG(instru)} finished for stages before factors, {SFY(len(ranges))} ranges available")
+    return 0
+
+
+@qtimer
+def main_backfill_factor(
+    instru: str,
+    fac: CFactorsByInstru,
+    fac_avlb: CFactorsAvlb,
+    qtests: list,
+    bgn_date: str,
+    stp_date: str,
+    calendar: CCalendar,
+):
+    """
+    Run after main_backfill_market, whose available universe is read
+
+    :param instru: an instrument newly added to universe
+    :param fac: from solutions.factor.pick_factor
+    :param fac_avlb:
+    :param qtests: ic-tests and vt-tests of the factor class, from solutions.qtests.gen_qtests
+    :param bgn_date:
+    :param stp_date:
+    :param calendar:
+    :return:
+    """
+    tag = fac.factor_grp.factor_class
+    with perf_step("backfill", "factor", tag=f"{tag}-{instru}"):
+        fac.process_by_instru(instru, bgn_date, stp_date, calendar)
+    ranges = get_avlb_ranges(fac_avlb.db_struct_avlb, instru, bgn_date, stp_date, calendar)
+    repaired_avlb = repair_factors_avlb(fac_avlb, ranges, bgn_date, stp_date, calendar)
+    n_tests = repair_qtests(qtests, repaired_avlb, bgn_date, stp_date, calendar)
+    logger.info(
+        f"Backfill of {SFG(instru)} for factor {SFG(tag)} finished, "
+        f"{SFY(len(repaired_avlb))} ranges available, {SFY(n_tests)} tests repaired. "
+        f"Run switch 'summary' to update reports and plots"
+    )
+    return 0
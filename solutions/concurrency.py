@@ -0,0 +1,72 @@
+"""
+Concurrency backend of loaders.
+
+Most loaders read one database per instrument, which is I/O bound. sqlite3 releases the GIL while a
+query runs, so a pool of threads overlaps those reads, and results are shared without pickling.
+    serial:     a plain loop, for debug
+    threads:    default, concurrent.futures.ThreadPoolExecutor
+    processes:  spawn ProcessPoolExecutor, func and results must be picklable
+CPU-heavy work, like factor calculation, keeps its own spawn pools. Inside a worker of those pools,
+"processes" falls back to "threads", since pools are not nested.
+
+The backend is set by config.yaml 'loaders', and passed by environment variables, so processes
+spawned by multiprocessing use it too.
+"""
+
+import os
+import multiprocessing as mp
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Iterable, Literal
+
+TLoaderBackend = Literal["serial", "threads", "processes"]
+LOADER_BACKENDS: tuple[str, ...] = ("serial", "threads", "processes")
+ENV_LOADER_BACKEND = "CTA_LOADER_BACKEND"
+ENV_LOADER_WORKERS = "CTA_LOADER_WORKERS"
+
+
+def set_loader_backend(backend: TLoaderBackend, workers: int | None = None):
+    if backend not in LOADER_BACKENDS:
+        raise ValueError(f"Invalid loader backend {backend}, must be one of {LOADER_BACKENDS}")
+    os.environ[ENV_LOADER_BACKEND] = backend
+    if workers is None:
+        os.environ.pop(ENV_LOADER_WORKERS, None)
+    else:
+        os.environ[ENV_LOADER_WORKERS] = str(workers)
+
+
+def get_loader_backend() -> tuple[TLoaderBackend, int | None]:
+    backend = os.environ.get(ENV_LOADER_BACKEND, "threads")
+    if backend == "processes" and mp.current_process().daemon:
+        backend = "threads"
+    workers = os.environ.get(ENV_LOADER_WORKERS)
+    return backend, None if workers is None else int(workers)  # type:ignore
+
+
+def map_loaders(
+    func: Callable[[Any], Any],
+    items: Iterable,
+    backend: TLoaderBackend | None = None,
+    workers: int | None = None,
+) -> list:
+    """
+
+    :param func: item -> loaded data, like a reader of one instrument
+    :param items: like instruments
+    :param backend: default is set by set_loader_backend
+    :param workers: default is set by set_loader_backend
+    :return: a list of loaded data, in the order of items
+    """
+    items = list(items)
+    default_backend, default_workers = get_loader_backend()
+    backend, workers = backend or default_backend, workers or default_workers
+    if backend == "serial" or len(items) <= 1:
+        return [func(item) for item in items]
+    executor: Executor
+    if backend == "threads":
+        executor = ThreadPoolExecutor(max_workers=workers)
+    elif backend == "processes":
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"))
+    else:
+        raise ValueError(f"Invalid loader backend {backend}, must be one of {LOADER_BACKENDS}")
+    with executor:
+        return list(executor.map(func, items))
@@ -3,11 +3,13 @@ import numpy.linalg as la
 import pandas as pd
 from rich.progress import track
 from loguru import logger
-from husfort.qutility import check_and_makedirs, SFG
-from husfort.qsqlite import CMgrSqlDb, CDbStruct
+from husfort.qutility import SFG
+from husfort.qsqlite import CDbStruct
 from husfort.qcalendar import CCalendar
 from math_tools.weighted import weighted_volatility, decompose_dispersion
 from typedef import CCfgCss
+from solutions.perf import perf_step
+from solutions.db_io import save_with_continuity, save_splice, read_by_range
 
 
 class CCrossSectionCalculator:
@@ -26,23 +28,11 @@ class CCrossSectionCalculator:
         self.sectors = sectors
 
     def load_avlb_data(self, bgn_date: str, stp_date: str) -> pd.DataFrame:
-        sqldb = CMgrSqlDb(
-            db_save_dir=self.db_struct_avlb.db_save_dir,
-            db_name=self.db_struct_avlb.db_name,
-            table=self.db_struct_avlb.table,
-            mode="r",
-        )
-        avlb_data = sqldb.read_by_range(bgn_date=bgn_date, stp_date=stp_date)
+        avlb_data = read_by_range(self.db_struct_avlb, bgn_date=bgn_date, stp_date=stp_date)
         return avlb_data
 
     def load_mkt_idx(self, bgn_date: str, stp_date: str) -> pd.DataFrame:
-        sqldb = CMgrSqlDb(
-            db_save_dir=self.db_struct_mkt.db_save_dir,
-            db_name=self.db_struct_mkt.db_name,
-            table=self.db_struct_mkt.table,
-            mode="r",
-        )
-        mkt_idx_data = sqldb.read_by_range(bgn_date=bgn_date, stp_date=stp_date)
+        mkt_idx_data = read_by_range(self.db_struct_mkt, bgn_date=bgn_date, stp_date=stp_date)
         return mkt_idx_data
 
     @staticmethod
@@ -65,24 +55,26 @@ class CCrossSectionCalculator:
         sector_volatility = data.groupby(by="sectorL1").apply(lambda _: weighted_volatility(x=_[ret], wgt=_[amt]))
         return pd.concat([pd.Series(d), sector_volatility], axis=0)
 
-    def save(self, new_data: pd.DataFrame, bgn_date: str, calendar: CCalendar):
+    def save(
+        self,
+        new_data: pd.DataFrame,
+        bgn_date: str,
+        calendar: CCalendar,
+        replace_range: tuple[str, str] | None = None,
+    ):
         """
 
         :param new_data: "trade_date" as the first column
         :param bgn_date:
         :param calendar:
+        :param replace_range: (bgn_date, stp_date) to be spliced, instead of checking continuity
         :return:
         """
-        check_and_makedirs(self.db_struct_css.db_save_dir)
-        sqldb = CMgrSqlDb(
-            db_save_dir=self.db_struct_css.db_save_dir,
-            db_name=self.db_struct_css.db_name,
-            table=self.db_struct_css.table,
-            mode="a",
-        )
         save_data = new_data[self.db_struct_css.table.vars.names]
-        if sqldb.check_continuity(bgn_date, calendar) == 0:
-            sqldb.update(update_data=save_data)
+        if replace_range is not None:
+            save_splice(self.db_struct_css, save_data, *replace_range)
+        else:
+            save_with_continuity(self.db_struct_css, save_data, calendar, bgn_date=bgn_date)
         return 0
 
     @property
@@ -151,16 +143,29 @@ class CCrossSectionCalculator:
         df["sev"] = df["sev"].diff().abs().rolling(window=5).mean()
         return df
 
-    def main(self, bgn_date: str, stp_date: str, calendar: CCalendar):
+    def main(self, bgn_date: str, stp_date: str, calendar: CCalendar, splice: bool = False):
+        """
+
+        :param bgn_date:
+        :param stp_date:
+        :param calendar:
+        :param splice: whether to replace [bgn_date, stp_date) of saved data, for backfills
+        :return:
+        """
         buffer_bgn_date = calendar.get_next_date(bgn_date, shift=-self.cfg_css.buffer_win)
-        avlb_data = self.load_avlb_data(buffer_bgn_date, stp_date)
-        mkt_idx_data = self.load_mkt_idx(buffer_bgn_date, stp_date)
+        with perf_step("css", "load") as rec:
+            avlb_data = self.load_avlb_data(buffer_bgn_date, stp_date)
+            mkt_idx_data = self.load_mkt_idx(buffer_bgn_date, stp_date)
+            rec.rows_out = len(avlb_data) + len(mkt_idx_data)
 
         # --- volatility of sector
         mkt_idx_data["volatility_sector"] = mkt_idx_data[self.sectors].std(axis=1).rolling(window=5).mean()
 
         # --- general sector statistics
-        css = avlb_data.groupby(by="trade_date").apply(self.cal_css)
+        with perf_step("css", "cal_css") as rec:
+            rec.rows_in = len(avlb_data)
+            css = avlb_data.groupby(by="trade_date").apply(self.cal_css)
+            rec.rows_out = len(css)
         css[self.sectors] = css[self.sectors].rolling(window=self.cfg_css.vma_win).mean()
         new_data = css.reset_index().rename(columns=self.rename_mapper)
         new_data["vma"] = new_data["volatility"].rolling(window=self.cfg_css.vma_win).mean()
@@ -173,7 +178,10 @@ class CCrossSectionCalculator:
         # new_data["tot_wgt"] = 1
 
         # --- ratio-sev
-        sev = self.cal_ratio_sev_dcov(data=avlb_data, win=self.cfg_css.sev_win)
+        with perf_step("css", "cal_ratio_sev_dcov") as rec:
+            rec.rows_in = len(avlb_data)
+            sev = self.cal_ratio_sev_dcov(data=avlb_data, win=self.cfg_css.sev_win)
+            rec.rows_out = len(sev)
 
         # --- merge
         new_data = new_data.merge(
@@ -182,6 +190,9 @@ class CCrossSectionCalculator:
             how="left",
         ).merge(right=sev, on="trade_date", how="left")
         new_data = new_data.query(f"trade_date >= '{bgn_date}'")
-        self.save(new_data=new_data, bgn_date=bgn_date, calendar=calendar)
+        with perf_step("css", "save") as rec:
+            rec.rows_in = len(new_data)
+            replace_range = (bgn_date, stp_date) if splice else None
+            self.save(new_data=new_data, bgn_date=bgn_date, calendar=calendar, replace_range=replace_range)
         logger.info(f"{SFG('Cross section stats')} calculated.")
         return 0
@@ -8,6 +8,57 @@ from typedefs.typedef_factors import TFactorClass, TFactors
 # ------ sqlite3 database structure ------
 # ----------------------------------------
 
+"""
+trade_date of tables generated here is stored either as
+    TEXT: "yyyymmdd", the original schema
+    INTEGER: yyyymmdd, smaller index and faster range scans
+The choice is passed by environment variable, so that processes spawned by multiprocessing
+generate the same tables as the main process. Loaders in solutions.db_io always return trade_date
+as "yyyymmdd" str, whatever the schema is.
+"""
+
+ENV_TRADE_DATE_DTYPE = "CTA_TRADE_DATE_DTYPE"
+TRADE_DATE_DTYPES = ("TEXT", "INTEGER")
+
+
+def set_trade_date_dtype(dtype: str):
+    if dtype not in TRADE_DATE_DTYPES:
+        raise ValueError(f"Invalid trade_date dtype {dtype}, must be one of {TRADE_DATE_DTYPES}")
+    os.environ[ENV_TRADE_DATE_DTYPE] = dtype
+
+
+def get_trade_date_dtype() -> str:
+    return os.environ.get(ENV_TRADE_DATE_DTYPE, "TEXT")
+
+
+def trade_date_var() -> CSqlVar:
+    return CSqlVar("trade_date", get_trade_date_dtype())
+
+
+"""
+By-instrument databases of factors and test returns are laid out as
+    files:        one db for each (class, instrument), the original layout
+    consolidated: one db for each class, with one table for each instrument, which saves opening
+                  and closing hundreds of small files on synced disks. Since SQLite allows only one
+                  writer at a time, workers of a pool save through solutions.db_io.CSingleWriter.
+The choice is passed by environment variable too. Switching the layout needs recalculating
+factors and test returns from the first date.
+"""
+
+ENV_BY_INSTRU_LAYOUT = "CTA_BY_INSTRU_LAYOUT"
+BY_INSTRU_LAYOUTS = ("files", "consolidated")
+
+
+def set_by_instru_layout(layout: str):
+    if layout not in BY_INSTRU_LAYOUTS:
+        raise ValueError(f"Invalid by-instrument layout {layout}, must be one of {BY_INSTRU_LAYOUTS}")
+    os.environ[ENV_BY_INSTRU_LAYOUT] = layout
+
+
+def get_by_instru_layout() -> str:
+    return os.environ.get(ENV_BY_INSTRU_LAYOUT, "files")
+
+
 
 def get_avlb_db(available_dir: str) -> CDbStruct:
     return CDbStruct(
@@ -15,7 +66,7 @@ def get_avlb_db(available_dir: str) -> CDbStruct:
         db_name="avlb.db",
         table=CSqlTable(
             name="avlb",
-            primary_keys=[CSqlVar("trade_date", "TEXT"), CSqlVar("instrument", "TEXT")],
+            primary_keys=[trade_date_var(), CSqlVar("instrument", "TEXT")],
             value_columns=[
                 CSqlVar("return", "REAL"),
                 CSqlVar("amount", "REAL"),
@@ -34,7 +85,7 @@ def get_css_db(cross_section_stats_dir: str, sectors: list[str]) -> CDbStruct:
         db_name="css.db",
         table=CSqlTable(
             name="css",
-            primary_keys=[CSqlVar("trade_date", "TEXT")],
+            primary_keys=[trade_date_var()],
             value_columns=[
                 CSqlVar("volatility", "REAL"),
                 CSqlVar("dispersion", "REAL"),
@@ -60,7 +111,7 @@ def get_icov_db(icov_db_dir: str) -> CDbStruct:
         table=CSqlTable(
             name="icov",
             primary_keys=[
-                CSqlVar("trade_date", "TEXT"),
+                trade_date_var(),
                 CSqlVar("instrument0", "TEXT"),
                 CSqlVar("instrument1", "TEXT"),
             ],
@@ -78,7 +129,7 @@ def get_market_db(market_dir: str, sectors: list[str]) -> CDbStruct:
         db_name="mkt.db",
         table=CSqlTable(
             name="mkt",
-            primary_keys=[CSqlVar("trade_date", "TEXT")],
+            primary_keys=[trade_date_var()],
             value_columns=v_s0 + v_s1 + v_idx,
         ),
     )
@@ -98,12 +149,18 @@ def gen_test_returns_by_instru_db(
     :param ret:
     :return:
     """
+    if get_by_instru_layout() == "consolidated":
+        db_save_dir, db_name = test_returns_by_instru_dir, f"{ret_class}.db"
+        table_name = f"{ret.ret_name}-{instru}"
+    else:
+        db_save_dir, db_name = os.path.join(test_returns_by_instru_dir, ret_class), f"{instru}.db"
+        table_name = ret.ret_name
     return CDbStruct(
-        db_save_dir=os.path.join(test_returns_by_instru_dir, ret_class),
-        db_name=f"{instru}.db",
+        db_save_dir=db_save_dir,
+        db_name=db_name,
         table=CSqlTable(
-            name=ret.ret_name,
-            primary_keys=[CSqlVar("trade_date", "TEXT")],
+            name=table_name,
+            primary_keys=[trade_date_var()],
             value_columns=[CSqlVar("ticker", "TEXT"), CSqlVar(ret.ret_name, "REAL")],
         ),
     )
@@ -127,7 +184,7 @@ def gen_test_returns_avlb_db(
         db_name=f"{ret_class}.db",
         table=CSqlTable(
             name=ret.ret_name,
-            primary_keys=[CSqlVar("trade_date", "TEXT"), CSqlVar("instrument", "TEXT")],
+            primary_keys=[trade_date_var(), CSqlVar("instrument", "TEXT")],
             value_columns=[CSqlVar(ret.ret_name, "REAL")],
         ),
     )
@@ -147,12 +204,18 @@ def gen_factors_by_instru_db(
     :param factors:
     :return:
     """
+    if get_by_instru_layout() == "consolidated":
+        db_save_dir, db_name = factors_by_instru_dir, f"{factor_class}.db"
+        table_name = f"factor-{instru}"
+    else:
+        db_save_dir, db_name = os.path.join(factors_by_instru_dir, factor_class), f"{instru}.db"
+        table_name = "factor"
     return CDbStruct(
-        db_save_dir=os.path.join(factors_by_instru_dir, factor_class),
-        db_name=f"{instru}.db",
+        db_save_dir=db_save_dir,
+        db_name=db_name,
         table=CSqlTable(
-            name="factor",
-            primary_keys=[CSqlVar("trade_date", "TEXT")],
+            name=table_name,
+            primary_keys=[trade_date_var()],
             value_columns=[CSqlVar("ticker", "TEXT")] + [CSqlVar(fac.factor_name, "REAL") for fac in factors],
         ),
     )
@@ -176,7 +239,7 @@ def gen_factors_avlb_db(
         db_name=f"{factor_class}.db",
         table=CSqlTable(
             name="factor",
-            primary_keys=[CSqlVar("trade_date", "TEXT"), CSqlVar("instrument", "TEXT")],
+            primary_keys=[trade_date_var(), CSqlVar("instrument", "TEXT")],
             value_columns=[CSqlVar(fac.factor_name, "REAL") for fac in factors],
         ),
     )
@@ -203,7 +266,7 @@ def gen_ic_tests_db(
         db_name=db_name,
         table=CSqlTable(
             name="ic",
-            primary_keys=[CSqlVar("trade_date", "TEXT")],
+            primary_keys=[trade_date_var()],
             value_columns=[CSqlVar(fac.factor_name, "REAL") for fac in factors],
         ),
     )
@@ -230,7 +293,44 @@ def gen_vt_tests_db(
         db_name=db_name,
         table=CSqlTable(
             name="vt",
-            primary_keys=[CSqlVar("trade_date", "TEXT")],
+            primary_keys=[trade_date_var()],
             value_columns=[CSqlVar(fac.factor_name, "REAL") for fac in factors],
         ),
     )
+
+
+def gen_qtest_summary_db(
+    tests_dir: str,
+    factor_class: TFactorClass,
+    factors: TFactors,
+    ret: CRet,
+) -> CDbStruct:
+    """
+
+    :param tests_dir: ic_tests_dir or vt_tests_dir
+    :param factor_class:
+    :param factors:
+    :param ret:
+    :return: running sums of test results since the first test date, for each factor:
+             {factor}_n: number of valid values
+             {factor}_s1: sum of values
+             {factor}_s2: sum of squared values
+    """
+
+    db_name = f"{factor_class}-{ret.ret_name}.db"
+    value_columns: list[CSqlVar] = []
+    for fac in factors:
+        value_columns += [
+            CSqlVar(f"{fac.factor_name}_n", "INTEGER"),
+            CSqlVar(f"{fac.factor_name}_s1", "REAL"),
+            CSqlVar(f"{fac.factor_name}_s2", "REAL"),
+        ]
+    return CDbStruct(
+        db_save_dir=os.path.join(tests_dir, "summary"),
+        db_name=db_name,
+        table=CSqlTable(
+            name="running_sums",
+            primary_keys=[trade_date_var()],
+            value_columns=value_columns,
+        ),
+    )
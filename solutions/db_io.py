@@ -0,0 +1,505 @@
+"""
+Bulk writer and loader for output databases.
+
+Connections are opened with journal_mode = WAL and synchronous = NORMAL, and switched back to
+journal_mode = DELETE on close, which moves the WAL into the main file. Readers with immutable=1
+ignore -wal files, so a close which fails to do it raises, instead of leaving rows unseen.
+All rows of a save are inserted by chunked executemany in a single transaction. Columns are inserted
+by position, as CMgrSqlDb.update does, so data is renamed to the columns of the table. When a table
+is built for the first time, it is created without primary keys, and the unique index on them is
+created after all rows are inserted, which is much cheaper than maintaining it row by row. Rows
+with duplicated primary keys are dropped before, keeping the last one, as INSERT OR REPLACE does.
+Tables stay compatible with CMgrSqlDb, which reads them as usual.
+
+trade_date could be stored as TEXT "yyyymmdd" or INTEGER yyyymmdd, see solutions.db_generator.
+Both writer and loader here accept and return "yyyymmdd" str, converting as the table requires.
+
+Loaders open databases by URI with mode=ro, and by default immutable=1, so parallel readers take
+no locks at all, with PRAGMA mmap_size to read pages from the OS page cache without copying, and
+a larger cache_size. immutable=1 assumes nobody writes the file while it is open, which holds as
+long as switches writing the same databases are not run at the same time. Connections are kept
+for each thread and reused while the file keeps its mtime and size, so a file saved again is
+reopened. Settings are passed by environment variables, like trade_date dtype.
+
+Repairs splice rows into the middle of a table by write with replace_range, which deletes old rows
+of the range and inserts new ones in the same transaction, see solutions.repair.
+"""
+
+import os
+import time
+import queue
+import sqlite3
+import threading
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from loguru import logger
+from husfort.qsqlite import CDbStruct
+from husfort.qcalendar import CCalendar
+from husfort.qutility import check_and_makedirs
+from solutions.perf import perf_step
+
+WRITE_CHUNK_SIZE = 50_000
+ENV_SQLITE_IMMUTABLE = "CTA_SQLITE_IMMUTABLE"
+ENV_SQLITE_MMAP_MB = "CTA_SQLITE_MMAP_MB"
+ENV_SQLITE_CACHE_MB = "CTA_SQLITE_CACHE_MB"
+_readers = threading.local()
+
+
+def quote(name: str) -> str:
+    return f'"{name}"'
+
+
+def get_trade_date_dtype_of(db_struct: CDbStruct) -> str:
+    for v in db_struct.table.primary_keys:
+        if v.name == "trade_date":
+            return v.dtype.upper()
+    return "TEXT"
+
+
+def encode_trade_date(trade_date: str | pd.Series, dtype: str) -> str | int | pd.Series:
+    """
+
+    :param trade_date: "yyyymmdd", or a series of them
+    :param dtype: "TEXT" or "INTEGER"
+    :return: value(s) to be stored in database
+    """
+    if dtype != "INTEGER":
+        return trade_date
+    if isinstance(trade_date, pd.Series):
+        return trade_date.astype(np.int64)
+    return int(trade_date)
+
+
+def decode_trade_date(trade_date: pd.Series) -> pd.Series:
+    # both "yyyymmdd" and yyyymmdd are converted to "yyyymmdd"
+    return trade_date.astype(str)
+
+
+class CDbWriter:
+    def __init__(self, db_struct: CDbStruct, chunk_size: int = WRITE_CHUNK_SIZE):
+        self.db_struct = db_struct
+        self.chunk_size = chunk_size
+        self.con: sqlite3.Connection | None = None
+
+    @property
+    def db_path(self) -> str:
+        return os.path.join(self.db_struct.db_save_dir, self.db_struct.db_name)
+
+    @property
+    def table_name(self) -> str:
+        return self.db_struct.table.name
+
+    @property
+    def columns(self) -> list[str]:
+        return self.db_struct.table.vars.names
+
+    @property
+    def primary_keys(self) -> list[str]:
+        return [v.name for v in self.db_struct.table.primary_keys]
+
+    @property
+    def trade_date_dtype(self) -> str:
+        return get_trade_date_dtype_of(self.db_struct)
+
+    def __enter__(self) -> "CDbWriter":
+        check_and_makedirs(self.db_struct.db_save_dir)
+        # transactions are managed explicitly
+        self.con = sqlite3.connect(self.db_path, isolation_level=None)
+        self.con.execute("PRAGMA journal_mode = WAL")
+        self.con.execute("PRAGMA synchronous = NORMAL")
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # leaving WAL checkpoints it fully, or keeps WAL if it can not, like when the db is busy
+        try:
+            journal_mode = self.con.execute("PRAGMA journal_mode = DELETE").fetchone()[0]
+        finally:
+            self.con.close()
+            self.con = None
+        if journal_mode.lower() != "delete":
+            raise sqlite3.OperationalError(
+                f"[{self.db_path}] WAL is not moved back to the main file, journal mode = {journal_mode}"
+            )
+
+    def table_exists(self) -> bool:
+        sql = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?"
+        return self.con.execute(sql, (self.table_name,)).fetchone() is not None
+
+    def last_date(self) -> str | None:
+        if not self.table_exists():
+            return None
+        sql = f"SELECT MAX(trade_date) FROM {quote(self.table_name)}"
+        last_date = self.con.execute(sql).fetchone()[0]
+        return None if last_date is None else str(last_date)
+
+    def check_continuity(self, incoming_date: str, calendar: CCalendar) -> int:
+        return compare_continuity(self.db_path, self.last_date(), incoming_date, calendar)
+
+    def create_table(self, with_primary_keys: bool):
+        table = self.db_struct.table
+        cols = [f"{quote(v.name)} {v.dtype}" for v in table.primary_keys + table.value_columns]
+        if with_primary_keys:
+            cols.append(f"PRIMARY KEY ({', '.join(quote(k) for k in self.primary_keys)})")
+        self.con.execute(f"CREATE TABLE {quote(self.table_name)} ({', '.join(cols)})")
+
+    def create_primary_index(self):
+        index_name = quote(f"{self.table_name}_pk")
+        keys = ", ".join(quote(k) for k in self.primary_keys)
+        self.con.execute(f"CREATE UNIQUE INDEX {index_name} ON {quote(self.table_name)} ({keys})")
+
+    def delete_range(self, bgn_date: str, stp_date: str | None = None) -> int:
+        """
+
+        :param bgn_date: "yyyymmdd", included
+        :param stp_date: "yyyymmdd", excluded, None for all dates from bgn_date
+        :return: number of rows deleted
+        """
+        if not self.table_exists():
+            return 0
+        sql = f"DELETE FROM {quote(self.table_name)} WHERE trade_date >= ?"
+        params = [encode_trade_date(bgn_date, self.trade_date_dtype)]
+        if stp_date is not None:
+            sql += " AND trade_date < ?"
+            params.append(encode_trade_date(stp_date, self.trade_date_dtype))
+        return self.con.execute(sql, params).rowcount
+
+    def write(self, data: pd.DataFrame, replace_range: tuple[str, str] | None = None) -> int:
+        """
+
+        :param data: columns of the table by position, rows with existing primary keys are replaced
+        :param replace_range: (bgn_date, stp_date), rows in it are deleted before data is inserted, in the
+                              same transaction, so readers see either all old rows or all new rows of it.
+                              data must be in it.
+        :return: number of rows written
+        """
+        if len(data.columns) != len(self.columns):
+            raise ValueError(f"[{self.db_path}] data has {len(data.columns)} columns, table has {len(self.columns)}")
+        data = data.set_axis(self.columns, axis=1)
+        if replace_range is not None and not data.empty:
+            bgn_date, stp_date = replace_range
+            if (data["trade_date"].min() < bgn_date) or (data["trade_date"].max() >= stp_date):
+                raise ValueError(f"[{self.db_path}] data to be spliced is out of [{bgn_date}, {stp_date})")
+        if data.empty and (replace_range is None or not self.table_exists()):
+            return 0
+        with perf_step("db_io", "write", tag=self.db_struct.db_name) as rec:
+            is_new = not self.table_exists()
+            if is_new:
+                # no primary key to replace on yet, and the unique index would fail on duplicates
+                data = data.drop_duplicates(subset=self.primary_keys, keep="last")
+            if "trade_date" in self.columns:
+                data = data.assign(trade_date=encode_trade_date(data["trade_date"], self.trade_date_dtype))
+            rows = list(zip(*[data[c].tolist() for c in self.columns]))
+            placeholders = ", ".join(["?"] * len(self.columns))
+            sql = (
+                f"INSERT OR REPLACE INTO {quote(self.table_name)} ({', '.join(quote(c) for c in self.columns)}) "
+                f"VALUES ({placeholders})"
+            )
+            t0 = time.perf_counter()
+            self.con.execute("BEGIN")
+            try:
+                if is_new:
+                    self.create_table(with_primary_keys=False)
+                elif replace_range is not None:
+                    rec.extra["deleted"] = self.delete_range(*replace_range)
+                for i in range(0, len(rows), self.chunk_size):
+                    self.con.executemany(sql, rows[i : i + self.chunk_size])
+                if is_new:
+                    self.create_primary_index()
+                self.con.execute("COMMIT")
+            except sqlite3.Error:
+                self.con.execute("ROLLBACK")
+                raise
+            elapsed = time.perf_counter() - t0
+            rec.rows_in = len(rows)
+            rec.extra.update({"new_table": is_new, "rows_per_sec": len(rows) / elapsed if elapsed > 0 else None})
+            if replace_range is not None:
+                rec.extra["replace_range"] = "-".join(replace_range)
+        return len(rows)
+
+
+def compare_continuity(db_path: str, last_date: str | None, incoming_date: str, calendar: CCalendar) -> int:
+    """
+
+    :param db_path: for logging
+    :param last_date: last date in table, None if the table is empty or does not exist
+    :param incoming_date: the first date of data to be saved
+    :param calendar:
+    :return: 0: table is empty or incoming_date is the next trade date of the last date in table
+             1: some dates would be missed
+             2: some dates would be overwritten
+    """
+    if last_date is None:
+        return 0
+    expected_date = calendar.get_next_date(last_date, shift=1)
+    if incoming_date == expected_date:
+        return 0
+    elif incoming_date > expected_date:
+        logger.warning(
+            f"[{db_path}] last date = {last_date}, incoming date = {incoming_date}, some dates would be missed"
+        )
+        return 1
+    else:
+        logger.warning(
+            f"[{db_path}] last date = {last_date}, incoming date = {incoming_date}, some dates would be overwritten"
+        )
+        return 2
+
+
+def check_continuity(db_struct: CDbStruct, incoming_date: str, calendar: CCalendar) -> int:
+    """
+    Same as CDbWriter.check_continuity, but the last date is read by a reader, so the file is not opened for writing
+    """
+    db_path = os.path.join(db_struct.db_save_dir, db_struct.db_name)
+    return compare_continuity(db_path, read_last_date(db_struct), incoming_date, calendar)
+
+
+def save_bulk(db_struct: CDbStruct, data: pd.DataFrame) -> int:
+    """
+
+    :param db_struct:
+    :param data: columns of db_struct.table by position
+    :return: number of rows written
+    """
+    with CDbWriter(db_struct) as writer:
+        return writer.write(data)
+
+
+def save_with_continuity(
+    db_struct: CDbStruct, data: pd.DataFrame, calendar: CCalendar, bgn_date: str | None = None
+) -> int:
+    """
+    Save data only if it continues from the last date in database, as CMgrSqlDb.check_continuity does
+
+    :param db_struct:
+    :param data: columns of db_struct.table by position
+    :param calendar:
+    :param bgn_date: the first date of data, default is data["trade_date"].iloc[0]
+    :return: number of rows written
+    """
+    if data.empty:
+        return 0
+    bgn_date = data["trade_date"].iloc[0] if bgn_date is None else bgn_date
+    with CDbWriter(db_struct) as writer:
+        if writer.check_continuity(bgn_date, calendar) == 0:
+            return writer.write(data)
+    return 0
+
+
+def save_splice(db_struct: CDbStruct, data: pd.DataFrame, bgn_date: str, stp_date: str) -> int:
+    """
+    Replace rows of [bgn_date, stp_date) with data, without checking continuity, for repairs
+
+    :param db_struct:
+    :param data: columns of db_struct.table by position, and be in [bgn_date, stp_date)
+    :param bgn_date:
+    :param stp_date:
+    :return: number of rows written
+    """
+    with CDbWriter(db_struct) as writer:
+        return writer.write(data, replace_range=(bgn_date, stp_date))
+
+
+class CSingleWriter:
+    """
+    Saves from many processes to one database go through a queue, and are done by a single thread
+    of this process, since SQLite allows only one writer at a time. Producers put items of
+    (db_struct, data, calendar), which are saved by save_with_continuity in order. The first error
+    is raised on exit, later items are dropped, but still taken, so producers never block.
+
+    usage:
+        with mp.get_context("spawn").Manager() as manager:
+            q = manager.Queue(maxsize=8)
+            with CSingleWriter(q):
+                ... workers call q.put((db_struct, data, calendar))
+    """
+
+    def __init__(self, write_queue: queue.Queue):
+        self.write_queue = write_queue
+        self.errors: list[Exception] = []
+        self.thread: threading.Thread | None = None
+
+    def run(self):
+        while (item := self.write_queue.get()) is not None:
+            if self.errors:
+                continue
+            try:
+                db_struct, data, calendar = item
+                save_with_continuity(db_struct, data, calendar)
+            except Exception as e:
+                self.errors.append(e)
+
+    def __enter__(self) -> "CSingleWriter":
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.write_queue.put(None)
+        self.thread.join()
+        if self.errors and exc_type is None:
+            raise self.errors[0]
+
+
+def set_sqlite_read(immutable: bool, mmap_size_mb: int, cache_size_mb: int):
+    os.environ[ENV_SQLITE_IMMUTABLE] = "1" if immutable else "0"
+    os.environ[ENV_SQLITE_MMAP_MB] = str(mmap_size_mb)
+    os.environ[ENV_SQLITE_CACHE_MB] = str(cache_size_mb)
+
+
+def connect_readonly(db_path: str) -> sqlite3.Connection:
+    uri = f"{Path(db_path).absolute().as_uri()}?mode=ro"
+    if os.environ.get(ENV_SQLITE_IMMUTABLE, "1") == "1":
+        uri += "&immutable=1"
+    con = sqlite3.connect(uri, uri=True)
+    con.execute(f"PRAGMA mmap_size = {int(os.environ.get(ENV_SQLITE_MMAP_MB, 256)) * 2**20}")
+    con.execute(f"PRAGMA cache_size = {-int(os.environ.get(ENV_SQLITE_CACHE_MB, 64)) * 2**10}")  # negative for KiB
+    return con
+
+
+def get_reader(db_path: str) -> tuple[sqlite3.Connection, bool]:
+    """
+
+    :param db_path:
+    :return: a read only connection kept for this thread, and whether it is reused.
+             Do not close it, it is closed when the file changes or the thread ends.
+    """
+    if not hasattr(_readers, "cons"):
+        _readers.cons = {}
+    db_path = os.path.abspath(db_path)
+    st = os.stat(db_path)
+    signature = (st.st_mtime_ns, st.st_size)
+    if (cached := _readers.cons.get(db_path)) is not None:
+        con, cached_signature = cached
+        if cached_signature == signature:
+            return con, True
+        con.close()
+    con = connect_readonly(db_path)
+    _readers.cons[db_path] = (con, signature)
+    return con, False
+
+
+def read_by_range(
+    db_struct: CDbStruct,
+    bgn_date: str,
+    stp_date: str,
+    value_columns: list[str] | None = None,
+    order_by: list[str] | None = None,
+) -> pd.DataFrame:
+    """
+    Same as CMgrSqlDb.read_by_range, but works with either TEXT or INTEGER trade_date
+
+    :param db_struct:
+    :param bgn_date: "yyyymmdd", included
+    :param stp_date: "yyyymmdd", excluded
+    :param value_columns: default is all columns of the table
+    :param order_by: like ["trade_date", "instrument"], rows are sorted by them. If they are the primary
+                     keys, the sorting is done by walking the unique index, which costs almost nothing.
+    :return: trade_date, if loaded, is "yyyymmdd" str
+    """
+    dtype = get_trade_date_dtype_of(db_struct)
+    columns = value_columns or db_struct.table.vars.names
+    sql = (
+        f"SELECT {', '.join(quote(c) for c in columns)} FROM {quote(db_struct.table.name)} "
+        f"WHERE trade_date >= ? AND trade_date < ?"
+    )
+    if order_by:
+        sql += f" ORDER BY {', '.join(quote(c) for c in order_by)}"
+    params = (encode_trade_date(bgn_date, dtype), encode_trade_date(stp_date, dtype))
+    with perf_step("db_io", "read", tag=db_struct.db_name) as rec:
+        con, reused = get_reader(os.path.join(db_struct.db_save_dir, db_struct.db_name))
+        data = pd.read_sql_query(sql, con, params=params)
+        rec.rows_out = len(data)
+        rec.extra["reused"] = reused
+    if "trade_date" in data.columns:
+        data["trade_date"] = decode_trade_date(data["trade_date"])
+    return data
+
+
+def get_table_reader(db_struct: CDbStruct) -> sqlite3.Connection | None:
+    """
+
+    :return: a connection by get_reader, or None if the database or the table does not exist
+    """
+    db_path = os.path.join(db_struct.db_save_dir, db_struct.db_name)
+    if not os.path.exists(db_path):
+        return None
+    con, _ = get_reader(db_path)
+    sql = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?"
+    if con.execute(sql, (db_struct.table.name,)).fetchone() is None:
+        return None
+    return con
+
+
+def read_last_date(db_struct: CDbStruct) -> str | None:
+    """
+    Max trade_date walks the index of primary keys, so it costs the same however long the table is
+
+    :param db_struct:
+    :return: "yyyymmdd", None if the database or the table does not exist, or the table is empty
+    """
+    if (con := get_table_reader(db_struct)) is None:
+        return None
+    last_date = con.execute(f"SELECT MAX(trade_date) FROM {quote(db_struct.table.name)}").fetchone()[0]
+    return None if last_date is None else str(last_date)
+
+
+def read_first_date(db_struct: CDbStruct) -> str | None:
+    """
+    Min trade_date walks the index of primary keys, like read_last_date
+
+    :param db_struct:
+    :return: "yyyymmdd", None if the database or the table does not exist, or the table is empty
+    """
+    if (con := get_table_reader(db_struct)) is None:
+        return None
+    first_date = con.execute(f"SELECT MIN(trade_date) FROM {quote(db_struct.table.name)}").fetchone()[0]
+    return None if first_date is None else str(first_date)
+
+
+def read_trade_dates(db_struct: CDbStruct, bgn_date: str, stp_date: str) -> list[str]:
+    """
+
+    :param db_struct:
+    :param bgn_date: "yyyymmdd", included
+    :param stp_date: "yyyymmdd", excluded
+    :return: sorted distinct "yyyymmdd" in table, empty if the database or the table does not exist
+    """
+    if (con := get_table_reader(db_struct)) is None:
+        return []
+    dtype = get_trade_date_dtype_of(db_struct)
+    sql = (
+        f"SELECT DISTINCT trade_date FROM {quote(db_struct.table.name)} "
+        f"WHERE trade_date >= ? AND trade_date < ? ORDER BY trade_date"
+    )
+    rows = con.execute(sql, (encode_trade_date(bgn_date, dtype), encode_trade_date(stp_date, dtype))).fetchall()
+    return [str(r[0]) for r in rows]
+
+
+def read_tail(
+    db_struct: CDbStruct, stp_date: str, n_rows: int, value_columns: list[str] | None = None
+) -> pd.DataFrame:
+    """
+    Last rows before a date, walking the index of trade_date backwards, so it costs the same
+    however long the table is.
+
+    :param db_struct:
+    :param stp_date: "yyyymmdd", excluded
+    :param n_rows: number of rows to be read at most
+    :param value_columns: default is all columns of the table
+    :return: rows sorted by trade_date ascending, trade_date, if loaded, is "yyyymmdd" str.
+             Empty with these columns if the database or the table does not exist.
+    """
+    dtype = get_trade_date_dtype_of(db_struct)
+    columns = value_columns or db_struct.table.vars.names
+    if (con := get_table_reader(db_struct)) is None:
+        return pd.DataFrame(columns=columns)
+    sql = (
+        f"SELECT {', '.join(quote(c) for c in columns)} FROM {quote(db_struct.table.name)} "
+        f"WHERE trade_date < ? ORDER BY trade_date DESC LIMIT ?"
+    )
+    data = pd.read_sql_query(sql, con, params=(encode_trade_date(stp_date, dtype), n_rows))
+    data = data.iloc[::-1].reset_index(drop=True)
+    if "trade_date" in data.columns:
+        data["trade_date"] = decode_trade_date(data["trade_date"])
+    return data
@@ -1,33 +1,43 @@
 import os
+import queue
+import shutil
+import tempfile
 import numpy as np
 import pandas as pd
 import scipy.stats as sps
 import multiprocessing as mp
 from itertools import product
-from typing import Literal
+from functools import partial
+from typing import Any, Callable, Literal
+from dataclasses import dataclass
+from contextlib import contextmanager
 from loguru import logger
 from rich.progress import track, Progress
 from husfort.qutility import SFG, SFY, error_handler, check_and_makedirs
-from husfort.qsqlite import CDbStruct, CMgrSqlDb
+from husfort.qsqlite import CDbStruct
 from husfort.qcalendar import CCalendar
 from husfort.qinstruments import CInstruMgr
 from husfort.qplot import CPlotLines
 from typedefs.typedef_factors import (
-    CArgsWin,
-    CArgsWinLbd,
-    CArgsLbd,
     CCfgFactorGrp,
-    CCfgFactorGrpWin,
     CCfgFactorGrpWinLbd,
-    CCfgFactorGrpLbd,
-    CDecay,
     TFactorClass,
-    TFactors,
     TFactorName,
+    TFactors,
+    TFactorInputs,
     CFactor,
+    merge_factor_inputs,
 )
-from typedefs.typedef_instrus import TUniverse
-from solutions.db_generator import gen_factors_by_instru_db, gen_factors_avlb_db
+from typedefs.typedef_instrus import TUniverse, CUniverseCodebook
+from solutions.db_generator import gen_factors_by_instru_db, gen_factors_avlb_db, get_by_instru_layout
+from solutions.factor_registry import CCfgFactors
+from solutions.perf import perf_step
+from solutions.db_io import CSingleWriter, save_with_continuity, save_splice, read_by_range
+from solutions.panel_align import KEY_COLUMNS, sort_canonical
+from solutions.panel_store import read_preprocess
+from solutions.pipeline import run_pipeline
+from solutions.concurrency import map_loaders
+from solutions.shared_inputs import read_shared
 from math_tools.rolling import cal_rolling_top_corr
 
 
@@ -35,6 +45,7 @@ class _CFactorsByInstruDbOperator:
     def __init__(self, factor_grp: CCfgFactorGrp, factors_by_instru_dir: str):
         self.factor_grp = factor_grp
         self.factors_by_instru_dir: str = factors_by_instru_dir
+        self.shard_queue: queue.Queue | None = None  # set by self.single_writer, for workers of a pool
 
     def get_instru_db(self, instru: str) -> CDbStruct:
         return gen_factors_by_instru_db(
@@ -46,39 +57,57 @@ class _CFactorsByInstruDbOperator:
 
     def load_by_instru(self, instru: str, bgn_date: str, stp_date: str) -> pd.DataFrame:
         db_struct_instru = self.get_instru_db(instru)
-        sqldb = CMgrSqlDb(
-            db_save_dir=db_struct_instru.db_save_dir,
-            db_name=db_struct_instru.db_name,
-            table=db_struct_instru.table,
-            mode="r",
-        )
-        factor_data = sqldb.read_by_range(bgn_date, stp_date)
+        factor_data = read_by_range(db_struct_instru, bgn_date, stp_date)
         factor_data[self.factor_grp.factor_names] = (
             factor_data[self.factor_grp.factor_names].astype(np.float64).fillna(np.nan)
         )
         return factor_data
 
-    def save_by_instru(self, factor_data: pd.DataFrame, instru: str, calendar: CCalendar):
+    def save_by_instru(
+        self,
+        factor_data: pd.DataFrame,
+        instru: str,
+        calendar: CCalendar,
+        replace_range: tuple[str, str] | None = None,
+    ):
         """
 
         :param factor_data: a pd.DataFrame with first 2 columns must be = ["trade_date", "ticker"]
                   then followed by factor names
         :param instru:
         :param calendar:
+        :param replace_range: (bgn_date, stp_date) to be spliced by a repair, instead of checking continuity
         :return:
         """
         db_struct_instru = self.get_instru_db(instru)
-        check_and_makedirs(db_struct_instru.db_save_dir)
-        sqldb = CMgrSqlDb(
-            db_save_dir=db_struct_instru.db_save_dir,
-            db_name=db_struct_instru.db_name,
-            table=db_struct_instru.table,
-            mode="a",
-        )
-        if sqldb.check_continuity(factor_data["trade_date"].iloc[0], calendar) == 0:
-            sqldb.update(factor_data[db_struct_instru.table.vars.names])
+        if replace_range is not None:
+            save_splice(db_struct_instru, factor_data[db_struct_instru.table.vars.names], *replace_range)
+        elif self.shard_queue is not None:
+            self.shard_queue.put((db_struct_instru, factor_data[db_struct_instru.table.vars.names], calendar))
+        else:
+            save_with_continuity(db_struct_instru, factor_data[db_struct_instru.table.vars.names], calendar)
         return 0
 
+    @contextmanager
+    def single_writer(self, processes: int | None):
+        """
+        With the consolidated layout, shards of all workers are in one database, so they are put into
+        a queue by workers and saved by a single thread of this process. Otherwise, it does nothing.
+
+        :param processes: size of the pool, the queue holds at most 2 items for each process
+        """
+        if get_by_instru_layout() != "consolidated":
+            yield
+            return
+        with mp.get_context("spawn").Manager() as manager:
+            shard_queue = manager.Queue(maxsize=2 * (processes or os.cpu_count() or 1))
+            with CSingleWriter(shard_queue):
+                self.shard_queue = shard_queue
+                try:
+                    yield
+                finally:
+                    self.shard_queue = None
+
     def get_factor_data(self, input_data: pd.DataFrame, bgn_date: str) -> pd.DataFrame:
         """
 
@@ -97,6 +126,10 @@ class _CFactorsByInstruDbOperator:
 
 
 class _CFactorsByInstruMoreDb(_CFactorsByInstruDbOperator):
+    # --- columns to be loaded from each by-instrument source, to be declared by specific factors
+    # --- like {"preprocess": ["ticker_major", "closeI"], "minute_bar": ["close", "vol"]}
+    inputs: TFactorInputs = {}
+
     def __init__(
         self,
         factor_grp: CCfgFactorGrp,
@@ -119,119 +152,647 @@ class _CFactorsByInstruMoreDb(_CFactorsByInstruDbOperator):
         self.db_struct_macro = db_struct_macro
         self.db_struct_mkt = db_struct_mkt
         self.instru_mgr = instru_mgr
+        # --- set by share_inputs, for factor classes run one after another in this run
+        self.shared_inputs: TFactorInputs = {}
+        self.shared_grps: list[CCfgFactorGrp] = []
+
+    def clone(self, factor_grp: CCfgFactorGrp):
+        """
+
+        :param factor_grp: of the same type as self.factor_grp, with other args
+        :return: an instance of the same factor class, with the same databases
+        """
+        return type(self)(
+            factor_grp=factor_grp,
+            factors_by_instru_dir=self.factors_by_instru_dir,
+            universe=self.universe,
+            db_struct_preprocess=self.db_struct_preprocess,
+            db_struct_minute_bar=self.db_struct_minute_bar,
+            db_struct_pos=self.db_struct_pos,
+            db_struct_forex=self.db_struct_forex,
+            db_struct_macro=self.db_struct_macro,
+            db_struct_mkt=self.db_struct_mkt,
+            instru_mgr=self.instru_mgr,
+        )
 
     def load_preprocess(self, instru: str, bgn_date: str, stp_date: str, values: list[str] = None) -> pd.DataFrame:
         if self.db_struct_preprocess is not None:
-            db_struct_instru = self.db_struct_preprocess.copy_to_another(another_db_name=f"{instru}.db")
-            sqldb = CMgrSqlDb(
-                db_save_dir=db_struct_instru.db_save_dir,
-                db_name=db_struct_instru.db_name,
-                table=db_struct_instru.table,
-                mode="r",
-            )
-            return sqldb.read_by_range(bgn_date, stp_date, value_columns=values)
+            return read_preprocess(self.db_struct_preprocess, instru, bgn_date, stp_date, value_columns=values)
         else:
             raise ValueError("Argument 'db_struct_preprocess' must be provided")
 
     def load_minute_bar(self, instru: str, bgn_date: str, stp_date: str, values: list[str] = None) -> pd.DataFrame:
         if self.db_struct_minute_bar is not None:
             db_struct_instru = self.db_struct_minute_bar.copy_to_another(another_db_name=f"{instru}.db")
-            sqldb = CMgrSqlDb(
-                db_save_dir=db_struct_instru.db_save_dir,
-                db_name=db_struct_instru.db_name,
-                table=db_struct_instru.table,
-                mode="r",
-            )
-            return sqldb.read_by_range(bgn_date, stp_date, value_columns=values)
+            return read_by_range(db_struct_instru, bgn_date, stp_date, value_columns=values)
         else:
             raise ValueError("Argument 'db_struct_minute_bar' must be provided")
 
     def load_pos(self, instru: str, bgn_date: str, stp_date: str, values: list[str] = None) -> pd.DataFrame:
         if self.db_struct_pos is not None:
             db_struct_instru = self.db_struct_pos.copy_to_another(another_db_name=f"{instru}.db")
-            sqldb = CMgrSqlDb(
-                db_save_dir=db_struct_instru.db_save_dir,
-                db_name=db_struct_instru.db_name,
-                table=db_struct_instru.table,
-                mode="r",
-            )
-            return sqldb.read_by_range(bgn_date, stp_date, value_columns=values)
+            return read_by_range(db_struct_instru, bgn_date, stp_date, value_columns=values)
         else:
             raise ValueError("Argument 'db_struct_pos' must be provided")
 
+    def load_inputs(
+        self, instru: str, bgn_date: str, stp_date: str, inputs: TFactorInputs | None = None
+    ) -> dict[str, pd.DataFrame]:
+        """
+
+        :param instru:
+        :param bgn_date: buffer begin date is expected
+        :param stp_date:
+        :param inputs: default is self.inputs
+        :return: a dict of pd.DataFrame, source -> data with columns = ["trade_date"] + declared columns
+        """
+        loaders = self.get_input_loaders()
+        res: dict[str, pd.DataFrame] = {}
+        for source, columns in (self.inputs if inputs is None else inputs).items():
+            if source not in loaders:
+                raise ValueError(f"Invalid input source {source}")
+            values = ["trade_date"] + [c for c in columns if c != "trade_date"]
+            res[source] = loaders[source](instru, bgn_date, stp_date, values=values)
+        return res
+
+    def get_input_loaders(self) -> dict[str, Callable[..., pd.DataFrame]]:
+        return {
+            "preprocess": self.load_preprocess,
+            "minute_bar": self.load_minute_bar,
+            "pos": self.load_pos,
+        }
+
+    def get_input_db(self, source: str, instru: str) -> CDbStruct:
+        db_struct = {
+            "preprocess": self.db_struct_preprocess,
+            "minute_bar": self.db_struct_minute_bar,
+            "pos": self.db_struct_pos,
+        }[source]
+        return db_struct.copy_to_another(another_db_name=f"{instru}.db")
+
+    def load_shared_inputs(self, instru: str, bgn_date: str, stp_date: str) -> dict[str, pd.DataFrame]:
+        """
+        Sources in self.shared_inputs are loaded with columns of all classes sharing them, the first
+        class to load an instrument saves them in the run dir of shared_inputs, the others map them.
+
+        :param instru:
+        :param bgn_date: the earliest buffer begin date of classes sharing the inputs
+        :param stp_date:
+        :return: a dict of pd.DataFrame, source -> data with columns = ["trade_date"] + shared columns
+        """
+        loaders = self.get_input_loaders()
+        res: dict[str, pd.DataFrame] = {}
+        for source in self.inputs:
+            if source not in self.shared_inputs:
+                continue
+            values = ["trade_date"] + [c for c in self.shared_inputs[source] if c != "trade_date"]
+            res[source] = read_shared(
+                self.get_input_db(source, instru),
+                bgn_date,
+                stp_date,
+                reader=partial(loaders[source], instru, bgn_date, stp_date, values=values),
+                columns=values,
+                memo=False,
+            )
+        return res
+
+    @staticmethod
+    def read_shared_db(db_struct: CDbStruct, bgn_date: str, stp_date: str) -> pd.DataFrame:
+        return read_shared(db_struct, bgn_date, stp_date, reader=lambda: read_by_range(db_struct, bgn_date, stp_date))
+
     def load_forex(self, bgn_date: str, stp_date: str) -> pd.DataFrame:
         if self.db_struct_forex is not None:
-            sqldb = CMgrSqlDb(
-                db_save_dir=self.db_struct_forex.db_save_dir,
-                db_name=self.db_struct_forex.db_name,
-                table=self.db_struct_forex.table,
-                mode="r",
-            )
-            return sqldb.read_by_range(bgn_date, stp_date)
+            return self.read_shared_db(self.db_struct_forex, bgn_date, stp_date)
         else:
             raise ValueError("Argument 'db_struct_forex' must be provided")
 
     def load_macro(self, bgn_date: str, stp_date: str) -> pd.DataFrame:
         if self.db_struct_macro is not None:
-            sqldb = CMgrSqlDb(
-                db_save_dir=self.db_struct_macro.db_save_dir,
-                db_name=self.db_struct_macro.db_name,
-                table=self.db_struct_macro.table,
-                mode="r",
-            )
-            return sqldb.read_by_range(bgn_date, stp_date)
+            return self.read_shared_db(self.db_struct_macro, bgn_date, stp_date)
         else:
             raise ValueError("Argument 'db_struct_macro' must be provided")
 
     def load_mkt(self, bgn_date: str, stp_date: str) -> pd.DataFrame:
         if self.db_struct_mkt is not None:
-            sqldb = CMgrSqlDb(
-                db_save_dir=self.db_struct_mkt.db_save_dir,
-                db_name=self.db_struct_mkt.db_name,
-                table=self.db_struct_mkt.table,
-                mode="r",
-            )
-            return sqldb.read_by_range(bgn_date, stp_date)
+            return self.read_shared_db(self.db_struct_mkt, bgn_date, stp_date)
         else:
             raise ValueError("Argument 'db_struct_mkt' must be provided")
 
 
+@dataclass(frozen=True)
+class CFactorHandoff:
+    """
+    Descriptor of factor data handed off by a worker, the data itself is kept in .npy files,
+    which the parent maps instead of receiving pickled frames or reading shards.
+    """
+
+    instru: str
+    dates_path: str  # "yyyymmdd" of each row
+    values_path: str  # float64, shape = (rows, factors)
+    n_rows: int
+
+
 class CFactorsByInstru(_CFactorsByInstruMoreDb):
-    def cal_factor_by_instru(self, instru: str, bgn_date: str, stp_date: str, calendar: CCalendar) -> pd.DataFrame:
+    def cal_factor_from_inputs(
+        self,
+        instru: str,
+        inputs: dict[str, pd.DataFrame],
+        bgn_date: str,
+        stp_date: str,
+        calendar: CCalendar,
+    ) -> pd.DataFrame:
         """
-        This function is to be realized by specific factors
+        This function is to be realized by specific factors which declare self.inputs
 
+        :param instru:
+        :param inputs: source -> data, loaded by self.load_inputs from buffer begin date,
+                       could contain more columns or more dates than declared
+        :param bgn_date:
+        :param stp_date:
+        :param calendar:
         :return : a pd.DataFrame with first 2 columns must be = ["trade_date", "ticker"]
                   then followed by factor names
         """
         raise NotImplementedError
 
+    def cal_factor_by_instru(self, instru: str, bgn_date: str, stp_date: str, calendar: CCalendar) -> pd.DataFrame:
+        """
+        Specific factors could either declare self.inputs and realize self.cal_factor_from_inputs,
+        or override this function to load data by themselves
+
+        :return : a pd.DataFrame with first 2 columns must be = ["trade_date", "ticker"]
+                  then followed by factor names
+        """
+        if not self.inputs:
+            raise NotImplementedError
+        inputs = self.prefetch_inputs(instru, bgn_date, stp_date, calendar)
+        return self.cal_factor_with_inputs(instru, inputs, bgn_date, stp_date, calendar)
+
+    def prefetch_inputs(
+        self, instru: str, bgn_date: str, stp_date: str, calendar: CCalendar
+    ) -> dict[str, pd.DataFrame] | None:
+        """
+
+        :return: inputs declared by self.inputs from buffer begin date,
+                 or None if the factor loads data by itself in cal_factor_by_instru
+        """
+        if not self.inputs:
+            return None
+        buffer_bgn_date = self.factor_grp.buffer_bgn_date(bgn_date, calendar)
+        with perf_step("factor", "load", tag=instru) as rec:
+            own_inputs = {s: c for s, c in self.inputs.items() if s not in self.shared_inputs}
+            inputs = self.load_inputs(instru, bgn_date=buffer_bgn_date, stp_date=stp_date, inputs=own_inputs)
+            if self.shared_inputs:
+                shared_bgn_date = min(grp.buffer_bgn_date(bgn_date, calendar) for grp in self.shared_grps)
+                shared_inputs = self.load_shared_inputs(instru, shared_bgn_date, stp_date)
+                inputs.update(select_inputs(shared_inputs, self.inputs, buffer_bgn_date))
+            rec.rows_out = sum(len(v) for v in inputs.values())
+        return inputs
+
+    def cal_factor_with_inputs(
+        self,
+        instru: str,
+        inputs: dict[str, pd.DataFrame] | None,
+        bgn_date: str,
+        stp_date: str,
+        calendar: CCalendar,
+    ) -> pd.DataFrame:
+        """
+
+        :param inputs: from self.prefetch_inputs
+        :return: the same as self.cal_factor_by_instru
+        """
+        if inputs is None:
+            return self.cal_factor_by_instru(instru, bgn_date, stp_date, calendar)
+        with perf_step("factor", "core", tag=instru) as rec:
+            rec.rows_in = sum(len(v) for v in inputs.values())
+            factor_data = self.cal_factor_from_inputs(instru, inputs, bgn_date, stp_date, calendar)
+            rec.rows_out = len(factor_data)
+        return factor_data
+
     def get_default_factor_data(self) -> pd.DataFrame:
         return pd.DataFrame(columns=["trade_date", "ticker"] + self.factor_grp.factor_names)
 
+    def save_factor_by_instru(self, factor_data: pd.DataFrame, instru: str, calendar: CCalendar):
+        with perf_step("factor", "save", tag=instru) as rec:
+            rec.rows_in = len(factor_data)
+            self.save_by_instru(factor_data, instru, calendar)
+
     def process_by_instru(self, instru: str, bgn_date: str, stp_date: str, calendar: CCalendar):
         factor_data = self.cal_factor_by_instru(instru, bgn_date, stp_date, calendar)
-        self.save_by_instru(factor_data, instru, calendar)
+        self.save_factor_by_instru(factor_data, instru, calendar)
         return 0
 
+    def process_by_instrus(
+        self,
+        instrus: list[str],
+        bgn_date: str,
+        stp_date: str,
+        calendar: CCalendar,
+        on_saved: Callable[[str], Any] | None = None,
+    ) -> list[str]:
+        """
+        Inputs of the next instrument are loaded, and factors of the last one are saved, by background
+        threads while factors of the current one are calculated, see solutions.pipeline.
+
+        :param instrus:
+        :param bgn_date:
+        :param stp_date:
+        :param calendar:
+        :param on_saved: instru -> anything, called after each instrument is saved
+        :return: instruments failed, whose errors are logged, other instruments go on
+        """
+        failed: list[str] = []
+        run_pipeline(
+            items=instrus,
+            load=lambda instru: self.prefetch_inputs(instru, bgn_date, stp_date, calendar),
+            compute=lambda instru, inputs: self.cal_factor_with_inputs(instru, inputs, bgn_date, stp_date, calendar),
+            save=lambda instru, factor_data: self.save_factor_by_instru(factor_data, instru, calendar),
+            on_saved=on_saved,
+            on_error=partial(self.on_instru_error, failed),
+        )
+        return failed
+
+    def on_instru_error(self, failed: list[str], instru: str, e: Exception):
+        logger.exception(f"Factor {SFY(self.factor_grp.factor_class)} of {SFY(instru)} failed: {e!r}")
+        failed.append(instru)
+
+    def raise_if_failed(self, failed: list[str]):
+        if failed:
+            raise RuntimeError(
+                f"Factor {self.factor_grp.factor_class} failed for {len(failed)} instruments: {sorted(failed)}"
+            )
+
+    def write_handoff(self, factor_data: pd.DataFrame, instru: str, handoff_dir: str) -> CFactorHandoff:
+        handoff = CFactorHandoff(
+            instru=instru,
+            dates_path=os.path.join(handoff_dir, f"{instru}.dates.npy"),
+            values_path=os.path.join(handoff_dir, f"{instru}.values.npy"),
+            n_rows=len(factor_data),
+        )
+        np.save(handoff.dates_path, factor_data["trade_date"].to_numpy(dtype="U8"))
+        np.save(handoff.values_path, factor_data[self.factor_grp.factor_names].to_numpy(dtype=np.float64))
+        return handoff
+
+    def read_handoffs(self, handoffs: list[CFactorHandoff]) -> pd.DataFrame:
+        """
+
+        :param handoffs:
+        :return: a pd.DataFrame with columns = ["trade_date", "instrument"] + factor names,
+                 arrays are mapped and copied once into the result
+        """
+        handoffs = [h for h in handoffs if h.n_rows > 0]
+        if not handoffs:
+            return pd.DataFrame(columns=["trade_date", "instrument"] + self.factor_grp.factor_names)
+        values = np.concatenate([np.load(h.values_path, mmap_mode="r") for h in handoffs], axis=0)
+        ref_fac_data = pd.DataFrame(values, columns=self.factor_grp.factor_names)
+        dates = np.concatenate([np.load(h.dates_path, mmap_mode="r") for h in handoffs])
+        ref_fac_data.insert(0, "trade_date", dates.astype(object))
+        ref_fac_data.insert(1, "instrument", np.repeat([h.instru for h in handoffs], [h.n_rows for h in handoffs]))
+        return ref_fac_data
+
+    def process_handoff_by_instrus(
+        self,
+        instrus: list[str],
+        bgn_date: str,
+        stp_date: str,
+        calendar: CCalendar,
+        handoff_dir: str,
+        save_shards: bool,
+        ref_bgn_date: str,
+    ) -> tuple[list[CFactorHandoff], list[str]]:
+        """
+        Like self.process_by_instrus, but results from ref_bgn_date are handed off by files in handoff_dir,
+        and saving shards from bgn_date is optional, both done by the writer thread of the pipeline.
+
+        :return: descriptors of results, in the order of instrus, and instruments failed
+        """
+        cal_bgn_date = min(bgn_date, ref_bgn_date)
+        handoffs: list[CFactorHandoff] = []
+        failed: list[str] = []
+
+        def save(instru: str, factor_data: pd.DataFrame):
+            handoffs.append(
+                self.write_handoff(factor_data[factor_data["trade_date"] >= ref_bgn_date], instru, handoff_dir)
+            )
+            if save_shards:
+                shards_data = factor_data[factor_data["trade_date"] >= bgn_date].reset_index(drop=True)
+                self.save_factor_by_instru(shards_data, instru, calendar)
+
+        run_pipeline(
+            items=instrus,
+            load=lambda instru: self.prefetch_inputs(instru, cal_bgn_date, stp_date, calendar),
+            compute=lambda instru, inputs: self.cal_factor_with_inputs(
+                instru, inputs, cal_bgn_date, stp_date, calendar
+            ),
+            save=save,
+            on_error=partial(self.on_instru_error, failed),
+        )
+        return handoffs, failed
+
+    def main_handoff(
+        self,
+        bgn_date: str,
+        stp_date: str,
+        calendar: CCalendar,
+        call_multiprocess: bool,
+        processes: int,
+        save_shards: bool = True,
+        ref_bgn_date: str | None = None,
+    ) -> pd.DataFrame:
+        """
+        Workers hand off results by memory-mapped files and return only descriptors, so the parent
+        gets factors of all instruments without reading shards back, like CFactorsPanel.main_panel.
+
+        :param bgn_date:
+        :param stp_date:
+        :param calendar:
+        :param call_multiprocess:
+        :param processes:
+        :param save_shards: whether to save results to by-instrument databases, as self.main does
+        :param ref_bgn_date: results are returned from this date, like the buffer begin date
+                             of CFactorsAvlb, default is bgn_date
+        :return: a pd.DataFrame with columns = ["trade_date", "instrument"] + factor names,
+                 same as CFactorsAvlb.load_ref_fac
+        """
+        ref_bgn_date = ref_bgn_date or bgn_date
+        tag = self.factor_grp.factor_class
+        description = f"Calculating factor {SFY(tag)}"
+        instrus = list(self.universe)
+        handoff_dir = tempfile.mkdtemp(prefix=f"handoff-{tag}-")
+        args = (bgn_date, stp_date, calendar, handoff_dir, save_shards, ref_bgn_date)
+        try:
+            if call_multiprocess:
+                n_chunks = min(len(instrus), 2 * (processes or os.cpu_count() or 1))
+                chunks = [instrus[i::n_chunks] for i in range(n_chunks)]
+                with Progress() as pb:
+                    main_task = pb.add_task(description, total=len(instrus))
+                    with self.single_writer(processes), mp.get_context("spawn").Pool(processes) as pool:
+                        jobs = [
+                            pool.apply_async(
+                                self.process_handoff_by_instrus,
+                                args=(chunk, *args),
+                                callback=lambda _, n=len(chunk): pb.update(main_task, advance=n),
+                                error_callback=error_handler,
+                            )
+                            for chunk in chunks
+                        ]
+                        pool.close()
+                        pool.join()
+                handoffs, failed = [], []
+                for chunk, job in zip(chunks, jobs):
+                    # a chunk failed as a whole, like by pickling, loses all its instruments
+                    chunk_handoffs, chunk_failed = job.get() if job.successful() else ([], chunk)
+                    handoffs += chunk_handoffs
+                    failed += chunk_failed
+            else:
+                handoffs, failed = self.process_handoff_by_instrus(instrus, *args)
+            self.raise_if_failed(failed)
+            with perf_step("factor", "handoff", tag=tag) as rec:
+                ref_fac_data = self.read_handoffs(handoffs)
+                rec.rows_out = len(ref_fac_data)
+        finally:
+            shutil.rmtree(handoff_dir, ignore_errors=True)
+        return ref_fac_data
+
     def main(self, bgn_date: str, stp_date: str, calendar: CCalendar, call_multiprocess: bool, processes: int):
         description = f"Calculating factor {SFY(self.factor_grp.factor_class)}"
+        instrus = list(self.universe)
         if call_multiprocess:
+            # each worker runs a pipeline over a chunk, 2 chunks per process keep the load balanced
+            n_chunks = min(len(instrus), 2 * (processes or os.cpu_count() or 1))
+            chunks = [instrus[i::n_chunks] for i in range(n_chunks)]
             with Progress() as pb:
-                main_task = pb.add_task(description, total=len(self.universe))
-                with mp.get_context("spawn").Pool(processes) as pool:
-                    for instru in self.universe:
+                main_task = pb.add_task(description, total=len(instrus))
+                with self.single_writer(processes), mp.get_context("spawn").Pool(processes) as pool:
+                    jobs = [
                         pool.apply_async(
-                            self.process_by_instru,
-                            args=(instru, bgn_date, stp_date, calendar),
-                            callback=lambda _: pb.update(main_task, advance=1),
+                            self.process_by_instrus,
+                            args=(chunk, bgn_date, stp_date, calendar),
+                            callback=lambda _, n=len(chunk): pb.update(main_task, advance=n),
                             error_callback=error_handler,
                         )
+                        for chunk in chunks
+                    ]
                     pool.close()
                     pool.join()
+            failed = []
+            for chunk, job in zip(chunks, jobs):
+                # a chunk failed as a whole, like by pickling, loses all its instruments
+                failed += job.get() if job.successful() else chunk
         else:
-            for instru in track(self.universe, description=description):
-                self.process_by_instru(instru, bgn_date, stp_date, calendar)
+            with Progress() as pb:
+                main_task = pb.add_task(description, total=len(instrus))
+                failed = self.process_by_instrus(
+                    instrus, bgn_date, stp_date, calendar, on_saved=lambda _: pb.update(main_task, advance=1)
+                )
+        self.raise_if_failed(failed)
+        return 0
+
+
+def select_inputs(
+    shared_inputs: dict[str, pd.DataFrame], inputs: TFactorInputs, bgn_date: str
+) -> dict[str, pd.DataFrame]:
+    """
+
+    :param shared_inputs: inputs loaded for several factor classes
+    :param inputs: inputs declared by one factor class, sources not in shared_inputs are skipped
+    :param bgn_date: buffer begin date of this factor class
+    :return: projection of shared_inputs, begin from bgn_date
+    """
+    res: dict[str, pd.DataFrame] = {}
+    for source, columns in inputs.items():
+        if source not in shared_inputs:
+            continue
+        data = shared_inputs[source]
+        data = data[data["trade_date"] >= bgn_date]
+        res[source] = data[["trade_date"] + [c for c in columns if c != "trade_date"]].reset_index(drop=True)
+    return res
+
+
+def share_inputs(facs: list[CFactorsByInstru]) -> int:
+    """
+    For factor classes run one after another in this run, each source declared by more than one of
+    them is loaded once for each instrument, with union of declared columns and from the earliest
+    buffer begin date, then each class selects its own columns and dates.
+    The loaded data is passed by the run dir of shared_inputs, so enable_shared_cache is expected,
+    otherwise each class still loads the union by itself.
+
+    :param facs: factor classes of this run, those not declaring inputs are skipped
+    :return: number of factor classes sharing some inputs
+    """
+    declared = [fac for fac in facs if fac.inputs]
+    counts: dict[str, int] = {}
+    for fac in declared:
+        for source in fac.inputs:
+            counts[source] = counts.get(source, 0) + 1
+    sharing = [fac for fac in declared if any(counts[source] > 1 for source in fac.inputs)]
+    if not sharing:
+        return 0
+    merged = merge_factor_inputs(*[fac.inputs for fac in sharing])
+    shared = {source: columns for source, columns in merged.items() if counts[source] > 1}
+    for fac in sharing:
+        fac.shared_inputs = shared
+        fac.shared_grps = [f.factor_grp for f in sharing]
+    logger.info(f"Inputs of {SFG(list(shared))} are shared by {SFY(len(sharing))} factor classes")
+    return len(sharing)
+
+
+"""
+--------------------------------------------------------
+--- factors calculated for all instruments at once ---
+--------------------------------------------------------
+"""
+
+# sources with one row for each trade date, which could be pivoted to wide frames
+PANEL_SOURCES: tuple[str, ...] = ("preprocess",)
+
+
+class CFactorsPanel(CFactorsByInstru):
+    """
+    For daily-bar factors, the math for all instruments is done in one vectorised call on
+    (trade_date x instrument) wide frames, instead of one call for each instrument.
+    "ticker_major" must be declared in preprocess inputs, to label tickers of results.
+    By-instrument interfaces are kept, a single instrument is calculated as a panel of one column.
+    Rows absent from the shard of an instrument are nan in the panel, so rolling windows should be
+    over rows of each instrument, see self.get_present, to give the same results as a single one.
+    """
+
+    @staticmethod
+    def get_present(panel: dict[str, pd.DataFrame]) -> pd.DataFrame:
+        """
+
+        :param panel: from self.to_panel
+        :return: bool wide frame, whether an instrument has a row of a date, as self.panel_to_long treats it
+        """
+        return panel["ticker_major"].notna()
+
+    def cal_factor_panel(
+        self,
+        panel: dict[str, pd.DataFrame],
+        bgn_date: str,
+        stp_date: str,
+        calendar: CCalendar,
+    ) -> dict[TFactorName, pd.DataFrame]:
+        """
+        This function is to be realized by specific factors which declare self.inputs
+
+        :param panel: column -> wide frame with index = trade_date, columns = instruments, from buffer begin date
+        :param bgn_date:
+        :param stp_date:
+        :param calendar:
+        :return: factor name -> wide frame with the same index and columns of panel
+        """
+        raise NotImplementedError
+
+    def to_panel(self, inputs_by_instru: dict[str, dict[str, pd.DataFrame]]) -> dict[str, pd.DataFrame]:
+        """
+
+        :param inputs_by_instru: instrument -> source -> data, as returned by self.load_inputs
+        :return: column -> wide frame with index = trade_date, columns = instruments
+        """
+        columns: dict[str, dict[str, pd.Series]] = {}
+        for instru, inputs in inputs_by_instru.items():
+            for source, data in inputs.items():
+                if source not in PANEL_SOURCES:
+                    raise ValueError(f"Source {source} is not supported by panel factors")
+                data = data.set_index("trade_date")
+                if data.index.has_duplicates:
+                    raise ValueError(f"Duplicated trade dates found in {source} of {instru}")
+                for col in data.columns:
+                    columns.setdefault(col, {})[instru] = data[col]
+        if "ticker_major" not in columns:
+            raise ValueError(f"Factor {self.factor_grp.factor_class} must declare 'ticker_major' in preprocess")
+        instrus = list(inputs_by_instru)
+        return {col: pd.concat(srs, axis=1).sort_index().reindex(columns=instrus) for col, srs in columns.items()}
+
+    def panel_to_long(
+        self, factors_panel: dict[TFactorName, pd.DataFrame], tickers: pd.DataFrame, bgn_date: str
+    ) -> pd.DataFrame:
+        """
+
+        :param factors_panel: returned by self.cal_factor_panel
+        :param tickers: wide frame of ticker_major
+        :param bgn_date:
+        :return: a pd.DataFrame with columns = ["trade_date", "instrument", "ticker"] + factor names,
+                 sorted by (trade_date, instrument), dates without input data of an instrument are dropped
+        """
+        dates, instrus = tickers.index, tickers.columns
+        factor_data = pd.DataFrame(
+            {
+                "trade_date": np.repeat(dates.to_numpy(), len(instrus)),
+                "instrument": np.tile(instrus.to_numpy(), len(dates)),
+                "ticker": tickers.to_numpy().ravel(),
+            }
+        )
+        for factor_name in self.factor_grp.factor_names:
+            panel = factors_panel[factor_name].reindex(index=dates, columns=instrus)
+            factor_data[factor_name] = panel.to_numpy(dtype=np.float64).ravel()
+        factor_data = factor_data[factor_data["ticker"].notna() & (factor_data["trade_date"] >= bgn_date)]
+        return factor_data.reset_index(drop=True)
+
+    def cal_factor_from_inputs(
+        self,
+        instru: str,
+        inputs: dict[str, pd.DataFrame],
+        bgn_date: str,
+        stp_date: str,
+        calendar: CCalendar,
+    ) -> pd.DataFrame:
+        panel = self.to_panel({instru: inputs})
+        factors_panel = self.cal_factor_panel(panel, bgn_date, stp_date, calendar)
+        factor_data = self.panel_to_long(factors_panel, panel["ticker_major"], bgn_date)
+        return factor_data[["trade_date", "ticker"] + self.factor_grp.factor_names]
+
+    def main_panel(
+        self,
+        bgn_date: str,
+        stp_date: str,
+        calendar: CCalendar,
+        save_shards: bool = True,
+        ref_bgn_date: str | None = None,
+    ) -> pd.DataFrame:
+        """
+
+        :param bgn_date:
+        :param stp_date:
+        :param calendar:
+        :param save_shards: whether to save results to by-instrument databases, as self.main does
+        :param ref_bgn_date: results are returned from this date, like the buffer begin date
+                             of CFactorsAvlb, default is bgn_date
+        :return: a pd.DataFrame with columns = ["trade_date", "instrument"] + factor names,
+                 same as CFactorsAvlb.load_ref_fac
+        """
+        ref_bgn_date = ref_bgn_date or bgn_date
+        cal_bgn_date = min(bgn_date, ref_bgn_date)
+        buffer_bgn_date = self.factor_grp.buffer_bgn_date(cal_bgn_date, calendar)
+        tag = self.factor_grp.factor_class
+        description = f"Loading inputs of factor {SFY(tag)}"
+        with perf_step("factor", "load", tag=tag) as rec:
+            inputs_by_instru = {
+                instru: self.load_inputs(instru, bgn_date=buffer_bgn_date, stp_date=stp_date)
+                for instru in track(self.universe, description=description)
+            }
+            panel = self.to_panel(inputs_by_instru)
+            rec.rows_out = panel["ticker_major"].notna().sum().sum()
+        with perf_step("factor", "core", tag=tag) as rec:
+            rec.rows_in = panel["ticker_major"].notna().sum().sum()
+            factors_panel = self.cal_factor_panel(panel, cal_bgn_date, stp_date, calendar)
+            factor_data = self.panel_to_long(factors_panel, panel["ticker_major"], cal_bgn_date)
+            rec.rows_out = len(factor_data)
+        if save_shards:
+            with perf_step("factor", "save", tag=tag) as rec:
+                shards_data = factor_data[factor_data["trade_date"] >= bgn_date]
+                rec.rows_in = len(shards_data)
+                for instru, instru_data in shards_data.groupby(by="instrument"):
+                    instru_data = instru_data[["trade_date", "ticker"] + self.factor_grp.factor_names]
+                    self.save_by_instru(instru_data.reset_index(drop=True), instru, calendar)
+        ref_fac_data = factor_data[factor_data["trade_date"] >= ref_bgn_date]
+        return ref_fac_data[["trade_date", "instrument"] + self.factor_grp.factor_names].reset_index(drop=True)
+
+    def main(self, bgn_date: str, stp_date: str, calendar: CCalendar, call_multiprocess: bool, processes: int):
+        # vectorised over instruments already, multiprocess is not needed
+        self.main_panel(bgn_date, stp_date, calendar, save_shards=True)
         return 0
 
 
@@ -283,35 +844,34 @@ class CFactorsAvlb(_CFactorsByInstruDbOperator):
         self.factors_avlb_sig_dir = factors_avlb_sig_dir
         self.factors_avlb_ewa_dir = factors_avlb_ewa_dir
         self.db_struct_avlb = db_struct_avlb
+        self.codebook = CUniverseCodebook.from_universe(universe)
+
+    def get_ref_bgn_date(self, bgn_date: str, calendar: CCalendar) -> str:
+        # buffer for moving average
+        return calendar.get_next_date(bgn_date, shift=-self.factor_grp.decay.win + 1)
 
     def load_ref_fac(self, bgn_date: str, stp_date: str, calendar: CCalendar) -> pd.DataFrame:
-        buffer_bgn_date = calendar.get_next_date(bgn_date, shift=-self.factor_grp.decay.win + 1)
-        ref_dfs: list[pd.DataFrame] = []
-        for instru in self.universe:
-            df = self.load_by_instru(instru, bgn_date=buffer_bgn_date, stp_date=stp_date)
+        buffer_bgn_date = self.get_ref_bgn_date(bgn_date, calendar)
+        ref_dfs: list[pd.DataFrame] = map_loaders(
+            partial(self.load_by_instru, bgn_date=buffer_bgn_date, stp_date=stp_date), self.universe
+        )
+        for instru, df in zip(self.universe, ref_dfs):
             df["instrument"] = instru
-            ref_dfs.append(df)
         res = pd.concat(ref_dfs, axis=0, ignore_index=False)
         res = res.reset_index().sort_values(by=["trade_date"], ascending=True)
         res = res[["trade_date", "instrument"] + self.factor_grp.factor_names]
-        return res
+        return self.codebook.encode_known(res, source=self.factor_grp.factor_class)
 
     def load_available(self, bgn_date: str, stp_date: str, calendar: CCalendar) -> pd.DataFrame:
-        buffer_bgn_date = calendar.get_next_date(bgn_date, shift=-self.factor_grp.decay.win + 1)
-        sqldb = CMgrSqlDb(
-            db_save_dir=self.db_struct_avlb.db_save_dir,
-            db_name=self.db_struct_avlb.db_name,
-            table=self.db_struct_avlb.table,
-            mode="r",
-        )
-        avlb_data = sqldb.read_by_range(bgn_date=buffer_bgn_date, stp_date=stp_date)
+        buffer_bgn_date = self.get_ref_bgn_date(bgn_date, calendar)
+        avlb_data = read_by_range(self.db_struct_avlb, bgn_date=buffer_bgn_date, stp_date=stp_date)
         avlb_data = avlb_data[["trade_date", "instrument", "sectorL1"]]
-        return avlb_data
+        return self.codebook.encode_known(avlb_data, source=self.db_struct_avlb.db_name)
 
     def fillna_by_sector(self, avlb_i_data: pd.DataFrame) -> pd.DataFrame:
         grp_keys = ["trade_date", "sectorL1"]
         o_data = (
-            avlb_i_data.groupby(by=grp_keys)[self.factor_grp.factor_names]
+            avlb_i_data.groupby(by=grp_keys, observed=True)[self.factor_grp.factor_names]
             .apply(lambda z: z.fillna(z.mean()))
             .reset_index(level=grp_keys)
         )
@@ -397,7 +957,7 @@ class CFactorsAvlb(_CFactorsByInstruDbOperator):
         grp_keys = ["instrument"]
         win, wgt = self.factor_grp.decay.win, self.factor_grp.decay.wgt
         o_data = (
-            avlb_i_data.groupby(by=grp_keys)[self.factor_grp.factor_names]  # type:ignore
+            avlb_i_data.groupby(by=grp_keys, observed=True)[self.factor_grp.factor_names]  # type:ignore
             .apply(__mov_ave, w=wgt)
             .reset_index(level=grp_keys)
         )
@@ -426,7 +986,7 @@ class CFactorsAvlb(_CFactorsByInstruDbOperator):
             raise ValueError(f"len of raw data = {l0}  != len of neu data = {l1}.")
         return avlb_o_data
 
-    def save(self, new_data: pd.DataFrame, calendar: CCalendar, save_type: Literal["raw", "sig", "ewa"]):
+    def get_avlb_db(self, save_type: Literal["raw", "sig", "ewa"]) -> CDbStruct:
         if save_type == "raw":
             factors_avlb_dir = self.factors_avlb_raw_dir
         elif save_type == "sig":
@@ -435,53 +995,104 @@ class CFactorsAvlb(_CFactorsByInstruDbOperator):
             factors_avlb_dir = self.factors_avlb_ewa_dir
         else:
             raise ValueError(f"Invalid save_type {save_type}")
-        db_struct_fac = gen_factors_avlb_db(
+        return gen_factors_avlb_db(
             factors_avlb_dir=factors_avlb_dir,
             factor_class=self.factor_grp.factor_class,
             factors=self.factor_grp.factors,
         )
-        check_and_makedirs(db_struct_fac.db_save_dir)
-        sqldb = CMgrSqlDb(
-            db_save_dir=db_struct_fac.db_save_dir,
-            db_name=db_struct_fac.db_name,
-            table=db_struct_fac.table,
-            mode="a",
-        )
-        if sqldb.check_continuity(new_data["trade_date"].iloc[0], calendar) == 0:
-            instru_tst_ret_agg_data = new_data[db_struct_fac.table.vars.names]
-            sqldb.update(update_data=instru_tst_ret_agg_data)
+
+    def save(
+        self,
+        new_data: pd.DataFrame,
+        calendar: CCalendar,
+        save_type: Literal["raw", "sig", "ewa"],
+        replace_range: tuple[str, str] | None = None,
+    ):
+        db_struct_fac = self.get_avlb_db(save_type)
+        new_data = sort_canonical(new_data)
+        if replace_range is not None:
+            save_splice(db_struct_fac, new_data[db_struct_fac.table.vars.names], *replace_range)
+        else:
+            save_with_continuity(db_struct_fac, new_data[db_struct_fac.table.vars.names], calendar)
         return 0
 
-    def main(self, bgn_date: str, stp_date: str, calendar: CCalendar):
+    def main(
+        self,
+        bgn_date: str,
+        stp_date: str,
+        calendar: CCalendar,
+        ref_fac_data: pd.DataFrame | None = None,
+        splice: bool = False,
+    ):
+        """
+
+        :param bgn_date:
+        :param stp_date:
+        :param calendar:
+        :param ref_fac_data: factor data from self.get_ref_bgn_date(bgn_date), with columns =
+                             ["trade_date", "instrument"] + factor names, like the results of
+                             CFactorsPanel.main_panel. If None, it is loaded from by-instrument databases.
+        :param splice: whether to replace [bgn_date, stp_date) of saved data, for repairs
+        :return:
+        """
+        replace_range = (bgn_date, stp_date) if splice else None
         logger.info(f"Calculate available factor {SFG(self.factor_grp.factor_class)}")
+        tag = self.factor_grp.factor_class
+
         # avlb raw
-        ref_fac_data = self.load_ref_fac(bgn_date, stp_date, calendar)
-        available_data = self.load_available(bgn_date, stp_date, calendar)
-        fac_avlb_raw_data = pd.merge(
-            left=available_data,
-            right=ref_fac_data,
-            on=["trade_date", "instrument"],
-            how="left",
-        ).sort_values(by=["trade_date", "sectorL1"])
+        with perf_step("factors_avlb", "load", tag=tag) as rec:
+            if ref_fac_data is None:
+                ref_fac_data = self.load_ref_fac(bgn_date, stp_date, calendar)
+            else:
+                ref_fac_data = self.codebook.encode_known(ref_fac_data, source=self.factor_grp.factor_class)
+            available_data = self.load_available(bgn_date, stp_date, calendar)
+            rec.rows_out = len(ref_fac_data) + len(available_data)
+        with perf_step("factors_avlb", "merge", tag=tag) as rec:
+            rec.rows_in = len(ref_fac_data) + len(available_data)
+            fac_avlb_raw_data = pd.merge(
+                left=available_data,
+                right=ref_fac_data,
+                on=["trade_date", "instrument"],
+                how="left",
+            ).sort_values(by=["trade_date", "sectorL1"])
+            rec.rows_out = len(fac_avlb_raw_data)
 
         # avlb nrm
         logger.info(f"Fill and Normalize available factor {SFG(self.factor_grp.factor_class)}")
-        fac_avlb_fil_data = self.fillna_by_sector(fac_avlb_raw_data)
-        fac_avlb_nrm_data = self.normalize(fac_avlb_fil_data)
+        with perf_step("factors_avlb", "fillna_by_sector", tag=tag) as rec:
+            rec.rows_in = len(fac_avlb_raw_data)
+            fac_avlb_fil_data = self.fillna_by_sector(fac_avlb_raw_data)
+            rec.rows_out = len(fac_avlb_fil_data)
+        with perf_step("factors_avlb", "normalize", tag=tag) as rec:
+            rec.rows_in = len(fac_avlb_fil_data)
+            fac_avlb_nrm_data = self.normalize(fac_avlb_fil_data)
+            rec.rows_out = len(fac_avlb_nrm_data)
         save_avlb_nrm_data = fac_avlb_nrm_data.query(f"trade_date >= '{bgn_date}'")
-        self.save(save_avlb_nrm_data, calendar, save_type="raw")
+        with perf_step("factors_avlb", "save", tag=f"{tag}-raw") as rec:
+            rec.rows_in = len(save_avlb_nrm_data)
+            self.save(save_avlb_nrm_data, calendar, save_type="raw", replace_range=replace_range)
 
         # avlb sig
         logger.info(f"Calculate signal from available factor {SFG(self.factor_grp.factor_class)}")
-        fac_avlb_sig_data = self.convert_to_signal(fac_avlb_nrm_data)
+        with perf_step("factors_avlb", "convert_to_signal", tag=tag) as rec:
+            rec.rows_in = len(fac_avlb_nrm_data)
+            fac_avlb_sig_data = self.convert_to_signal(fac_avlb_nrm_data)
+            rec.rows_out = len(fac_avlb_sig_data)
         save_avlb_sig_data = fac_avlb_sig_data.query(f"trade_date >= '{bgn_date}'")
-        self.save(save_avlb_sig_data, calendar, save_type="sig")
+        with perf_step("factors_avlb", "save", tag=f"{tag}-sig") as rec:
+            rec.rows_in = len(save_avlb_sig_data)
+            self.save(save_avlb_sig_data, calendar, save_type="sig", replace_range=replace_range)
 
         # avlb ewa
         logger.info(f"Moving average available factor {SFG(self.factor_grp.factor_class)}")
-        fac_avlb_ewa_data = self.ewa(fac_avlb_sig_data)
+        with perf_step("factors_avlb", "ewa", tag=tag) as rec:
+            rec.rows_in = len(fac_avlb_sig_data)
+            fac_avlb_ewa_data = self.ewa(fac_avlb_sig_data)
+            rec.rows_out = len(fac_avlb_ewa_data)
         save_avlb_ewa_data = fac_avlb_ewa_data.query(f"trade_date >= '{bgn_date}'")
-        self.save(save_avlb_ewa_data, calendar, save_type="ewa")
+        with perf_step("factors_avlb", "save", tag=f"{tag}-ewa") as rec:
+            rec.rows_in = len(save_avlb_ewa_data)
+            self.save(save_avlb_ewa_data, calendar, save_type="ewa", replace_range=replace_range)
 
         logger.info(f"All done for factor {SFG(self.factor_grp.factor_class)}")
         return 0
@@ -509,82 +1120,12 @@ class CFactorsLoader:
             factor_class=self.factor_class,
             factors=self.factors,
         )
-        sqldb = CMgrSqlDb(
-            db_save_dir=db_struct_fac.db_save_dir,
-            db_name=db_struct_fac.db_name,
-            table=db_struct_fac.table,
-            mode="r",
+        data = read_by_range(
+            db_struct_fac, bgn_date, stp_date, value_columns=self.value_columns, order_by=KEY_COLUMNS
         )
-        data = sqldb.read_by_range(bgn_date, stp_date, value_columns=self.value_columns)
         return data
 
 
-"""
-------------------------------------
---- Management tools for factors ---
-------------------------------------
-"""
-
-
-class CCfgFactors:
-    def __init__(self, algs_dir: str, cfg_data: dict, factor_decay_default: dict[str, int | float]):
-        self.mgr: dict[str, tuple[CCfgFactorGrp, type[CFactorsByInstru]]] = {}
-        for module in os.listdir(algs_dir):
-            if module.endswith(".py"):
-                module_name = module[:-3]  # exclude ".py"
-                factor_class = module_name.upper()  # "mtm" -> "MTM"
-                module_path = f"{algs_dir}.{module_name}"
-                module_contents = __import__(module_path)
-                type_cfg = getattr(module_contents.__dict__[module_name], f"CCfgFactorGrp{factor_class}")
-                type_fac = getattr(module_contents.__dict__[module_name], f"CFactor{factor_class}")
-                d = cfg_data[factor_class]
-                d["decay"] = CDecay(**d.get("decay", factor_decay_default))
-                wins, lbds = d["args"].get("wins", None), d["args"].get("lbds", None)
-                if type_cfg.__base__ == CCfgFactorGrpWin:
-                    d["args"] = CArgsWin(wins=wins)
-                elif type_cfg.__base__ == CCfgFactorGrpWinLbd:
-                    d["args"] = CArgsWinLbd(wins=wins, lbds=lbds)
-                elif type_cfg.__base__ == CCfgFactorGrpLbd:
-                    d["args"] = CArgsLbd(lbds=lbds)
-                else:
-                    raise TypeError(f"Unsupported type: {type_cfg.__base__}")
-                self.mgr[factor_class] = (type_cfg(**d), type_fac)
-
-    def __repr__(self):
-        r, fi = "", 0
-        for factor_class, (cfg, fac) in self.mgr.items():
-            r += f"{fi:>02d}:{factor_class:<10s}: ({cfg}, {fac})\n"
-            fi += 1
-        return r
-
-    def get_cfgs(self) -> list[CCfgFactorGrp]:
-        return [z[0] for z in self.mgr.values()]
-
-    def get_cfg(self, factor_class: str) -> CCfgFactorGrp:
-        return self.mgr[factor_class][0]
-
-    def get_fac(self, factor_class: str) -> type[CFactorsByInstru]:
-        return self.mgr[factor_class][1]
-
-    def get_cfg_and_fac(self, factor_class: str) -> tuple[CCfgFactorGrp, type[CFactorsByInstru]]:
-        return self.mgr[factor_class]
-
-    @property
-    def classes(self) -> list[str]:
-        return list(self.mgr.keys())
-
-    def match_class(self, factor_name: TFactorName) -> TFactorClass | None:
-        for factor_class, (cfg, _) in self.mgr.items():
-            if factor_name in cfg.factor_names:
-                return TFactorClass(factor_class)
-        raise ValueError(f"No factor named {factor_name}")
-
-    def match_factor(self, factor_name: TFactorName) -> CFactor:
-        factor_class = self.match_class(factor_name)
-        factor = CFactor(factor_class, factor_name)
-        return factor
-
-
 def pick_factor(
     fclass: TFactorClass,
     cfg_factors: CCfgFactors,
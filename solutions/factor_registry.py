@@ -0,0 +1,104 @@
+"""
+------------------------------------
+--- Management tools for factors ---
+------------------------------------
+
+This module is imported at startup (by config.py and main.py), so it must stay light:
+factor modules and their heavy dependencies are imported only when a factor class is requested.
+"""
+
+import os
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typedefs.typedef_factors import CCfgFactorGrp, TFactorClass, TFactorName, CFactor
+    from solutions.factor import CFactorsByInstru
+
+
+def discover_factor_classes(algs_dir: str) -> list[str]:
+    """
+
+    :param algs_dir: directory of factor modules, like "factor_algs_activated"
+    :return: factor classes derived from file names, "reoc.py" -> "REOC", no module is imported
+    """
+    return [m[:-3].upper() for m in sorted(os.listdir(algs_dir)) if m.endswith(".py") and not m.startswith("_")]
+
+
+class CCfgFactors:
+    def __init__(self, algs_dir: str, cfg_data: dict, factor_decay_default: dict[str, int | float]):
+        self.algs_dir = algs_dir
+        self.cfg_data = cfg_data
+        self.factor_decay_default = factor_decay_default
+        self.__classes = discover_factor_classes(algs_dir)
+        self.mgr: dict[str, tuple["CCfgFactorGrp", type["CFactorsByInstru"]]] = {}  # filled on demand
+
+    def __load(self, factor_class: str) -> tuple["CCfgFactorGrp", type["CFactorsByInstru"]]:
+        if factor_class in self.mgr:
+            return self.mgr[factor_class]
+        if factor_class not in self.__classes:
+            raise KeyError(f"No factor class named {factor_class} in {self.algs_dir}")
+
+        from typedefs.typedef_factors import (
+            CArgsWin,
+            CArgsWinLbd,
+            CArgsLbd,
+            CCfgFactorGrpWin,
+            CCfgFactorGrpWinLbd,
+            CCfgFactorGrpLbd,
+            CDecay,
+        )
+
+        module_name = factor_class.lower()  # "MTM" -> "mtm"
+        module_contents = importlib.import_module(f"{self.algs_dir}.{module_name}")
+        type_cfg = getattr(module_contents, f"CCfgFactorGrp{factor_class}")
+        type_fac = getattr(module_contents, f"CFactor{factor_class}")
+        d = dict(self.cfg_data[factor_class])
+        d["decay"] = CDecay(**d.get("decay", self.factor_decay_default))
+        wins, lbds = d["args"].get("wins", None), d["args"].get("lbds", None)
+        if type_cfg.__base__ == CCfgFactorGrpWin:
+            d["args"] = CArgsWin(wins=wins)
+        elif type_cfg.__base__ == CCfgFactorGrpWinLbd:
+            d["args"] = CArgsWinLbd(wins=wins, lbds=lbds)
+        elif type_cfg.__base__ == CCfgFactorGrpLbd:
+            d["args"] = CArgsLbd(lbds=lbds)
+        else:
+            raise TypeError(f"Unsupported type: {type_cfg.__base__}")
+        self.mgr[factor_class] = (type_cfg(**d), type_fac)
+        return self.mgr[factor_class]
+
+    def __repr__(self):
+        r = ""
+        for fi, factor_class in enumerate(self.classes):
+            cfg, fac = self.__load(factor_class)
+            r += f"{fi:>02d}:{factor_class:<10s}: ({cfg}, {fac})\n"
+        return r
+
+    def get_cfgs(self) -> list["CCfgFactorGrp"]:
+        return [self.__load(factor_class)[0] for factor_class in self.classes]
+
+    def get_cfg(self, factor_class: str) -> "CCfgFactorGrp":
+        return self.__load(factor_class)[0]
+
+    def get_fac(self, factor_class: str) -> type["CFactorsByInstru"]:
+        return self.__load(factor_class)[1]
+
+    def get_cfg_and_fac(self, factor_class: str) -> tuple["CCfgFactorGrp", type["CFactorsByInstru"]]:
+        return self.__load(factor_class)
+
+    @property
+    def classes(self) -> list[str]:
+        return list(self.__classes)
+
+    def match_class(self, factor_name: "TFactorName") -> "TFactorClass":
+        for factor_class, cfg in zip(self.classes, self.get_cfgs()):
+            if factor_name in cfg.factor_names:
+                return factor_class
+        raise ValueError(f"No factor named {factor_name}")
+
+    def match_factor(self, factor_name: "TFactorName") -> "CFactor":
+        from typedefs.typedef_factors import CFactor
+
+        factor_class = self.match_class(factor_name)
+        factor = CFactor(factor_class, factor_name)
+        return factor
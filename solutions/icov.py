@@ -1,11 +1,14 @@
 import numpy as np
 import pandas as pd
-from husfort.qutility import check_and_makedirs, SFG
+from husfort.qutility import SFG
 from husfort.qcalendar import CCalendar
-from husfort.qsqlite import CDbStruct, CMgrSqlDb
+from husfort.qsqlite import CDbStruct
 from husfort.qlog import logger
 from typedefs.typedef_instrus import TUniverse
 from typedef import CCfgICov
+from solutions.perf import perf_step
+from solutions.db_io import save_with_continuity, save_splice, save_bulk, read_by_range
+from solutions.panel_store import read_preprocess_panel
 
 
 class CICOVReader:
@@ -13,13 +16,7 @@ class CICOVReader:
         self.db_struct_icov = db_struct_icov
 
     def read(self, bgn_date: str, stp_date: str) -> pd.DataFrame:
-        sqldb = CMgrSqlDb(
-            db_save_dir=self.db_struct_icov.db_save_dir,
-            db_name=self.db_struct_icov.db_name,
-            table=self.db_struct_icov.table,
-            mode="r",
-        )
-        data = sqldb.read_by_range(bgn_date, stp_date)
+        data = read_by_range(self.db_struct_icov, bgn_date, stp_date)
         return data
 
 
@@ -36,24 +33,11 @@ class CICOV(CICOVReader):
         self.universe = universe
         self.db_struct_preprocess = db_struct_preprocess
 
-    def load_rets_by_instru(self, instru: str, bgn_date: str, stp_date: str) -> pd.DataFrame:
-        db_struct_instru = self.db_struct_preprocess.copy_to_another(another_db_name=f"{instru}.db")
-        sqldb = CMgrSqlDb(
-            db_save_dir=db_struct_instru.db_save_dir,
-            db_name=db_struct_instru.db_name,
-            table=db_struct_instru.table,
-            mode="r",
-        )
-        amt_data = sqldb.read_by_range(bgn_date, stp_date, value_columns=["trade_date", "return_c_major"])
-        amt_data = amt_data.rename(columns={"return_c_major": instru}).set_index("trade_date")
-        return amt_data
-
     def load_rets(self, bgn_date: str, stp_date: str) -> pd.DataFrame:
-        instru_data: list[pd.DataFrame] = []
-        for instru in self.universe:
-            instru_data.append(self.load_rets_by_instru(instru, bgn_date, stp_date))
-        rets = pd.concat(instru_data, axis=1, ignore_index=False).fillna(0)
-        return rets
+        rets = read_preprocess_panel(
+            self.db_struct_preprocess, "return_c_major", bgn_date, stp_date, instruments=list(self.universe)
+        )
+        return rets.fillna(0)
 
     @staticmethod
     def reformat(icov_square: pd.DataFrame, bgn_date: str) -> pd.DataFrame:
@@ -74,24 +58,79 @@ class CICOV(CICOVReader):
         icov = icov.sort_values(["trade_date", "i0", "i1"], ascending=True)
         return icov
 
-    def save(self, icov: pd.DataFrame, bgn_date: str, calendar: CCalendar):
-        check_and_makedirs(self.db_struct_icov.db_save_dir)
-        sqldb = CMgrSqlDb(
-            db_save_dir=self.db_struct_icov.db_save_dir,
-            db_name=self.db_struct_icov.db_name,
-            table=self.db_struct_icov.table,
-            mode="a",
-        )
-        if sqldb.check_continuity(bgn_date, calendar) == 0:
-            sqldb.update(update_data=icov)
+    def save(
+        self, icov: pd.DataFrame, bgn_date: str, calendar: CCalendar, replace_range: tuple[str, str] | None = None
+    ):
+        if replace_range is not None:
+            save_splice(self.db_struct_icov, icov, *replace_range)
+        else:
+            save_with_continuity(self.db_struct_icov, icov, calendar, bgn_date=bgn_date)
         return 0
 
-    def main(self, bgn_date: str, stp_date: str, calendar: CCalendar):
+    def cal_pairs_of(self, instru: str, bgn_date: str, stp_date: str, calendar: CCalendar) -> pd.DataFrame:
+        """
+        Covariance between instru and each instrument of the universe, which is the row and column of
+        instru in the matrix, so only N pairs are calculated instead of N^2.
+
+        :param instru:
+        :param bgn_date:
+        :param stp_date:
+        :param calendar:
+        :return: a pd.DataFrame with the same columns as self.reformat
+        """
         buffer_bgn_date = calendar.get_next_date(bgn_date, shift=-self.cfg_icov.win + 1)
         rets = self.load_rets(buffer_bgn_date, stp_date)
-        icov_square = rets.rolling(self.cfg_icov.win).cov() * 1e4
-        icov = self.reformat(icov_square, bgn_date=bgn_date)
-        self.save(icov, bgn_date, calendar)
+        icov_of = (rets.rolling(self.cfg_icov.win).cov(rets[instru]) * 1e4).fillna(0)
+        pairs = icov_of.stack().reset_index().set_axis(["trade_date", "instrument", "icov"], axis=1)
+        pairs = pairs.query(f"trade_date >= '{bgn_date}'")
+        others = pairs["instrument"]
+        icov = pd.DataFrame(
+            {
+                "trade_date": pairs["trade_date"],
+                "i0": others.where(others <= instru, instru),
+                "i1": others.where(others >= instru, instru),
+                "icov": pairs["icov"],
+            }
+        )
+        return icov.sort_values(["trade_date", "i0", "i1"], ascending=True)
+
+    def backfill_instru(self, instru: str, bgn_date: str, stp_date: str, calendar: CCalendar):
+        """
+        Insert pairs of an instrument newly added to the universe, other pairs are kept as they are
+
+        :param instru:
+        :param bgn_date:
+        :param stp_date:
+        :param calendar:
+        :return:
+        """
+        with perf_step("icov", "backfill", tag=instru) as rec:
+            icov = self.cal_pairs_of(instru, bgn_date, stp_date, calendar)
+            rec.rows_out = save_bulk(self.db_struct_icov, icov)
+        logger.info(f"Pairs of {SFG(instru)} from {SFG(bgn_date)} to {SFG(stp_date)} inserted into covariance")
+        return 0
+
+    def main(self, bgn_date: str, stp_date: str, calendar: CCalendar, splice: bool = False):
+        """
+
+        :param bgn_date:
+        :param stp_date:
+        :param calendar:
+        :param splice: whether to replace [bgn_date, stp_date) of saved data, for repairs
+        :return:
+        """
+        buffer_bgn_date = calendar.get_next_date(bgn_date, shift=-self.cfg_icov.win + 1)
+        with perf_step("icov", "load") as rec:
+            rets = self.load_rets(buffer_bgn_date, stp_date)
+            rec.rows_out = len(rets)
+        with perf_step("icov", "cov") as rec:
+            rec.rows_in = len(rets)
+            icov_square = rets.rolling(self.cfg_icov.win).cov() * 1e4
+            icov = self.reformat(icov_square, bgn_date=bgn_date)
+            rec.rows_out = len(icov)
+        with perf_step("icov", "save") as rec:
+            rec.rows_in = len(icov)
+            self.save(icov, bgn_date, calendar, replace_range=(bgn_date, stp_date) if splice else None)
         logger.info(f"instruments covariance from {SFG(bgn_date)} to {SFG(stp_date)} calculated")
         return 0
 
@@ -0,0 +1,133 @@
+"""
+Convert trade_date of existing project databases between TEXT "yyyymmdd" and INTEGER yyyymmdd.
+
+usage:
+    python -m solutions.migrate --dtype INTEGER
+    python -m solutions.migrate --dtype TEXT --root E:\\Data\\Projects\\CTA_V7 --dry
+
+Every table with a trade_date column under root is rebuilt with the new dtype, rows and keys are kept.
+Set db_schema.trade_date in config.yaml to the same dtype after migration.
+"""
+
+import os
+import glob
+import sqlite3
+import argparse
+from loguru import logger
+from solutions.db_generator import TRADE_DATE_DTYPES
+from solutions.db_io import quote
+
+
+def parse_args():
+    arg_parser = argparse.ArgumentParser(description="Convert trade_date of project databases")
+    arg_parser.add_argument("--dtype", type=str, required=True, choices=TRADE_DATE_DTYPES, help="new dtype")
+    arg_parser.add_argument("--root", type=str, default=None, help="default is project_root_dir in config.yaml")
+    arg_parser.add_argument("--dry", default=False, action="store_true", help="only list tables to be migrated")
+    return arg_parser.parse_args()
+
+
+def list_dbs(root: str) -> list[str]:
+    return sorted(glob.glob(os.path.join(root, "**", "*.db"), recursive=True))
+
+
+def get_tables(con: sqlite3.Connection) -> list[str]:
+    sql = "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+    return [r[0] for r in con.execute(sql).fetchall()]
+
+
+def get_columns(con: sqlite3.Connection, table: str) -> list[tuple[str, str, int]]:
+    """
+
+    :return: a list of (name, dtype, position in primary keys, 0 if not a key)
+    """
+    return [(r[1], r[2].upper(), r[5]) for r in con.execute(f"PRAGMA table_info({quote(table)})").fetchall()]
+
+
+def get_key_columns(con: sqlite3.Connection, table: str) -> list[str]:
+    """
+    Tables built by CMgrSqlDb have primary keys, tables built by CDbWriter have a unique index instead.
+    """
+    if keys := sorted([(pk, name) for name, _, pk in get_columns(con, table) if pk > 0]):
+        return [name for _, name in keys]
+    for index in con.execute(f"PRAGMA index_list({quote(table)})").fetchall():
+        index_name, is_unique = index[1], index[2]
+        if is_unique:
+            return [r[2] for r in con.execute(f"PRAGMA index_info({quote(index_name)})").fetchall()]
+    return []
+
+
+def need_migrate(con: sqlite3.Connection, table: str, dtype: str) -> bool:
+    for name, col_dtype, _ in get_columns(con, table):
+        if name == "trade_date":
+            return col_dtype != dtype
+    return False
+
+
+def migrate_table(con: sqlite3.Connection, table: str, dtype: str):
+    columns = get_columns(con, table)
+    keys = get_key_columns(con, table)
+    tmp = f"{table}__migrate"
+    col_defs = [f"{quote(name)} {dtype if name == 'trade_date' else col_dtype}" for name, col_dtype, _ in columns]
+    col_sels = [
+        f"CAST({quote(name)} AS {dtype})" if name == "trade_date" else quote(name) for name, _, _ in columns
+    ]
+    con.execute("BEGIN")
+    try:
+        con.execute(f"CREATE TABLE {quote(tmp)} ({', '.join(col_defs)})")
+        con.execute(f"INSERT INTO {quote(tmp)} SELECT {', '.join(col_sels)} FROM {quote(table)} ORDER BY rowid")
+        con.execute(f"DROP TABLE {quote(table)}")
+        con.execute(f"ALTER TABLE {quote(tmp)} RENAME TO {quote(table)}")
+        if keys:
+            # same as CDbWriter.create_primary_index
+            con.execute(
+                f"CREATE UNIQUE INDEX {quote(f'{table}_pk')} ON {quote(table)} ({', '.join(quote(k) for k in keys)})"
+            )
+        con.execute("COMMIT")
+    except sqlite3.Error:
+        con.execute("ROLLBACK")
+        raise
+    return 0
+
+
+def migrate_db(db_path: str, dtype: str, dry: bool = False) -> list[str]:
+    """
+
+    :param db_path:
+    :param dtype: "TEXT" or "INTEGER"
+    :param dry: if True, nothing is changed
+    :return: tables migrated, or to be migrated if dry
+    """
+    con = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        tables = [t for t in get_tables(con) if need_migrate(con, t, dtype)]
+        if not dry:
+            for table in tables:
+                migrate_table(con, table, dtype)
+            if tables:
+                con.execute("VACUUM")
+    finally:
+        con.close()
+    return tables
+
+
+def main_migrate(root: str, dtype: str, dry: bool = False):
+    db_paths = list_dbs(root)
+    logger.info(f"{len(db_paths)} databases found in {root}")
+    n = 0
+    for db_path in db_paths:
+        if tables := migrate_db(db_path, dtype, dry=dry):
+            n += len(tables)
+            logger.info(f"{'To migrate' if dry else 'Migrated'} {db_path}: {tables}")
+    logger.info(f"{n} tables {'to be migrated' if dry else 'migrated'} to trade_date {dtype}")
+    return 0
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.root is None:
+        from config import proj_cfg
+
+        project_root = proj_cfg.project_root_dir
+    else:
+        project_root = args.root
+    main_migrate(project_root, args.dtype, dry=args.dry)
@@ -1,9 +1,11 @@
 import numpy as np
 import pandas as pd
 from loguru import logger
-from husfort.qutility import check_and_makedirs, qtimer
+from husfort.qutility import qtimer
 from husfort.qcalendar import CCalendar
-from husfort.qsqlite import CDbStruct, CMgrSqlDb
+from husfort.qsqlite import CDbStruct
+from solutions.perf import perf_step
+from solutions.db_io import check_continuity, save_bulk, save_splice, read_by_range
 
 
 def convert_mkt_idx(mkt_idx: str, prefix: str = "I") -> str:
@@ -11,8 +13,7 @@ def convert_mkt_idx(mkt_idx: str, prefix: str = "I") -> str:
 
 
 def load_available(db_struct: CDbStruct, bgn_date: str, stp_date: str) -> pd.DataFrame:
-    sqldb = CMgrSqlDb(db_save_dir=db_struct.db_save_dir, db_name=db_struct.db_name, table=db_struct.table, mode="r")
-    avlb_data = sqldb.read_by_range(bgn_date=bgn_date, stp_date=stp_date)
+    avlb_data = read_by_range(db_struct, bgn_date=bgn_date, stp_date=stp_date)
     return avlb_data
 
 
@@ -80,19 +81,27 @@ def main_market(
     path_mkt_idx_data: str,
     mkt_idxes: list[str],
     sectors: list[str],
+    splice: bool = False,
 ):
-    check_and_makedirs(db_struct_mkt.db_save_dir)
-    sqldb = CMgrSqlDb(
-        db_save_dir=db_struct_mkt.db_save_dir,
-        db_name=db_struct_mkt.db_name,
-        table=db_struct_mkt.table,
-        mode="a",
-    )
-    if sqldb.check_continuity(bgn_date, calendar) == 0:
-        ret_by_sector = cal_market_return(bgn_date, stp_date, db_struct_avlb, sectors=sectors)
-        mkt_idx_df = load_market_index(bgn_date, stp_date, path_mkt_idx_data, mkt_idxes)
+    """
+
+    :param splice: whether to replace [bgn_date, stp_date) of saved data, for backfills,
+                   instead of checking continuity
+    """
+    if splice or check_continuity(db_struct_mkt, bgn_date, calendar) == 0:
+        with perf_step("mkt", "cal_market_return") as rec:
+            ret_by_sector = cal_market_return(bgn_date, stp_date, db_struct_avlb, sectors=sectors)
+            rec.rows_out = len(ret_by_sector)
+        with perf_step("mkt", "load_market_index") as rec:
+            mkt_idx_df = load_market_index(bgn_date, stp_date, path_mkt_idx_data, mkt_idxes)
+            rec.rows_out = len(mkt_idx_df)
         new_data = merge_mkt_idx(ret_by_sector, mkt_idx_df)
         new_data = sort_columns(new_data, db_struct_mkt)
         print(new_data)
-        sqldb.update(update_data=new_data)
+        with perf_step("mkt", "save") as rec:
+            rec.rows_in = len(new_data)
+            if splice:
+                save_splice(db_struct_mkt, new_data, bgn_date, stp_date)
+            else:
+                save_bulk(db_struct_mkt, new_data)
     return 0
@@ -0,0 +1,58 @@
+"""
+Alignment of available panels.
+
+Factors and test returns are both computed for the available universe, so for the same dates they
+share the same (trade_date, instrument) rows. Each stage saves its rows in the canonical order, sorted
+by trade_date and then instrument, and loaders read them back in that order. Two panels could then be
+put side by side by position, and a checksum of the key columns tells whether they are aligned.
+"""
+
+import numpy as np
+import pandas as pd
+
+KEY_COLUMNS = ["trade_date", "instrument"]
+
+
+def sort_canonical(data: pd.DataFrame) -> pd.DataFrame:
+    """
+
+    :param data: with columns KEY_COLUMNS. Instrument could be str or categorical from
+                 CUniverseCodebook, whose codes follow sorted names, so the order is the same.
+    :return: data sorted by KEY_COLUMNS, with a new range index
+    """
+    return data.sort_values(by=KEY_COLUMNS, kind="stable", ignore_index=True)
+
+
+def cal_key_checksum(data: pd.DataFrame) -> int:
+    """
+    Hash each row of key columns, and weight hashes by position, so that two panels have the
+    same checksum only if they have the same keys in the same order. Overflow of uint64 is
+    expected, it just wraps around.
+
+    :param data: with columns KEY_COLUMNS, str or categorical
+    :return:
+    """
+    row_hash = pd.util.hash_pandas_object(data[KEY_COLUMNS], index=False).to_numpy()
+    weights = np.arange(1, len(row_hash) + 1, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        return int((row_hash * weights).sum(dtype=np.uint64))
+
+
+def is_aligned(left: pd.DataFrame, right: pd.DataFrame) -> bool:
+    return len(left) == len(right) and cal_key_checksum(left) == cal_key_checksum(right)
+
+
+def align_by_position(left: pd.DataFrame, right: pd.DataFrame) -> pd.DataFrame | None:
+    """
+
+    :param left: with columns KEY_COLUMNS + values
+    :param right: with columns KEY_COLUMNS + other values
+    :return: columns of left and values of right side by side, or None if they are not aligned,
+             then caller should merge them on KEY_COLUMNS.
+    """
+    if not is_aligned(left, right):
+        return None
+    return pd.concat(
+        [left.reset_index(drop=True), right.drop(columns=KEY_COLUMNS).reset_index(drop=True)],
+        axis=1,
+    )
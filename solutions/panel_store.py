@@ -0,0 +1,327 @@
+"""
+Memory-mapped wide panels of preprocess data.
+
+Switch 'panel' converts the by-instrument preprocess shards into one .npy file per column, of shape
+(trade dates, instruments), in project_root_dir/panel_store:
+    dates.npy:        "yyyymmdd" of each row
+    instruments.npy:  sorted instrument names of each column
+    present.npy:      bool, whether (trade_date, instrument) exists in the shard
+    {column}.npy:     float64 for REAL columns, fixed width str for TEXT columns
+    meta.json:        written last, a store without it is ignored. It also records mtime_ns and size
+                      of each shard when it was read
+Arrays are saved in Fortran order, so the rows of one instrument are contiguous. Stages map them by
+np.load(mmap_mode="r"), which costs nothing to open, and only pages actually touched are read.
+
+Loaders here return the same data as read_by_range on the shards does, and fall back to
+the shards when the store is not enabled, or does not cover the requested dates, instruments or
+columns, or a shard of the requested instruments has changed since the store was built. The store
+dir is passed by environment variable, so processes spawned by multiprocessing use it too. The store
+is a snapshot: rebuild it after the shards are updated, or changed shards are read as before.
+"""
+
+import os
+import json
+import shutil
+import datetime as dt
+import numpy as np
+import pandas as pd
+from functools import cache, partial
+from loguru import logger
+from husfort.qsqlite import CDbStruct
+from husfort.qcalendar import CCalendar
+from husfort.qutility import SFG, qtimer, check_and_makedirs
+from typedefs.typedef_instrus import TUniverse
+from solutions.perf import perf_step
+from solutions.concurrency import map_loaders
+from solutions.db_io import read_by_range
+
+ENV_PANEL_STORE_DIR = "CTA_PANEL_STORE_DIR"
+PANEL_STORE_META = "meta.json"
+PRESENT = "present"
+
+
+def set_panel_store_dir(store_dir: str):
+    os.environ[ENV_PANEL_STORE_DIR] = store_dir
+
+
+def get_panel_store_dir() -> str | None:
+    return os.environ.get(ENV_PANEL_STORE_DIR)
+
+
+def get_shard_path(db_struct_preprocess: CDbStruct, instru: str) -> str:
+    db_struct_instru = db_struct_preprocess.copy_to_another(another_db_name=f"{instru}.db")
+    return os.path.join(db_struct_instru.db_save_dir, db_struct_instru.db_name)
+
+
+def get_shard_signature(shard_path: str) -> list[int] | None:
+    """
+
+    :param shard_path:
+    :return: [mtime_ns, size] of the shard, None if it does not exist
+    """
+    if not os.path.exists(shard_path):
+        return None
+    st = os.stat(shard_path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+class CPanelStore:
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, PANEL_STORE_META), "r") as f:
+            self.meta: dict = json.load(f)
+        self.dates: np.ndarray = np.load(self.path("dates"))
+        self.instruments: np.ndarray = np.load(self.path("instruments"))
+        self.instru_idx = {instru: j for j, instru in enumerate(self.instruments)}
+        self.arrays: dict[str, np.ndarray] = {}
+        self.changed: set[str] = set()
+
+    @property
+    def columns(self) -> list[str]:
+        return self.meta["columns"]
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.store_dir, f"{name}.npy")
+
+    def array(self, name: str) -> np.ndarray:
+        if name not in self.arrays:
+            self.arrays[name] = np.load(self.path(name), mmap_mode="r")
+        return self.arrays[name]
+
+    def is_fresh(self, instru: str, db_struct_preprocess: CDbStruct) -> bool:
+        """
+
+        :param instru:
+        :param db_struct_preprocess:
+        :return: whether the shard of instru is the same as when the store was built. Stores built
+                 before signatures of shards were recorded are never fresh.
+        """
+        saved = self.meta.get("shards", {}).get(instru)
+        if saved is not None and saved == get_shard_signature(get_shard_path(db_struct_preprocess, instru)):
+            return True
+        if instru not in self.changed:
+            self.changed.add(instru)
+            logger.warning(f"Shard of {SFG(instru)} has changed since panel store is built, it is read instead")
+        return False
+
+    def covers(
+        self, bgn_date: str, stp_date: str, instruments: list[str], columns: list[str], db_struct_preprocess: CDbStruct
+    ) -> bool:
+        return (
+            self.meta["bgn_date"] <= bgn_date
+            and stp_date <= self.meta["stp_date"]
+            and all(instru in self.instru_idx for instru in instruments)
+            and all(c == "trade_date" or c in self.columns for c in columns)
+            and all(self.is_fresh(instru, db_struct_preprocess) for instru in instruments)
+        )
+
+    def date_slice(self, bgn_date: str, stp_date: str) -> slice:
+        return slice(
+            int(np.searchsorted(self.dates, bgn_date, side="left")),
+            int(np.searchsorted(self.dates, stp_date, side="left")),
+        )
+
+    @staticmethod
+    def decode(values: np.ndarray) -> np.ndarray:
+        if values.dtype.kind != "U":
+            return np.array(values)
+        # NULL of TEXT is saved as ""
+        res = values.astype(object)
+        res[values == ""] = None
+        return res
+
+    def read_by_instru(self, instru: str, bgn_date: str, stp_date: str, value_columns: list[str]) -> pd.DataFrame:
+        """
+
+        :param instru:
+        :param bgn_date:
+        :param stp_date:
+        :param value_columns: like ["trade_date", "ticker_major", "return_c_major"]
+        :return: rows of instru in [bgn_date, stp_date), like read_by_range
+        """
+        sl, j = self.date_slice(bgn_date, stp_date), self.instru_idx[instru]
+        present = self.array(PRESENT)[sl, j]
+        data = {"trade_date": self.dates[sl][present].astype(object)}
+        for c in value_columns:
+            if c != "trade_date":
+                data[c] = self.decode(self.array(c)[sl, j][present])
+        return pd.DataFrame(data)[value_columns]
+
+    def read_panel(self, column: str, bgn_date: str, stp_date: str, instruments: list[str]) -> pd.DataFrame:
+        """
+
+        :param column: a REAL column, like "return_c_major"
+        :param bgn_date:
+        :param stp_date:
+        :param instruments:
+        :return: index = trade_date, columns = instruments, nan if a row does not exist in shards.
+                 Dates without any row of these instruments are dropped, like an outer join
+                 of data by instrument.
+        """
+        sl, js = self.date_slice(bgn_date, stp_date), [self.instru_idx[instru] for instru in instruments]
+        present = self.array(PRESENT)[sl][:, js]
+        values = np.where(present, self.array(column)[sl][:, js], np.nan)
+        keep = present.any(axis=1)
+        return pd.DataFrame(
+            values[keep],
+            index=pd.Index(self.dates[sl][keep].astype(object), name="trade_date"),
+            columns=instruments,
+        )
+
+
+@cache
+def _open_panel_store(store_dir: str) -> CPanelStore | None:
+    if not os.path.exists(os.path.join(store_dir, PANEL_STORE_META)):
+        logger.info(f"Panel store {SFG(store_dir)} is not built yet, preprocess shards are used")
+        return None
+    return CPanelStore(store_dir)
+
+
+def open_panel_store() -> CPanelStore | None:
+    """
+
+    :return: the store set by set_panel_store_dir, or None if it is not set or not built
+    """
+    if (store_dir := get_panel_store_dir()) is None:
+        return None
+    return _open_panel_store(store_dir)
+
+
+def read_preprocess(
+    db_struct_preprocess: CDbStruct,
+    instru: str,
+    bgn_date: str,
+    stp_date: str,
+    value_columns: list[str] | None = None,
+) -> pd.DataFrame:
+    """
+
+    :param db_struct_preprocess: by-instrument shards, used if the store does not cover the request
+    :param instru:
+    :param bgn_date:
+    :param stp_date:
+    :param value_columns: default is all columns of the table
+    :return:
+    """
+    columns = value_columns or db_struct_preprocess.table.vars.names
+    store = open_panel_store()
+    if store is not None and store.covers(bgn_date, stp_date, [instru], columns, db_struct_preprocess):
+        with perf_step("panel_store", "read", tag=instru) as rec:
+            data = store.read_by_instru(instru, bgn_date, stp_date, columns)
+            rec.rows_out = len(data)
+        return data
+    db_struct_instru = db_struct_preprocess.copy_to_another(another_db_name=f"{instru}.db")
+    return read_by_range(db_struct_instru, bgn_date, stp_date, value_columns=value_columns)
+
+
+def read_preprocess_panel(
+    db_struct_preprocess: CDbStruct, column: str, bgn_date: str, stp_date: str, instruments: list[str]
+) -> pd.DataFrame:
+    """
+
+    :param db_struct_preprocess:
+    :param column: a REAL column, like "return_c_major"
+    :param bgn_date:
+    :param stp_date:
+    :param instruments:
+    :return: index = trade_date, columns = instruments, see CPanelStore.read_panel
+    """
+    store = open_panel_store()
+    if store is not None and store.covers(bgn_date, stp_date, instruments, [column], db_struct_preprocess):
+        with perf_step("panel_store", "read_panel", tag=column) as rec:
+            data = store.read_panel(column, bgn_date, stp_date, instruments)
+            rec.rows_out = len(data)
+        return data
+    instru_data: list[pd.DataFrame] = map_loaders(
+        partial(read_preprocess, db_struct_preprocess, bgn_date=bgn_date, stp_date=stp_date,
+                value_columns=["trade_date", column]),
+        instruments,
+    )
+    return pd.concat(
+        [d.rename(columns={column: instru}).set_index("trade_date") for instru, d in zip(instruments, instru_data)],
+        axis=1,
+        ignore_index=False,
+    )
+
+
+@qtimer
+def build_panel_store(
+    store_dir: str,
+    db_struct_preprocess: CDbStruct,
+    universe: TUniverse,
+    bgn_date: str,
+    stp_date: str,
+    calendar: CCalendar,
+):
+    """
+    Build into a temporary dir, then replace the old store, so stages never see a half built one.
+
+    :param store_dir:
+    :param db_struct_preprocess:
+    :param universe:
+    :param bgn_date:
+    :param stp_date:
+    :param calendar:
+    :return:
+    """
+    dates = np.array(calendar.get_iter_list(bgn_date, stp_date), dtype="U8")
+    instruments = sorted(universe)
+    table = db_struct_preprocess.table
+    columns = [v.name for v in table.value_columns if v.dtype.upper() in ("REAL", "TEXT")]
+    if skipped := [v.name for v in table.value_columns if v.name not in columns]:
+        logger.warning(f"Columns {skipped} are neither REAL nor TEXT, they are not saved in panel store")
+    text_columns = {v.name for v in table.value_columns if v.dtype.upper() == "TEXT"}
+
+    shape = (len(dates), len(instruments))
+    present = np.zeros(shape, dtype=bool)
+    shards: dict[str, list[int] | None] = {}
+    panels: dict[str, np.ndarray] = {
+        c: np.full(shape, "", dtype=object) if c in text_columns else np.full(shape, np.nan) for c in columns
+    }
+    for j, instru in enumerate(instruments):
+        with perf_step("panel_store", "load", tag=instru) as rec:
+            # signature is taken before reading, a shard written meanwhile is not taken as fresh
+            shards[instru] = get_shard_signature(get_shard_path(db_struct_preprocess, instru))
+            db_struct_instru = db_struct_preprocess.copy_to_another(another_db_name=f"{instru}.db")
+            instru_data = read_by_range(db_struct_instru, bgn_date, stp_date, value_columns=["trade_date"] + columns)
+            rec.rows_out = len(instru_data)
+        instru_data = instru_data[instru_data["trade_date"].isin(dates)]
+        rows = np.searchsorted(dates, instru_data["trade_date"].to_numpy(dtype=str))
+        present[rows, j] = True
+        for c in columns:
+            if c in text_columns:
+                panels[c][rows, j] = instru_data[c].fillna("").to_numpy()
+            else:
+                panels[c][rows, j] = instru_data[c].to_numpy(dtype=np.float64)
+
+    tmp_dir = f"{store_dir}.building"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    check_and_makedirs(tmp_dir)
+    with perf_step("panel_store", "save") as rec:
+        np.save(os.path.join(tmp_dir, "dates.npy"), dates)
+        np.save(os.path.join(tmp_dir, "instruments.npy"), np.array(instruments, dtype=str))
+        np.save(os.path.join(tmp_dir, f"{PRESENT}.npy"), np.asfortranarray(present))
+        for c, panel in panels.items():
+            panel = panel.astype(str) if c in text_columns else panel
+            np.save(os.path.join(tmp_dir, f"{c}.npy"), np.asfortranarray(panel))
+        meta = {
+            "bgn_date": bgn_date,
+            "stp_date": stp_date,
+            "columns": columns,
+            "shape": list(shape),
+            "rows": int(present.sum()),
+            "shards": shards,
+            "build_time": dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        with open(os.path.join(tmp_dir, PANEL_STORE_META), "w") as f:
+            json.dump(meta, f, indent=4)
+        rec.rows_in = meta["rows"]
+    if os.path.exists(store_dir):
+        shutil.rmtree(store_dir)
+    os.replace(tmp_dir, store_dir)
+    logger.info(
+        f"Panel store of {SFG(len(dates))} dates x {SFG(len(instruments))} instruments, "
+        f"{SFG(len(columns))} columns, is saved to {SFG(store_dir)}"
+    )
+    return 0
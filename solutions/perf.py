@@ -0,0 +1,155 @@
+"""
+Instrumentation of pipeline stages.
+
+Each named sub-step records wall time, cpu time, peak rss and rows in/out, and is
+emitted as one json line to {perf_dir}/{run_id}.{pid}.jsonl. Settings are passed by
+environment variables, so workers spawned by multiprocessing record to the same run.
+When instrumentation is not enabled, perf_step costs nothing but a dict lookup.
+Peak rss is of the whole process, so a step records it at its end and how much the step raised it,
+steps run by threads at the same time could share a raise.
+"""
+
+import os
+import glob
+import json
+import time
+import threading
+import datetime as dt
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from typing import Iterator
+
+ENV_PERF_DIR = "CTA_PERF_DIR"
+ENV_PERF_RUN_ID = "CTA_PERF_RUN_ID"
+_EMIT_LOCK = threading.Lock()  # steps could be recorded by threads of a pipeline
+
+
+@dataclass
+class CPerfRecord:
+    stage: str
+    step: str
+    tag: str = ""  # like instrument, factor class, ret name
+    wall: float = 0.0  # seconds
+    cpu: float = 0.0  # seconds
+    peak_rss_mb: float | None = None  # of the process, since it started
+    peak_rss_growth_mb: float | None = None  # raise of peak_rss_mb during this step
+    rows_in: int | None = None
+    rows_out: int | None = None
+    extra: dict = field(default_factory=dict)  # like {"rows_per_sec": 1e5}
+
+
+def get_peak_rss_mb() -> float | None:
+    try:
+        import psutil
+
+        info = psutil.Process().memory_info()
+        if (peak := getattr(info, "peak_wset", None)) is not None:  # windows
+            return peak / 2**20
+    except ImportError:
+        pass
+    try:
+        import resource
+
+        # linux reports in KB
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+    except ImportError:
+        return None
+
+
+def enable_perf(perf_dir: str, run_id: str | None = None, prefix: str = "") -> str:
+    """
+
+    :param perf_dir: directory to save json lines
+    :param run_id: default is prefix + the current time, like "factor-20250101-235959"
+    :param prefix:
+    :return: run_id
+    """
+    run_id = run_id or f"{prefix}{dt.datetime.now().strftime('%Y%m%d-%H%M%S')}"
+    os.makedirs(perf_dir, exist_ok=True)
+    os.environ[ENV_PERF_DIR] = perf_dir
+    os.environ[ENV_PERF_RUN_ID] = run_id
+    return run_id
+
+
+def perf_enabled() -> bool:
+    return ENV_PERF_DIR in os.environ
+
+
+def emit(record: CPerfRecord):
+    perf_dir, run_id = os.environ[ENV_PERF_DIR], os.environ[ENV_PERF_RUN_ID]
+    d = {"run_id": run_id, "pid": os.getpid(), "time": dt.datetime.now().isoformat()} | asdict(record)
+    with _EMIT_LOCK, open(os.path.join(perf_dir, f"{run_id}.{os.getpid()}.jsonl"), "a") as f:
+        f.write(json.dumps(d) + "\n")
+
+
+@contextmanager
+def perf_step(stage: str, step: str, tag: str = "") -> Iterator[CPerfRecord]:
+    """
+
+    :param stage: like "avlb", "factor", "ic"
+    :param step: like "load", "normalize", "save"
+    :param tag:
+    :return: a record, caller could set rows_in, rows_out and extra in the block
+
+    usage:
+        with perf_step("factor", "load", tag=instru) as rec:
+            data = load(...)
+            rec.rows_out = len(data)
+    """
+    record = CPerfRecord(stage=stage, step=step, tag=tag)
+    if not perf_enabled():
+        yield record
+        return
+    w0, c0, m0 = time.perf_counter(), time.process_time(), get_peak_rss_mb()
+    try:
+        yield record
+    finally:
+        record.wall = time.perf_counter() - w0
+        record.cpu = time.process_time() - c0
+        record.peak_rss_mb = get_peak_rss_mb()
+        if m0 is not None and record.peak_rss_mb is not None:
+            record.peak_rss_growth_mb = record.peak_rss_mb - m0
+        emit(record)
+
+
+def load_perf_records(perf_dir: str, run_id: str) -> list[dict]:
+    records: list[dict] = []
+    for path in sorted(glob.glob(os.path.join(perf_dir, f"{run_id}.*.jsonl"))):
+        with open(path, "r") as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    return records
+
+
+def summarize_perf(perf_dir: str, run_id: str):
+    """
+
+    :param perf_dir:
+    :param run_id:
+    :return: a pd.DataFrame, aggregated by (stage, step), sorted by total wall time.
+             process_peak_rss_mb is the max peak of processes running the step, which could be
+             reached by other steps before it, peak_rss_growth_mb is the sum of raises by the step
+    """
+    import pandas as pd
+
+    records = load_perf_records(perf_dir, run_id)
+    if not records:
+        return pd.DataFrame()
+    df = pd.DataFrame(records)
+    if "peak_rss_growth_mb" not in df:
+        df["peak_rss_growth_mb"] = float("nan")  # records of runs before it was recorded
+    # reads served by a connection kept from an earlier read, see solutions.db_io.get_reader
+    df["conn_reused"] = df["extra"].map(lambda e: float(e["reused"]) if "reused" in e else float("nan"))
+    summary = df.groupby(by=["stage", "step"]).agg(
+        calls=("wall", "size"),
+        wall=("wall", "sum"),
+        wall_max=("wall", "max"),
+        cpu=("cpu", "sum"),
+        process_peak_rss_mb=("peak_rss_mb", "max"),
+        peak_rss_growth_mb=("peak_rss_growth_mb", "sum"),
+        rows_in=("rows_in", "sum"),
+        rows_out=("rows_out", "sum"),
+        conn_reused=("conn_reused", "sum"),
+    )
+    summary["wall_pct"] = summary["wall"] / summary["wall"].sum() * 100
+    summary["rows_in_per_sec"] = summary["rows_in"] / summary["wall"].where(summary["wall"] > 0)
+    return summary.sort_values(by="wall", ascending=False)
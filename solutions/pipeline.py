@@ -0,0 +1,123 @@
+"""
+Pipelined load -> compute -> save over a list of items.
+
+A loader thread loads item i+1 while item i is computed in the calling thread, and a writer
+thread saves item i-1. Reading and writing SQLite release the GIL, so I/O overlaps computation.
+Queues between stages are bounded by depth, and each stage holds only one item besides them, so
+memory is bounded by depth. The first error of any stage stops the others and is raised in the
+calling thread, unless on_error is given, to which errors of an item are passed instead, so that
+other items go on and results already computed are still saved.
+"""
+
+import queue
+import threading
+from typing import Any, Callable, Iterable
+
+PREFETCH_DEPTH = 1
+_END = object()
+_POLL_INTERVAL = 0.1  # seconds
+
+
+class _CPipeline:
+    def __init__(self, depth: int):
+        self.loaded: queue.Queue = queue.Queue(maxsize=depth)
+        self.computed: queue.Queue = queue.Queue(maxsize=depth)
+        self.stop = threading.Event()
+        self.errors: list[BaseException] = []
+
+    def fail(self, e: BaseException):
+        self.errors.append(e)
+        self.stop.set()
+
+    def put(self, q: queue.Queue, x) -> bool:
+        # give up when stopped, so that no thread waits forever for a stage which is gone
+        while not self.stop.is_set():
+            try:
+                q.put(x, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, q: queue.Queue):
+        while not self.stop.is_set():
+            try:
+                return q.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+        return _END
+
+
+def run_pipeline(
+    items: Iterable,
+    load: Callable[[Any], Any],
+    compute: Callable[[Any, Any], Any],
+    save: Callable[[Any, Any], Any],
+    depth: int = PREFETCH_DEPTH,
+    on_saved: Callable[[Any], Any] | None = None,
+    on_error: Callable[[Any, Exception], Any] | None = None,
+) -> int:
+    """
+
+    :param items: like instruments
+    :param load: item -> loaded, called in the loader thread
+    :param compute: (item, loaded) -> computed, called in the calling thread
+    :param save: (item, computed) -> anything, called in the writer thread
+    :param depth: size of each queue between stages
+    :param on_saved: item -> anything, called in the writer thread after each save, like updating progress
+    :param on_error: (item, error) -> anything, called in the thread of the stage failed, then the item
+                     is skipped. Default is to stop all stages and raise the error.
+    :return: number of items saved
+    """
+    pipe = _CPipeline(depth)
+    n_saved = [0]
+
+    def attempt(item, func: Callable, *args) -> tuple[bool, Any]:
+        try:
+            return True, func(*args)
+        except Exception as e:
+            if on_error is None:
+                raise
+            on_error(item, e)
+            return False, None
+
+    def loader():
+        try:
+            for item in items:
+                ok, loaded = attempt(item, load, item)
+                if ok and not pipe.put(pipe.loaded, (item, loaded)):
+                    return
+            pipe.put(pipe.loaded, _END)
+        except BaseException as e:
+            pipe.fail(e)
+
+    def writer():
+        try:
+            while (got := pipe.get(pipe.computed)) is not _END:
+                item, computed = got
+                ok, _ = attempt(item, save, item, computed)
+                if ok:
+                    n_saved[0] += 1
+                    if on_saved is not None:
+                        on_saved(item)
+        except BaseException as e:
+            pipe.fail(e)
+
+    threads = [threading.Thread(target=loader, daemon=True), threading.Thread(target=writer, daemon=True)]
+    for t in threads:
+        t.start()
+    try:
+        while (got := pipe.get(pipe.loaded)) is not _END:
+            item, loaded = got
+            ok, computed = attempt(item, compute, item, loaded)
+            del loaded
+            if ok and not pipe.put(pipe.computed, (item, computed)):
+                break
+        pipe.put(pipe.computed, _END)
+    except BaseException as e:
+        pipe.fail(e)
+    for t in threads:
+        t.join()
+    if pipe.errors:
+        raise pipe.errors[0]
+    return n_saved[0]
@@ -0,0 +1,225 @@
+"""
+Summary store of ic-tests and vt-tests.
+
+For each test, running sums (n, sum of x, sum of x^2) of each factor since the first test date are
+saved with one row per trade date, see solutions.db_generator.gen_qtest_summary_db. New test rows
+are appended by adding their sums to the last row, so the cost of an update depends only on the
+number of new days. Then any statistics over a range of dates is the difference of two rows:
+    cumulative sum for plots: s1[t] - s1[before bgn_date]
+    mean and std of each year: differences between year end rows
+    rolling mean and std: differences between rows win days apart
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from husfort.qsqlite import CDbStruct
+from solutions.db_io import (
+    CDbWriter,
+    quote,
+    get_reader,
+    get_trade_date_dtype_of,
+    encode_trade_date,
+    decode_trade_date,
+    read_by_range,
+    read_last_date,
+    read_tail,
+    save_bulk,
+)
+
+FIRST_DATE = "00000000"  # before any trade date, in both TEXT and INTEGER
+
+
+def cal_mean_std(n: pd.DataFrame, s1: pd.DataFrame, s2: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+
+    :param n: number of valid values
+    :param s1: sum of values
+    :param s2: sum of squared values
+    :return: mean and std(ddof = 1), nan if n < 1 or n < 2 respectively, the same as pandas
+    """
+    n = n.astype(np.float64)
+    mean = s1 / n.where(n > 0)
+    var = (s2 - s1 * mean) / (n - 1).where(n > 1)
+    return mean, np.sqrt(var.clip(lower=0))
+
+
+class CQTestSummaryStore:
+    def __init__(self, db_struct: CDbStruct, factor_names: list[str]):
+        """
+
+        :param db_struct: from gen_qtest_summary_db
+        :param factor_names:
+        """
+        self.db_struct = db_struct
+        self.factor_names = factor_names
+
+    @property
+    def db_path(self) -> str:
+        return os.path.join(self.db_struct.db_save_dir, self.db_struct.db_name)
+
+    def cols(self, suffix: str) -> list[str]:
+        return [f"{f}_{suffix}" for f in self.factor_names]
+
+    def split(self, data: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        """
+
+        :param data: rows of running sums
+        :return: n, s1, s2, with columns = factor names and the same index as data
+        """
+        return tuple(  # type:ignore
+            data[self.cols(suffix)].set_axis(self.factor_names, axis=1) for suffix in ("n", "s1", "s2")
+        )
+
+    def read_last(self, stp_date: str) -> pd.DataFrame:
+        """
+
+        :param stp_date:
+        :return: the last row before stp_date, or a row of zeros if there is none
+        """
+        last = read_tail(self.db_struct, stp_date, n_rows=1)
+        return self.zeros() if last.empty else last
+
+    def last_date(self) -> str | None:
+        return read_last_date(self.db_struct)
+
+    def zeros(self) -> pd.DataFrame:
+        return pd.DataFrame(0, index=[0], columns=self.db_struct.table.vars.names).assign(trade_date=FIRST_DATE)
+
+    def update(self, test_db_struct: CDbStruct, stp_date: str) -> int:
+        """
+
+        :param test_db_struct: from gen_ic_tests_db or gen_vt_tests_db
+        :param stp_date: test rows before this date are summarized
+        :return: number of new rows
+        """
+        last_date = self.last_date()
+        if last_date is not None and last_date >= stp_date:
+            return 0
+        bgn_date = FIRST_DATE if last_date is None else last_date
+        test_data = read_by_range(test_db_struct, bgn_date, stp_date, value_columns=["trade_date"] + self.factor_names)
+        test_data = test_data.query(f"trade_date > '{bgn_date}'").sort_values(by="trade_date")
+        if test_data.empty:
+            return 0
+        base = self.zeros() if last_date is None else read_tail(self.db_struct, stp_date, n_rows=1)
+        base_n, base_s1, base_s2 = self.split(base)
+        vals = test_data[self.factor_names].reset_index(drop=True)
+        n = vals.notna().cumsum() + base_n.iloc[0]
+        s1 = vals.fillna(0).cumsum() + base_s1.iloc[0]
+        s2 = (vals.fillna(0) ** 2).cumsum() + base_s2.iloc[0]
+        new_data = pd.concat(
+            [
+                test_data[["trade_date"]].reset_index(drop=True),
+                n.set_axis(self.cols("n"), axis=1),
+                s1.set_axis(self.cols("s1"), axis=1),
+                s2.set_axis(self.cols("s2"), axis=1),
+            ],
+            axis=1,
+        )
+        return save_bulk(self.db_struct, new_data[self.db_struct.table.vars.names])
+
+    def rewind(self, bgn_date: str) -> int:
+        """
+        Remove rows from bgn_date, so that the next update sums test rows from there again,
+        after test rows of those dates are repaired
+
+        :param bgn_date:
+        :return: number of rows removed
+        """
+        if not os.path.exists(self.db_path):
+            return 0
+        with CDbWriter(self.db_struct) as writer:
+            return writer.delete_range(bgn_date)
+
+    def load_cumsum(self, bgn_date: str, stp_date: str) -> pd.DataFrame:
+        """
+
+        :param bgn_date:
+        :param stp_date:
+        :return: cumulative sum of test results from bgn_date, index = trade_date, columns = factor names.
+                 Unlike pd.DataFrame.cumsum, days with nan keep the last sum.
+        """
+        data = read_by_range(self.db_struct, bgn_date, stp_date, value_columns=["trade_date"] + self.cols("s1"))
+        base = self.read_last(bgn_date)
+        cumsum = data[self.cols("s1")] - base[self.cols("s1")].iloc[0]
+        return cumsum.set_axis(self.factor_names, axis=1).set_axis(data["trade_date"], axis=0)
+
+    def read_year_ends(self, bgn_date: str, stp_date: str) -> pd.DataFrame:
+        dtype = get_trade_date_dtype_of(self.db_struct)
+        table = quote(self.db_struct.table.name)
+        sql = (
+            f"SELECT * FROM {table} WHERE trade_date IN ("
+            f"SELECT MAX(trade_date) FROM {table} WHERE trade_date >= ? AND trade_date < ? "
+            f"GROUP BY CAST(trade_date AS INTEGER) / 10000"
+            f") ORDER BY trade_date"
+        )
+        con, _ = get_reader(self.db_path)
+        params = (encode_trade_date(bgn_date, dtype), encode_trade_date(stp_date, dtype))
+        data = pd.read_sql_query(sql, con, params=params)
+        data["trade_date"] = decode_trade_date(data["trade_date"])
+        return data
+
+    def load_yearly(self, bgn_date: str, stp_date: str) -> pd.DataFrame:
+        """
+
+        :param bgn_date:
+        :param stp_date:
+        :return: a pd.DataFrame with columns = ["trade_year", "factor", "n", "mean", "std"],
+                 of test results in [bgn_date, stp_date), grouped by year. trade_year is "yyyy" str.
+        """
+        year_ends = self.read_year_ends(bgn_date, stp_date)
+        rows = pd.concat([self.read_last(bgn_date), year_ends], axis=0, ignore_index=True)
+        n, s1, s2 = (z.diff().iloc[1:] for z in self.split(rows))
+        mean, std = cal_mean_std(n, s1, s2)
+        trade_years = year_ends["trade_date"].str[0:4].to_numpy()
+        k = len(self.factor_names)
+        return pd.DataFrame(
+            {
+                "trade_year": np.repeat(trade_years, k),
+                "factor": np.tile(self.factor_names, len(trade_years)),
+                "n": n.to_numpy().ravel().astype(np.int64),
+                "mean": mean.to_numpy().ravel(),
+                "std": std.to_numpy().ravel(),
+            }
+        )
+
+    def load_rolling(
+        self, win: int, bgn_date: str, stp_date: str, min_periods: int | None = None
+    ) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """
+
+        :param win: number of test days
+        :param bgn_date:
+        :param stp_date:
+        :param min_periods: minimum number of valid values in a window, default is win
+        :return: rolling mean and std, index = trade_date, columns = factor names
+        """
+        min_periods = win if min_periods is None else min_periods
+        if self.last_date() is None:
+            # the test is not summarized yet
+            empty = pd.DataFrame(columns=self.factor_names, index=pd.Index([], name="trade_date"), dtype=np.float64)
+            return empty, empty.copy()
+        buffer = read_tail(self.db_struct, bgn_date, n_rows=win)
+        data = read_by_range(self.db_struct, bgn_date, stp_date)
+        rows = pd.concat([buffer, data], axis=0, ignore_index=True)
+        # windows starting before the first test date are summed from zero, an empty buffer is of object dtype
+        n, s1, s2 = (z.astype(np.float64) - z.astype(np.float64).shift(win).fillna(0) for z in self.split(rows))
+        mean, std = cal_mean_std(n, s1, s2)
+        valid = n >= min_periods
+        mean, std = mean.where(valid), std.where(valid)
+        index = pd.Index(rows["trade_date"], name="trade_date")
+        return mean.set_axis(index, axis=0).iloc[len(buffer):], std.set_axis(index, axis=0).iloc[len(buffer):]
+
+    def load_rolling_ir(
+        self, win: int, bgn_date: str, stp_date: str, min_periods: int | None = None
+    ) -> pd.DataFrame:
+        """
+
+        :param win: like 60 or 250
+        :param bgn_date:
+        :param stp_date:
+        :param min_periods:
+        :return: rolling mean / rolling std, index = trade_date, columns = factor names
+        """
+        mean, std = self.load_rolling(win, bgn_date, stp_date, min_periods)
+        return mean / std.where(std > 0)
@@ -1,4 +1,7 @@
 import os
+import glob
+import json
+import hashlib
 import numpy as np
 import pandas as pd
 import multiprocessing as mp
@@ -6,15 +9,20 @@ from loguru import logger
 from typing import Literal
 from rich.progress import Progress, TaskID, TimeElapsedColumn, TimeRemainingColumn, TextColumn, BarColumn
 from husfort.qutility import check_and_makedirs, SFG, qtimer, error_handler
-from husfort.qsqlite import CMgrSqlDb, CDbStruct
+from husfort.qsqlite import CDbStruct
 from husfort.qcalendar import CCalendar
 from husfort.qplot import CPlotLines
 from typedefs.typedef_returns import CRet, TRets
 from typedefs.typedef_factors import CCfgFactorGrp
+from typedefs.typedef_instrus import TUniverse, CUniverseCodebook
 from typedef import TFactorsAvlbDirType, TTestReturnsAvlbDirType
 from solutions.test_return import CTestReturnLoader
 from solutions.factor import CFactorsLoader
-from solutions.db_generator import gen_ic_tests_db, gen_vt_tests_db
+from solutions.db_generator import gen_ic_tests_db, gen_vt_tests_db, gen_qtest_summary_db
+from solutions.perf import perf_step
+from solutions.db_io import save_with_continuity, save_splice, read_by_range
+from solutions.panel_align import KEY_COLUMNS, align_by_position
+from solutions.qsummary import CQTestSummaryStore
 
 
 class __CQTest:
@@ -25,23 +33,29 @@ class __CQTest:
         factors_avlb_dir: str,
         test_returns_avlb_dir: str,
         tests_dir: str,
+        universe: TUniverse,
     ):
         self.factor_grp = factor_grp
         self.ret = ret
         self.factors_avlb_dir = factors_avlb_dir
         self.test_returns_avlb_dir = test_returns_avlb_dir
         self.tests_dir = tests_dir
+        self.codebook = CUniverseCodebook.from_universe(universe)
 
     @property
     def save_id(self) -> str:
         return f"{self.factor_grp.factor_class}-{self.ret.ret_name}-{self.factor_grp.decay}"
 
+    @property
+    def perf_stage(self) -> str:
+        return os.path.basename(os.path.normpath(self.tests_dir))  # "ic_tests" or "vt_tests"
+
     def load_returns(self, bgn_date: str, stp_date: str) -> pd.DataFrame:
         returns_loader = CTestReturnLoader(
             ret=self.ret,
             test_returns_avlb_dir=self.test_returns_avlb_dir,
         )
-        return returns_loader.load(bgn_date, stp_date)
+        return self.codebook.encode_known(returns_loader.load(bgn_date, stp_date), source=self.ret.ret_name)
 
     def load_factors(self, bgn_date: str, stp_date: str) -> pd.DataFrame:
         factors_loader = CFactorsLoader(
@@ -49,42 +63,40 @@ class __CQTest:
             factors=self.factor_grp.factors,
             factors_avlb_dir=self.factors_avlb_dir,
         )
-        return factors_loader.load(bgn_date, stp_date)
+        return self.codebook.encode_known(factors_loader.load(bgn_date, stp_date), source=self.factor_grp.factor_class)
 
     def gen_test_db_struct(self) -> CDbStruct:
         raise NotImplementedError
 
-    def save(self, new_data: pd.DataFrame, calendar: CCalendar):
+    def get_summary_store(self) -> CQTestSummaryStore:
+        db_struct = gen_qtest_summary_db(
+            tests_dir=self.tests_dir,
+            factor_class=self.factor_grp.factor_class,
+            factors=self.factor_grp.factors,
+            ret=self.ret,
+        )
+        return CQTestSummaryStore(db_struct=db_struct, factor_names=self.factor_grp.factor_names)
+
+    def save(self, new_data: pd.DataFrame, calendar: CCalendar, replace_range: tuple[str, str] | None = None):
         """
 
         :param new_data: a pd.DataFrame with columns =
                         ["trade_date"] + self.factor_grp.factor_names
         :param calendar:
+        :param replace_range: (bgn_date, stp_date) to be spliced by a repair, instead of checking continuity
         :return:
         """
         test_db_struct = self.gen_test_db_struct()
-        check_and_makedirs(test_db_struct.db_save_dir)
-        sqldb = CMgrSqlDb(
-            db_save_dir=test_db_struct.db_save_dir,
-            db_name=test_db_struct.db_name,
-            table=test_db_struct.table,
-            mode="a",
-        )
-        if sqldb.check_continuity(new_data["trade_date"].iloc[0], calendar) == 0:
-            update_data = new_data[test_db_struct.table.vars.names]
-            sqldb.update(update_data=update_data)
+        if replace_range is not None:
+            save_splice(test_db_struct, new_data[test_db_struct.table.vars.names], *replace_range)
+        else:
+            save_with_continuity(test_db_struct, new_data[test_db_struct.table.vars.names], calendar)
         return 0
 
     def load(self, bgn_date: str, stp_date: str) -> pd.DataFrame:
         test_db_struct = self.gen_test_db_struct()
-        check_and_makedirs(test_db_struct.db_save_dir)
-        sqldb = CMgrSqlDb(
-            db_save_dir=test_db_struct.db_save_dir,
-            db_name=test_db_struct.db_name,
-            table=test_db_struct.table,
-            mode="r",
-        )
-        data = sqldb.read_by_range(
+        data = read_by_range(
+            test_db_struct,
             bgn_date=bgn_date,
             stp_date=stp_date,
             value_columns=["trade_date"] + self.factor_grp.factor_names,
@@ -100,24 +112,22 @@ class __CQTest:
     def get_plot_ylim(self) -> tuple[float, float]:
         raise NotImplementedError
 
+    @property
+    def plots_dir(self) -> str:
+        return os.path.join(self.tests_dir, "plots")
+
     def plot(self, plot_data: pd.DataFrame):
-        check_and_makedirs(save_dir := os.path.join(self.tests_dir, "plots"))
-        artist = CPlotLines(
-            plot_data=plot_data,
-            fig_name=f"{self.save_id}",
-            fig_save_dir=save_dir,
-            colormap="jet",
-            line_style=["-", "-."] * int(plot_data.shape[1] / 2),
-            line_width=1.2,
-        )
-        artist.plot()
-        artist.set_legend(loc="upper left")
-        artist.set_axis_x(xtick_count=20, xtick_label_size=8, xgrid_visible=True)
-        artist.set_axis_y(ylim=self.get_plot_ylim(), update_yticklabels=False, ygrid_visible=True)
-        artist.save_and_close()
-        return 0
+        return plot_cumsum(plot_data, fig_name=self.save_id, save_dir=self.plots_dir, ylim=self.get_plot_ylim())
+
+    def gen_report(self, yearly: pd.DataFrame, ret_scale: float = 100.0, ann_rate: float = 250) -> pd.DataFrame:
+        """
 
-    def gen_report(self, test_data: pd.DataFrame, ret_scale: float = 100.0, ann_rate: float = 250) -> pd.DataFrame:
+        :param yearly: a pd.DataFrame with columns = ["trade_year", "factor", "n", "mean", "std"],
+                       from CQTestSummaryStore.load_yearly
+        :param ret_scale:
+        :param ann_rate:
+        :return:
+        """
         raise NotImplementedError
 
     def save_report(self, report: pd.DataFrame, saving_index: bool, float_format: str = "%.6f"):
@@ -127,53 +137,108 @@ class __CQTest:
         report.to_csv(report_path, float_format=float_format, index=saving_index)
         return 0
 
-    def main_cal(self, bgn_date: str, stp_date: str, calendar: CCalendar):
+    def main_cal(self, bgn_date: str, stp_date: str, calendar: CCalendar, splice: bool = False):
+        """
+
+        :param bgn_date:
+        :param stp_date:
+        :param calendar:
+        :param splice: whether to replace [bgn_date, stp_date) of saved data, for repairs
+        :return:
+        """
+        if not splice:
+            # summary rows from bgn_date would keep sums of the test rows replaced here
+            summary_store = self.get_summary_store()
+            if (last_date := summary_store.last_date()) is not None and bgn_date <= last_date:
+                summary_store.rewind(bgn_date)
         buffer_bgn_date = calendar.get_next_date(bgn_date, -self.ret.shift)
         iter_dates = calendar.get_iter_list(buffer_bgn_date, stp_date)
         save_dates = iter_dates[self.ret.shift :]
         base_bgn_date, base_stp_date = iter_dates[0], iter_dates[-self.ret.shift]
-        returns_data = self.load_returns(base_bgn_date, base_stp_date)
-        factors_data = self.load_factors(base_bgn_date, base_stp_date)
-        input_data = pd.merge(
-            left=returns_data,
-            right=factors_data,
-            on=["trade_date", "instrument"],
-            how="inner",
-        )
-        lr, lf, li = len(returns_data), len(factors_data), len(input_data)
-        if (li != lr) or (li != lf):
-            raise ValueError(f"len of factor data = {lf}, len of return data = {lr}, len of input data = {li}.")
+        with perf_step(self.perf_stage, "load", tag=self.save_id) as rec:
+            returns_data = self.load_returns(base_bgn_date, base_stp_date)
+            factors_data = self.load_factors(base_bgn_date, base_stp_date)
+            rec.rows_out = len(returns_data) + len(factors_data)
+        with perf_step(self.perf_stage, "align", tag=self.save_id) as rec:
+            rec.rows_in = len(returns_data) + len(factors_data)
+            input_data = align_by_position(returns_data, factors_data)
+            rec.extra["positional"] = input_data is not None
+            if input_data is None:
+                # saved by an old version, or not for the same available universe
+                logger.warning(f"Keys of returns and factors for {SFG(self.save_id)} are not aligned, merge them")
+                input_data = pd.merge(
+                    left=returns_data,
+                    right=factors_data,
+                    on=KEY_COLUMNS,
+                    how="inner",
+                )
+                lr, lf, li = len(returns_data), len(factors_data), len(input_data)
+                if (li != lr) or (li != lf):
+                    raise ValueError(
+                        f"len of factor data = {lf}, len of return data = {lr}, len of input data = {li}."
+                    )
+            rec.rows_out = len(input_data)
         with Progress(
             TextColumn("{task.description}"),
             BarColumn(),
             TimeElapsedColumn(),
             TimeRemainingColumn(),
-        ) as pb:
+        ) as pb, perf_step(self.perf_stage, "core", tag=self.save_id) as rec:
+            rec.rows_in = len(input_data)
             task = pb.add_task(description=f"{self.save_id}")
             pb.update(task_id=task, completed=0, total=len(input_data["trade_date"].unique()))
             qtest_data = input_data.groupby(by="trade_date").apply(
                 self.core_for_groupby, pb=pb, task=task  # type:ignore
             )
             qtest_data = self.core_for_global(input_data, qtest_data)
+            rec.rows_out = len(qtest_data)
 
         qtest_data["trade_date"] = save_dates
         new_data = qtest_data[["trade_date"] + self.factor_grp.factor_names]
         new_data = new_data.reset_index(drop=True)
-        self.save(new_data, calendar)
+        with perf_step(self.perf_stage, "save", tag=self.save_id) as rec:
+            rec.rows_in = len(new_data)
+            self.save(new_data, calendar, replace_range=(bgn_date, stp_date) if splice else None)
         logger.info(f"{self.__class__.__name__} for {SFG(self.save_id)} finished.")
         return 0
 
-    def main_summary(self, bgn_date: str, stp_date: str):
-        test_data = self.load(bgn_date, stp_date).set_index("trade_date")
-        plot_data = test_data.cumsum()
-        self.plot(plot_data=plot_data)
-        report = self.gen_report(test_data)
-        self.save_report(report, saving_index=False)
-        return 0
+    def load_rolling_ir(self, win: int, bgn_date: str, stp_date: str) -> pd.DataFrame:
+        """
+        For monitoring factors, like rolling 60 or 250 days IR of ic-tests.
+        Test results before stp_date must have been summarized by main_summary.
+
+        :param win: number of test days
+        :param bgn_date:
+        :param stp_date:
+        :return: index = trade_date, columns = factor names
+        """
+        return self.get_summary_store().load_rolling_ir(win, bgn_date, stp_date)
+
+    def update_summary(self, stp_date: str) -> int:
+        with perf_step(self.perf_stage, "summary_update", tag=self.save_id) as rec:
+            rec.rows_out = self.get_summary_store().update(self.gen_test_db_struct(), stp_date)
+        return rec.rows_out
+
+    def update_summary_if_built(self, stp_date: str) -> bool:
+        """
+
+        :param stp_date:
+        :return: whether the test has been calculated and summarized, a missing one is skipped by
+                 main_qtests_summary with a warning, so that it does not stop summaries of others
+        """
+        db_struct_test = self.gen_test_db_struct()
+        if not os.path.exists(os.path.join(db_struct_test.db_save_dir, db_struct_test.db_name)):
+            logger.warning(f"Test {SFG(self.save_id)} is not calculated yet, its summary is skipped")
+            return False
+        self.update_summary(stp_date)
+        if not os.path.exists(self.get_summary_store().db_path):
+            logger.warning(f"Test {SFG(self.save_id)} has no result yet, its summary is skipped")
+            return False
+        return True
 
     def main(self, bgn_date: str, stp_date: str, calendar: CCalendar):
+        # reports and plots are made by main_qtests_summary, for all tests at once
         self.main_cal(bgn_date, stp_date, calendar)
-        self.main_summary(bgn_date, stp_date)
         return 0
 
 
@@ -205,26 +270,15 @@ class CICTest(__CQTest):
             ylim = (-80, 140)
         return ylim
 
-    def gen_report(self, test_data: pd.DataFrame, ret_scale: float = 100.0, ann_rate: float = 250) -> pd.DataFrame:
-        test_data["trade_year"] = test_data.index.map(lambda z: z[0:4])
-        dfs: list[pd.DataFrame] = []
-        for trade_year, trade_year_data in test_data.groupby("trade_year"):
-            ic_mean = trade_year_data[self.factor_grp.factor_names].mean()
-            ic_std = trade_year_data[self.factor_grp.factor_names].std()
-            ir = ic_mean / ic_std
-            trade_year_sum = (
-                pd.DataFrame(
-                    {
-                        "trade_year": trade_year,
-                        "IC": ic_mean,
-                        "IR": ir,
-                    }
-                )
-                .reset_index()
-                .rename(columns={"index": "factor"})
-            )
-            dfs.append(trade_year_sum)
-        report = pd.concat(dfs, axis=0, ignore_index=True)
+    def gen_report(self, yearly: pd.DataFrame, ret_scale: float = 100.0, ann_rate: float = 250) -> pd.DataFrame:
+        report = pd.DataFrame(
+            {
+                "factor": yearly["factor"],
+                "trade_year": yearly["trade_year"],
+                "IC": yearly["mean"],
+                "IR": yearly["mean"] / yearly["std"],
+            }
+        )
         return report
 
 
@@ -246,7 +300,7 @@ class CVTTest(__CQTest):
         for factor in self.factor_grp.factor_names:
             raw_wgt = (
                 input_data[["trade_date", "instrument", factor]]
-                .pivot_table(index="trade_date", columns="instrument", values=factor, aggfunc="first")
+                .pivot_table(index="trade_date", columns="instrument", values=factor, aggfunc="first", observed=True)
                 .fillna(0)
             )
             dlt_wgt = raw_wgt.diff().fillna(0)
@@ -265,53 +319,187 @@ class CVTTest(__CQTest):
     def get_plot_ylim(self) -> tuple[float, float]:
         return -0.30, 0.60
 
-    def gen_report(self, test_data: pd.DataFrame, ret_scale: float = 100.0, ann_rate: float = 250) -> pd.DataFrame:
-        test_data["trade_year"] = test_data.index.map(lambda z: z[0:4])
-        dfs: list[pd.DataFrame] = []
-        for trade_year, trade_year_data in test_data.groupby("trade_year"):
-            vt_mean = trade_year_data[self.factor_grp.factor_names].mean() * ret_scale
-            vt_std = trade_year_data[self.factor_grp.factor_names].std() * ret_scale
-            ann_ret = vt_mean * ann_rate
-            ann_vol = vt_std * np.sqrt(ann_rate)
-            sharpe = ann_ret / ann_vol
-            trade_year_sum = (
-                pd.DataFrame(
-                    {
-                        "trade_year": trade_year,
-                        "mean": vt_mean,
-                        "std": vt_std,
-                        "ann_ret": ann_ret,
-                        "ann_vol": ann_vol,
-                        "sharpe": sharpe,
-                    }
-                )
-                .reset_index()
-                .rename(columns={"index": "factor"})
-            )
-            dfs.append(trade_year_sum)
-        report = pd.concat(dfs, axis=0, ignore_index=True)
+    def gen_report(self, yearly: pd.DataFrame, ret_scale: float = 100.0, ann_rate: float = 250) -> pd.DataFrame:
+        vt_mean = yearly["mean"] * ret_scale
+        vt_std = yearly["std"] * ret_scale
+        ann_ret = vt_mean * ann_rate
+        ann_vol = vt_std * np.sqrt(ann_rate)
+        sharpe = ann_ret / ann_vol
+        report = pd.DataFrame(
+            {
+                "factor": yearly["factor"],
+                "trade_year": yearly["trade_year"],
+                "mean": vt_mean,
+                "std": vt_std,
+                "ann_ret": ann_ret,
+                "ann_vol": ann_vol,
+                "sharpe": sharpe,
+            }
+        )
         return report
 
 
+# --------------------------
+# ------- summaries --------
+# --------------------------
+PLOT_HASHES_FILE = "hashes.json"
+
+
+def plot_cumsum(plot_data: pd.DataFrame, fig_name: str, save_dir: str, ylim: tuple[float, float]):
+    check_and_makedirs(save_dir)
+    artist = CPlotLines(
+        plot_data=plot_data,
+        fig_name=fig_name,
+        fig_save_dir=save_dir,
+        colormap="jet",
+        line_style=["-", "-."] * int(plot_data.shape[1] / 2),
+        line_width=1.2,
+    )
+    artist.plot()
+    artist.set_legend(loc="upper left")
+    artist.set_axis_x(xtick_count=20, xtick_label_size=8, xgrid_visible=True)
+    artist.set_axis_y(ylim=ylim, update_yticklabels=False, ygrid_visible=True)
+    artist.save_and_close()
+    return 0
+
+
+def init_plot_worker():
+    # workers only save figures to files, the non-interactive backend is enough and the cheapest
+    import matplotlib
+
+    matplotlib.use("Agg", force=True)
+
+
+def get_plot_hash(plot_data: pd.DataFrame, ylim: tuple[float, float]) -> str:
+    h = hashlib.sha1(pd.util.hash_pandas_object(plot_data, index=True).to_numpy().tobytes())
+    h.update(repr((list(plot_data.columns), ylim)).encode())
+    return h.hexdigest()
+
+
+def load_plot_hashes(plots_dir: str) -> dict[str, str]:
+    path = os.path.join(plots_dir, PLOT_HASHES_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_plot_hashes(plots_dir: str, hashes: dict[str, str]):
+    check_and_makedirs(plots_dir)
+    with open(os.path.join(plots_dir, PLOT_HASHES_FILE), "w") as f:
+        json.dump(hashes, f, indent=2, sort_keys=True)
+    return 0
+
+
+def save_reports(tests: list[__CQTest], bgn_date: str, stp_date: str):
+    """
+    Yearly statistics of all tests are concatenated, and reports are calculated in one call
+    for each test class, then split by test to be saved.
+    """
+    by_cls: dict[type, list[__CQTest]] = {}
+    for test in tests:
+        by_cls.setdefault(type(test), []).append(test)
+    for cls_tests in by_cls.values():
+        yearly = pd.concat(
+            [
+                test.get_summary_store().load_yearly(bgn_date, stp_date).assign(save_id=test.save_id)
+                for test in cls_tests
+            ],
+            axis=0,
+            ignore_index=True,
+        )
+        report = cls_tests[0].gen_report(yearly)
+        reports = dict(list(report.groupby(yearly["save_id"].to_numpy(), sort=False)))
+        for test in cls_tests:
+            if (test_report := reports.get(test.save_id)) is None:
+                logger.warning(f"No test result of {SFG(test.save_id)} in [{bgn_date}, {stp_date}), report is skipped")
+                continue
+            test.save_report(test_report.reset_index(drop=True), saving_index=False)
+    return 0
+
+
+def save_plots(tests: list[__CQTest], bgn_date: str, stp_date: str, call_multiprocess: bool) -> tuple[int, int]:
+    """
+    Plots whose data and settings are the same as last time are skipped, others are rendered
+    in a pool of processes with Agg backend.
+
+    :return: number of plots rendered and skipped
+    """
+    hashes_by_dir: dict[str, dict[str, str]] = {}
+    jobs: list[tuple[__CQTest, pd.DataFrame, str]] = []
+    for test in tests:
+        hashes = hashes_by_dir.setdefault(test.plots_dir, load_plot_hashes(test.plots_dir))
+        plot_data = test.get_summary_store().load_cumsum(bgn_date, stp_date)
+        if plot_data.empty:
+            continue
+        plot_hash = get_plot_hash(plot_data, test.get_plot_ylim())
+        if hashes.get(test.save_id) == plot_hash and glob.glob(os.path.join(test.plots_dir, f"{test.save_id}.*")):
+            continue
+        jobs.append((test, plot_data, plot_hash))
+
+    def __done(test: __CQTest, plot_hash: str):
+        hashes_by_dir[test.plots_dir][test.save_id] = plot_hash
+
+    if call_multiprocess and len(jobs) > 1:
+        with mp.get_context("spawn").Pool(initializer=init_plot_worker) as pool:
+            for test, plot_data, plot_hash in jobs:
+                pool.apply_async(
+                    plot_cumsum,
+                    args=(plot_data, test.save_id, test.plots_dir, test.get_plot_ylim()),
+                    callback=lambda _, t=test, h=plot_hash: __done(t, h),
+                    error_callback=error_handler,
+                )
+            pool.close()
+            pool.join()
+    else:
+        for test, plot_data, plot_hash in jobs:
+            test.plot(plot_data)
+            __done(test, plot_hash)
+    for plots_dir, hashes in hashes_by_dir.items():
+        save_plot_hashes(plots_dir, hashes)
+    return len(jobs), len(tests) - len(jobs)
+
+
+@qtimer
+def main_qtests_summary(tests: list[__CQTest], bgn_date: str, stp_date: str, call_multiprocess: bool):
+    """
+    Summary stage of ic-tests or vt-tests, separated from calculation, for tests of any factor classes
+
+    :param tests: from gen_qtests
+    :param bgn_date:
+    :param stp_date:
+    :param call_multiprocess: whether to render plots in a pool of processes
+    :return:
+    """
+    tests = [test for test in tests if test.update_summary_if_built(stp_date)]
+    if not tests:
+        return 0
+    perf_stage = tests[0].perf_stage
+    with perf_step(perf_stage, "report", tag="all") as rec:
+        save_reports(tests, bgn_date, stp_date)
+        rec.rows_in = len(tests)
+    with perf_step(perf_stage, "plot", tag="all") as rec:
+        rendered, skipped = save_plots(tests, bgn_date, stp_date, call_multiprocess)
+        rec.extra.update({"rendered": rendered, "skipped": skipped})
+    logger.info(f"Summary of {len(tests)} tests finished, {rendered} plots rendered, {skipped} unchanged")
+    return 0
+
+
 # --------------------------
 # --- interface for main ---
 # --------------------------
 TICTestAuxArgs = tuple[TFactorsAvlbDirType, TTestReturnsAvlbDirType]
 
 
-@qtimer
-def main_qtests(
+def gen_qtests(
     rets: TRets,
     factor_grp: CCfgFactorGrp,
     aux_args_list: list[TICTestAuxArgs],
     tests_dir: str,
-    bgn_date: str,
-    stp_date: str,
-    calendar: CCalendar,
+    universe: TUniverse,
     test_type: Literal["ic", "vt"],
-    call_multiprocess: bool,
     cost_rate: float,
-):
+) -> list[__CQTest]:
     if test_type == "ic":
         test_cls = CICTest
     elif test_type == "vt":
@@ -328,12 +516,35 @@ def main_qtests(
                 "factors_avlb_dir": factors_avlb_dir,
                 "test_returns_avlb_dir": test_returns_avlb_dir,
                 "tests_dir": tests_dir,
+                "universe": universe,
             }
             if test_type == "vt":
                 kwargs.update({"cost_rate": cost_rate})
             test = test_cls(**kwargs)
             tests.append(test)
+    return tests
+
+
+@qtimer
+def main_qtests(
+    rets: TRets,
+    factor_grp: CCfgFactorGrp,
+    aux_args_list: list[TICTestAuxArgs],
+    tests_dir: str,
+    universe: TUniverse,
+    bgn_date: str,
+    stp_date: str,
+    calendar: CCalendar,
+    test_type: Literal["ic", "vt"],
+    call_multiprocess: bool,
+    cost_rate: float,
+    summary: bool = True,
+):
+    """
 
+    :param summary: whether to run main_qtests_summary for these tests after calculation
+    """
+    tests = gen_qtests(rets, factor_grp, aux_args_list, tests_dir, universe, test_type, cost_rate)
     if call_multiprocess:
         with mp.get_context("spawn").Pool() as pool:
             for test in tests:
@@ -351,4 +562,6 @@ def main_qtests(
     else:
         for test in tests:
             test.main(bgn_date, stp_date, calendar)
+    if summary:
+        main_qtests_summary(tests, bgn_date, stp_date, call_multiprocess)
     return 0
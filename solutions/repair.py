@@ -0,0 +1,249 @@
+"""
+Repair of output databases, recomputing only the dates they miss instead of rebuilding them.
+
+Savers skip a save which does not continue from the last date in database, so a failed run leaves
+holes in some tables, or leaves them behind the others. Switch 'repair' scans tables against the
+dates they are expected to have in [bgn_date, stp_date), stage by stage in order of dependency:
+    by-instrument factors:  dates of preprocess of each instrument
+    available factors:      dates of the available universe, in raw, sig and ewa
+    ic and vt tests:        trade dates of the calendar
+    icov:                   trade dates of the calendar
+Dates before the first saved one of a table, in the whole table, are not gaps, since tables may start at different dates.
+Each gap is recomputed by the usual calculation from its buffer begin date, and spliced in by
+save_splice, which deletes old rows of the range and inserts new ones in a single transaction.
+Dates of a stage depending on a repaired range of the stage before, like available factors within
+the moving average window after repaired shards, are stale, and recomputed in the same way.
+"""
+
+from loguru import logger
+from rich.progress import track
+from husfort.qutility import SFG, SFY, qtimer
+from husfort.qsqlite import CDbStruct
+from husfort.qcalendar import CCalendar
+from solutions.perf import perf_step
+from solutions.concurrency import map_loaders
+from solutions.db_io import read_first_date, read_trade_dates
+from solutions.panel_store import read_preprocess
+from solutions.factor import CFactorsByInstru, CFactorsAvlb
+from solutions.icov import CICOV
+
+TDateRange = tuple[str, str]  # [bgn_date, stp_date)
+
+
+def to_ranges(selected_dates: set[str], all_dates: list[str], stp_date: str) -> list[TDateRange]:
+    """
+
+    :param selected_dates: "yyyymmdd", part of all_dates
+    :param all_dates: sorted "yyyymmdd"
+    :param stp_date: stop date of all_dates
+    :return: ranges of consecutive dates of all_dates which are selected, each stops at the next
+             date of all_dates, or stp_date for the last one
+    """
+    ranges: list[TDateRange] = []
+    range_bgn_date: str | None = None
+    for trade_date in all_dates:
+        if trade_date not in selected_dates:
+            if range_bgn_date is not None:
+                ranges.append((range_bgn_date, trade_date))
+                range_bgn_date = None
+        elif range_bgn_date is None:
+            range_bgn_date = trade_date
+    if range_bgn_date is not None:
+        ranges.append((range_bgn_date, stp_date))
+    return ranges
+
+
+def find_gaps(
+    expected_dates: list[str], saved_dates: list[str], stp_date: str, first_date: str | None
+) -> list[TDateRange]:
+    """
+
+    :param expected_dates: sorted "yyyymmdd" which should be saved
+    :param saved_dates: sorted "yyyymmdd" which are saved, within the range of expected_dates
+    :param stp_date: stop date of expected_dates
+    :param first_date: the first date of the whole table, which may be before the range of expected_dates,
+                       None if the table is empty
+    :return: ranges of consecutive expected dates which are not saved, see to_ranges.
+             Dates before first_date are not gaps.
+    """
+    if first_date is not None:
+        expected_dates = [d for d in expected_dates if d >= first_date]
+    return to_ranges(set(expected_dates) - set(saved_dates), expected_dates, stp_date)
+
+
+def merge_ranges(ranges: list[TDateRange]) -> list[TDateRange]:
+    """
+
+    :param ranges:
+    :return: sorted ranges, overlapping or adjacent ones are merged
+    """
+    merged: list[TDateRange] = []
+    for bgn_date, stp_date in sorted(ranges):
+        if merged and bgn_date <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stp_date))
+        else:
+            merged.append((bgn_date, stp_date))
+    return merged
+
+
+def lag_ranges(
+    ranges: list[TDateRange], bgn_shift: int, stp_shift: int, stp_date: str, calendar: CCalendar
+) -> list[TDateRange]:
+    """
+    Ranges of a stage made stale by repaired ranges of the stage before
+
+    :param ranges: repaired ranges of the stage before
+    :param bgn_shift: trade dates from the first repaired date to the first stale date
+    :param stp_shift: trade dates from the stop date of a repaired range to the stop date of stale ones
+    :param stp_date: stale ranges are clipped to it
+    :param calendar:
+    :return:
+    """
+
+    def shift(trade_date: str, n: int) -> str:
+        return stp_date if trade_date >= stp_date else min(calendar.get_next_date(trade_date, shift=n), stp_date)
+
+    lagged = [(shift(b, bgn_shift), shift(s, stp_shift)) for b, s in ranges]
+    return merge_ranges([(b, s) for b, s in lagged if b < s])
+
+
+def scan_table(db_struct: CDbStruct, expected_dates: list[str], bgn_date: str, stp_date: str) -> list[TDateRange]:
+    saved_dates = read_trade_dates(db_struct, bgn_date, stp_date)
+    return find_gaps(expected_dates, saved_dates, stp_date, read_first_date(db_struct))
+
+
+def log_ranges(name: str, ranges: list[TDateRange]):
+    if ranges:
+        desc = ", ".join(f"[{b}, {s})" for b, s in ranges)
+        logger.info(f"{SFY(len(ranges))} ranges of {SFG(name)} to be repaired: {desc}")
+    else:
+        logger.info(f"No gap is found in {SFG(name)}")
+
+
+def repair_factors_by_instru(
+    fac: CFactorsByInstru, db_struct_preprocess: CDbStruct, bgn_date: str, stp_date: str, calendar: CCalendar
+) -> list[TDateRange]:
+    """
+
+    :return: merged ranges repaired of any instrument
+    """
+    tag = fac.factor_grp.factor_class
+
+    def scan(instru: str) -> list[TDateRange]:
+        expected = read_preprocess(db_struct_preprocess, instru, bgn_date, stp_date, value_columns=["trade_date"])
+        return scan_table(fac.get_instru_db(instru), expected["trade_date"].tolist(), bgn_date, stp_date)
+
+    with perf_step("repair", "scan", tag=f"{tag}-by_instru") as rec:
+        gaps_by_instru = dict(zip(fac.universe, map_loaders(scan, fac.universe)))
+        gaps_by_instru = {instru: gaps for instru, gaps in gaps_by_instru.items() if gaps}
+        rec.rows_out = sum(len(gaps) for gaps in gaps_by_instru.values())
+    for instru, gaps in gaps_by_instru.items():
+        log_ranges(f"{tag}/{instru}", gaps)
+
+    repaired: list[TDateRange] = []
+    for instru, gaps in track(gaps_by_instru.items(), description=f"Repairing factor {SFY(tag)} by instrument"):
+        for gap_bgn_date, gap_stp_date in gaps:
+            with perf_step("repair", "factor", tag=f"{tag}-{instru}") as rec:
+                factor_data = fac.cal_factor_by_instru(instru, gap_bgn_date, gap_stp_date, calendar)
+                factor_data = factor_data.query(f"trade_date >= '{gap_bgn_date}' and trade_date < '{gap_stp_date}'")
+                rec.rows_out = len(factor_data)
+                fac.save_by_instru(factor_data, instru, calendar, replace_range=(gap_bgn_date, gap_stp_date))
+            repaired.append((gap_bgn_date, gap_stp_date))
+    return merge_ranges(repaired)
+
+
+def repair_factors_avlb(
+    fac_avlb: CFactorsAvlb, stale: list[TDateRange], bgn_date: str, stp_date: str, calendar: CCalendar
+) -> list[TDateRange]:
+    """
+
+    :param stale: ranges repaired of by-instrument factors
+    :return: merged ranges repaired
+    """
+    tag = fac_avlb.factor_grp.factor_class
+    with perf_step("repair", "scan", tag=f"{tag}-avlb"):
+        expected = read_trade_dates(fac_avlb.db_struct_avlb, bgn_date, stp_date)
+        gaps = [
+            gap
+            for save_type in ("raw", "sig", "ewa")
+            for gap in scan_table(fac_avlb.get_avlb_db(save_type), expected, bgn_date, stp_date)  # type:ignore
+        ]
+    # an available factor depends on factors by instrument of the last decay.win days
+    stale = lag_ranges(stale, 0, fac_avlb.factor_grp.decay.win - 1, stp_date, calendar)
+    ranges = merge_ranges(gaps + stale)
+    log_ranges(f"{tag}/avlb", ranges)
+    for range_bgn_date, range_stp_date in ranges:
+        fac_avlb.main(range_bgn_date, range_stp_date, calendar, splice=True)
+    return ranges
+
+
+def repair_qtests(
+    tests: list, stale: list[TDateRange], bgn_date: str, stp_date: str, calendar: CCalendar
+) -> int:
+    """
+
+    :param tests: ic-tests or vt-tests of one factor class, from solutions.qtests.gen_qtests
+    :param stale: ranges repaired of available factors
+    :return: number of tests repaired
+    """
+    expected = calendar.get_iter_list(bgn_date, stp_date)
+    n_repaired = 0
+    for test in tests:
+        with perf_step("repair", "scan", tag=test.save_id):
+            gaps = scan_table(test.gen_test_db_struct(), expected, bgn_date, stp_date)
+        # a test depends on factors of ret.shift days before, and vt-tests on the day before that too
+        test_stale = lag_ranges(stale, test.ret.shift, test.ret.shift + 1, stp_date, calendar)
+        ranges = merge_ranges(gaps + test_stale)
+        log_ranges(test.save_id, ranges)
+        if not ranges:
+            continue
+        for range_bgn_date, range_stp_date in ranges:
+            test.main_cal(range_bgn_date, range_stp_date, calendar, splice=True)
+        # running sums after the first repaired date are summed again
+        test.get_summary_store().rewind(ranges[0][0])
+        test.update_summary(stp_date)
+        n_repaired += 1
+    return n_repaired
+
+
+def repair_icov(icov: CICOV, bgn_date: str, stp_date: str, calendar: CCalendar) -> list[TDateRange]:
+    expected = calendar.get_iter_list(bgn_date, stp_date)
+    with perf_step("repair", "scan", tag="icov"):
+        ranges = scan_table(icov.db_struct_icov, expected, bgn_date, stp_date)
+    log_ranges("icov", ranges)
+    for range_bgn_date, range_stp_date in ranges:
+        icov.main(range_bgn_date, range_stp_date, calendar, splice=True)
+    return ranges
+
+
+@qtimer
+def main_repair_factor(
+    fac: CFactorsByInstru,
+    fac_avlb: CFactorsAvlb,
+    qtests: list,
+    db_struct_preprocess: CDbStruct,
+    bgn_date: str,
+    stp_date: str,
+    calendar: CCalendar,
+):
+    """
+
+    :param fac: from solutions.factor.pick_factor
+    :param fac_avlb:
+    :param qtests: ic-tests and vt-tests of the factor class, from solutions.qtests.gen_qtests
+    :param db_struct_preprocess:
+    :param bgn_date:
+    :param stp_date:
+    :param calendar:
+    :return:
+    """
+    tag = fac.factor_grp.factor_class
+    repaired_by_instru = repair_factors_by_instru(fac, db_struct_preprocess, bgn_date, stp_date, calendar)
+    repaired_avlb = repair_factors_avlb(fac_avlb, repaired_by_instru, bgn_date, stp_date, calendar)
+    n_tests = repair_qtests(qtests, repaired_avlb, bgn_date, stp_date, calendar)
+    logger.info(
+        f"Repair of factor {SFG(tag)} finished, {SFY(len(repaired_by_instru))} ranges by instrument, "
+        f"{SFY(len(repaired_avlb))} ranges available, {SFY(n_tests)} tests repaired. "
+        f"Run switch 'summary' to update reports and plots"
+    )
+    return 0
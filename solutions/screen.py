@@ -0,0 +1,326 @@
+"""
+Screening of factor variants.
+
+The grid of a factor class, like 50 wins, is cut into blocks. For each block, a factor group with
+these args is calculated for all instruments in memory, passed through the same steps as
+CFactorsAvlb, and tested against test returns with vectorised ic and vt. Only summary statistics
+of each variant and the full series of the top k variants are kept across blocks, so memory is
+bounded by the block size rather than the size of the grid. Nothing is saved to project databases.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from dataclasses import asdict, fields
+from loguru import logger
+from rich.progress import track
+from husfort.qutility import SFG, check_and_makedirs
+from husfort.qsqlite import CDbStruct
+from husfort.qcalendar import CCalendar
+from typedefs.typedef_factors import CCfgFactorGrp, CCfgScreen, TFactorNames
+from typedefs.typedef_instrus import TUniverse, CUniverseCodebook
+from typedefs.typedef_returns import CRet, TRets
+from solutions.factor import CFactorsByInstru, CFactorsPanel, CFactorsAvlb
+from solutions.test_return import CTestReturnLoader
+from solutions.panel_align import KEY_COLUMNS
+from solutions.perf import perf_step
+
+
+def gen_block_cfgs(factor_grp: CCfgFactorGrp, grid: dict[str, list], block_size: int) -> list[CCfgFactorGrp]:
+    """
+    The first arg of grid is cut into blocks, other args of grid are used as they are. Values of the
+    first arg in factor_grp.args are calculated along in every block, because extras like DIF of
+    some factor classes depend on them, their results are tested only once. If all values of the grid
+    are in factor_grp.args already, the only block holds these values.
+
+    :param factor_grp: from config, its type must set factor_class in __init__, like CCfgFactorGrpREOC
+    :param grid: arg -> values, like {"wins": [2, 3, 4, 5]}
+    :param block_size: number of values of the first arg in each block
+    :return: factor groups of the same type as factor_grp
+    """
+    key, *_ = grid
+    anchors = list(asdict(factor_grp.args)[key])
+    new_values = [v for v in grid[key] if v not in anchors]
+    others = {k: v for k, v in grid.items() if k != key}
+    kwargs = {f.name: getattr(factor_grp, f.name) for f in fields(factor_grp) if f.name != "factor_class"}
+    res: list[CCfgFactorGrp] = []
+    for i in range(0, len(new_values) or 1, block_size):
+        block = {key: anchors + new_values[i : i + block_size]}
+        args = type(factor_grp.args)(**(asdict(factor_grp.args) | others | block))
+        res.append(type(factor_grp)(**(kwargs | {"args": args})))
+    return res
+
+
+def cal_ic(data: pd.DataFrame, factor_names: TFactorNames, ret_name: str) -> pd.DataFrame:
+    """
+    Spearman correlation between each factor and return for each date, the same as
+    pd.DataFrame.corrwith(method="spearman") on each date, but ranks and sums of all
+    factors are computed by grouped operations at once.
+
+    :param data: with columns = ["trade_date", ret_name] + factor_names
+    :param factor_names:
+    :param ret_name:
+    :return: index = trade_date, columns = factor_names
+    """
+    r = data[[ret_name]].to_numpy()
+    valid = data[factor_names].notna() & np.isfinite(r)
+    x = data[factor_names].where(valid)
+    y = pd.DataFrame(np.where(valid, r, np.nan), index=data.index, columns=factor_names)
+    dates = data["trade_date"]
+    rx = x.groupby(dates).rank()
+    ry = y.groupby(dates).rank()
+    grp = pd.concat(
+        [valid.astype(np.float64), rx, ry, rx * rx, ry * ry, rx * ry],
+        axis=1,
+        keys=["n", "sx", "sy", "sxx", "syy", "sxy"],
+    ).groupby(dates).sum()
+    n = grp["n"]
+    cov = grp["sxy"] - grp["sx"] * grp["sy"] / n
+    var_x = grp["sxx"] - grp["sx"] ** 2 / n
+    var_y = grp["syy"] - grp["sy"] ** 2 / n
+    ic = cov / np.sqrt(var_x * var_y)
+    return ic.where((n > 1) & (var_x > 0) & (var_y > 0))
+
+
+def cal_vt(data: pd.DataFrame, factor_names: TFactorNames, ret: CRet, cost_rate: float) -> pd.DataFrame:
+    """
+    Same as CVTTest.core_for_groupby and CVTTest.core_for_global, for all factors at once
+
+    :param data: with columns = ["trade_date", "instrument", ret.ret_name] + factor_names
+    :param factor_names:
+    :param ret:
+    :param cost_rate:
+    :return: index = trade_date, columns = factor_names
+    """
+    dates = data["trade_date"]
+    pnl = data[factor_names].mul(data[ret.ret_name], axis=0)
+    has_nan = pnl.isna().groupby(dates).any()
+    vt = (pnl.groupby(dates).sum() / ret.win).mask(has_nan)
+    raw_wgt = data.set_index(["trade_date", "instrument"])[factor_names].unstack("instrument").fillna(0)
+    dlt_wgt = raw_wgt.diff().fillna(0).abs()
+    turnover = dlt_wgt.T.groupby(level=0).sum().T[factor_names]
+    return vt - turnover * cost_rate
+
+
+def summarize_ic(ic: pd.DataFrame) -> pd.DataFrame:
+    summary = pd.DataFrame({"n": ic.count(), "IC": ic.mean(), "std": ic.std()})
+    summary["IR"] = summary["IC"] / summary["std"]
+    summary["score"] = summary["IR"].abs()
+    return summary
+
+
+def summarize_vt(vt: pd.DataFrame, ret_scale: float = 100.0, ann_rate: float = 250) -> pd.DataFrame:
+    summary = pd.DataFrame({"n": vt.count(), "mean": vt.mean() * ret_scale, "std": vt.std() * ret_scale})
+    summary["ann_ret"] = summary["mean"] * ann_rate
+    summary["ann_vol"] = summary["std"] * np.sqrt(ann_rate)
+    summary["sharpe"] = summary["ann_ret"] / summary["ann_vol"]
+    summary["score"] = summary["sharpe"]
+    return summary
+
+
+class CTopK:
+    def __init__(self, k: int):
+        self.k = k
+        self.series = pd.DataFrame()
+        self.scores = pd.Series(dtype=np.float64)
+
+    def push(self, series: pd.DataFrame, scores: pd.Series):
+        """
+
+        :param series: test series of new variants, columns = factor names
+        :param scores: the larger the better, index = factor names
+        :return:
+        """
+        scores = pd.concat([self.scores, scores.dropna()])
+        self.scores = scores.sort_values(ascending=False).iloc[: self.k]
+        kept = pd.concat([self.series, series], axis=1)
+        self.series = kept[self.scores.index]
+
+
+class CFactorScreener:
+    def __init__(
+        self,
+        fac: CFactorsByInstru,
+        cfg_screen: CCfgScreen,
+        universe: TUniverse,
+        db_struct_avlb: CDbStruct,
+        test_returns_avlb_raw_dir: str,
+        ic_rets: TRets,
+        vt_rets: TRets,
+        cost_rate: float,
+        screen_dir: str,
+    ):
+        """
+
+        :param fac: factor from config, built by pick_factor
+        :param cfg_screen:
+        :param universe:
+        :param db_struct_avlb:
+        :param test_returns_avlb_raw_dir:
+        :param ic_rets:
+        :param vt_rets:
+        :param cost_rate: for vt
+        :param screen_dir:
+        """
+        self.fac = fac
+        self.factor_class = fac.factor_grp.factor_class
+        self.cfg_screen = cfg_screen
+        self.universe = universe
+        self.db_struct_avlb = db_struct_avlb
+        self.test_returns_avlb_raw_dir = test_returns_avlb_raw_dir
+        self.ic_rets = ic_rets
+        self.vt_rets = vt_rets
+        self.cost_rate = cost_rate
+        self.save_dir = os.path.join(screen_dir, self.factor_class)
+        self.codebook = CUniverseCodebook.from_universe(universe)
+
+    def gen_fac_avlb(self, factor_grp: CCfgFactorGrp) -> CFactorsAvlb:
+        # only calculation methods are used, so no directories are needed
+        return CFactorsAvlb(
+            factor_grp=factor_grp,
+            universe=self.universe,
+            factors_by_instru_dir="",
+            factors_avlb_raw_dir="",
+            factors_avlb_sig_dir="",
+            factors_avlb_ewa_dir="",
+            db_struct_avlb=self.db_struct_avlb,
+        )
+
+    def cal_factors(self, fac: CFactorsByInstru, ref_bgn_date: str, stp_date: str, calendar: CCalendar) -> pd.DataFrame:
+        """
+
+        :return: a pd.DataFrame with columns = ["trade_date", "instrument"] + factor names, from ref_bgn_date
+        """
+        if isinstance(fac, CFactorsPanel):
+            return fac.main_panel(ref_bgn_date, stp_date, calendar, save_shards=False)
+        dfs: list[pd.DataFrame] = []
+        for instru in track(self.universe, description=f"Calculating {SFG(self.factor_class)} by instrument"):
+            df = fac.cal_factor_by_instru(instru, ref_bgn_date, stp_date, calendar)
+            dfs.append(df.assign(instrument=instru))
+        factor_data = pd.concat(dfs, axis=0, ignore_index=True)
+        return factor_data[["trade_date", "instrument"] + fac.factor_grp.factor_names]
+
+    def cal_avlb(
+        self, fac_avlb: CFactorsAvlb, ref_fac_data: pd.DataFrame, bgn_date: str, stp_date: str, calendar: CCalendar
+    ) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Same steps as CFactorsAvlb.main, without saving
+
+        :return: normalized factors for ic, and moving average of signals for vt, both from bgn_date
+        """
+        ref_fac_data = fac_avlb.codebook.encode_known(ref_fac_data, source=fac_avlb.factor_grp.factor_class)
+        available_data = fac_avlb.load_available(bgn_date, stp_date, calendar)
+        raw_data = pd.merge(
+            left=available_data,
+            right=ref_fac_data,
+            on=KEY_COLUMNS,
+            how="left",
+        ).sort_values(by=["trade_date", "sectorL1"])
+        nrm_data = fac_avlb.normalize(fac_avlb.fillna_by_sector(raw_data))
+        ewa_data = fac_avlb.ewa(fac_avlb.convert_to_signal(nrm_data))
+        return nrm_data.query(f"trade_date >= '{bgn_date}'"), ewa_data.query(f"trade_date >= '{bgn_date}'")
+
+    def load_returns(self, ret: CRet, bgn_date: str, stp_date: str, calendar: CCalendar) -> pd.DataFrame:
+        """
+
+        :return: test returns of base dates, like __CQTest.main_cal, trade_date are labelled with
+                 save dates, which are ret.shift days after base dates
+        """
+        buffer_bgn_date = calendar.get_next_date(bgn_date, -ret.shift)
+        iter_dates = calendar.get_iter_list(buffer_bgn_date, stp_date)
+        base_bgn_date, base_stp_date = iter_dates[0], iter_dates[-ret.shift]
+        loader = CTestReturnLoader(ret=ret, test_returns_avlb_dir=self.test_returns_avlb_raw_dir)
+        returns_data = self.codebook.encode_known(loader.load(base_bgn_date, base_stp_date), source=ret.ret_name)
+        save_dates = dict(zip(iter_dates, iter_dates[ret.shift :]))
+        returns_data["save_date"] = returns_data["trade_date"].map(save_dates)
+        return returns_data
+
+    def test_block(
+        self,
+        factor_names: TFactorNames,
+        nrm_data: pd.DataFrame,
+        ewa_data: pd.DataFrame,
+        returns: dict[tuple[str, str], pd.DataFrame],
+    ) -> dict[tuple[str, str], pd.DataFrame]:
+        """
+
+        :return: (test, ret_name) -> test series, index = save date, columns = factor_names
+        """
+        res: dict[tuple[str, str], pd.DataFrame] = {}
+        for (test, ret_name), returns_data in returns.items():
+            factor_data = nrm_data if test == "ic" else ewa_data
+            input_data = pd.merge(
+                left=returns_data,
+                right=factor_data[KEY_COLUMNS + factor_names],
+                on=KEY_COLUMNS,
+                how="inner",
+            )
+            if test == "ic":
+                series = cal_ic(input_data, factor_names, ret_name)
+            else:
+                ret = CRet.from_string(ret_name)
+                series = cal_vt(input_data, factor_names, ret, self.cost_rate)
+            save_dates = input_data.drop_duplicates("trade_date").set_index("trade_date")["save_date"]
+            res[(test, ret_name)] = series.set_axis(save_dates.loc[series.index].to_numpy(), axis=0)
+        return res
+
+    def save(self, summaries: dict[tuple[str, str], list[pd.DataFrame]], top_ks: dict[tuple[str, str], CTopK]):
+        check_and_makedirs(self.save_dir)
+        for (test, ret_name), dfs in summaries.items():
+            summary = pd.concat(dfs, axis=0).sort_values(by="score", ascending=False)
+            summary.to_csv(
+                os.path.join(self.save_dir, f"summary-{test}-{ret_name}.csv"),
+                float_format="%.6f",
+                index_label="factor",
+            )
+            top_k = top_ks[(test, ret_name)]
+            top_k.series.sort_index().to_csv(
+                os.path.join(self.save_dir, f"top{top_k.k}-{test}-{ret_name}.csv"),
+                float_format="%.6f",
+                index_label="trade_date",
+            )
+        return 0
+
+    def main(self, bgn_date: str, stp_date: str, calendar: CCalendar):
+        if self.factor_class not in self.cfg_screen.grids:
+            raise ValueError(
+                f"No grid for {self.factor_class} in screen of config.yaml, "
+                f"grids are defined for {list(self.cfg_screen.grids)}"
+            )
+        grid = self.cfg_screen.grids[self.factor_class]
+        block_cfgs = gen_block_cfgs(self.fac.factor_grp, grid, self.cfg_screen.block_size)
+        logger.info(f"Screen {SFG(self.factor_class)} with {len(block_cfgs)} blocks of {grid}")
+
+        # test returns are shared by all blocks
+        rets = [("ic", ret) for ret in self.ic_rets] + [("vt", ret) for ret in self.vt_rets]
+        returns = {(test, ret.ret_name): self.load_returns(ret, bgn_date, stp_date, calendar) for test, ret in rets}
+        base_bgn_date = min(df["trade_date"].min() for df in returns.values())
+        summaries: dict[tuple[str, str], list[pd.DataFrame]] = {k: [] for k in returns}
+        top_ks = {k: CTopK(self.cfg_screen.top_k) for k in returns}
+        tested: set[str] = set()
+
+        for i, block_cfg in enumerate(block_cfgs):
+            tag = f"{self.factor_class}-B{i:03d}"
+            fac_avlb = self.gen_fac_avlb(block_cfg)
+            with perf_step("screen", "factor", tag=tag) as rec:
+                ref_bgn_date = fac_avlb.get_ref_bgn_date(base_bgn_date, calendar)
+                ref_fac_data = self.cal_factors(self.fac.clone(block_cfg), ref_bgn_date, stp_date, calendar)
+                rec.rows_out = len(ref_fac_data)
+            with perf_step("screen", "avlb", tag=tag) as rec:
+                rec.rows_in = len(ref_fac_data)
+                nrm_data, ewa_data = self.cal_avlb(fac_avlb, ref_fac_data, base_bgn_date, stp_date, calendar)
+                rec.rows_out = len(nrm_data)
+            factor_names = [f for f in block_cfg.factor_names if f not in tested]
+            with perf_step("screen", "test", tag=tag) as rec:
+                rec.rows_in = len(nrm_data) + len(ewa_data)
+                block_series = self.test_block(factor_names, nrm_data, ewa_data, returns)
+            for (test, ret_name), series in block_series.items():
+                summary = summarize_ic(series) if test == "ic" else summarize_vt(series)
+                summaries[(test, ret_name)].append(summary)
+                top_ks[(test, ret_name)].push(series, summary["score"])
+            tested.update(factor_names)
+            logger.info(f"Block {i + 1}/{len(block_cfgs)} of {SFG(self.factor_class)}: {len(factor_names)} variants")
+
+        self.save(summaries, top_ks)
+        logger.info(f"Screening of {SFG(self.factor_class)} finished, {len(tested)} variants tested")
+        return 0
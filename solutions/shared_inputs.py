@@ -0,0 +1,144 @@
+"""
+Memoized loaders of inputs shared by all instruments, like macro, forex and market data.
+
+Factors read them in cal_factor_by_instru once for each instrument, so results are kept at two
+levels, keyed by (db path, table, date range, columns, mtime of db):
+    process:  a dict, so each process reads a key only once. Threads reading the same key wait for
+              each other by a lock of the key, threads reading other keys do not wait
+    run:      column-wise .npy files in a dir set by enable_shared_cache. The first process to
+              read a key saves it there, other workers of the run map it by np.load(mmap_mode="r")
+Inputs by instrument, shared by factor classes of one run, are too large to be kept in every
+process, they skip the process level by memo=False.
+A rewritten database gets a new mtime, so stale entries are never hit. Callers get a copy, which
+they are free to modify. The dir is passed by environment variable, so processes spawned by
+multiprocessing share it, and only the process which enabled it removes it at exit.
+"""
+
+import os
+import json
+import atexit
+import shutil
+import hashlib
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+from typing import Callable
+from husfort.qsqlite import CDbStruct
+from solutions.perf import perf_step
+
+ENV_SHARED_CACHE_DIR = "CTA_SHARED_CACHE_DIR"
+SHARED_CACHE_META = "meta.json"
+
+_memo: dict[tuple, pd.DataFrame] = {}
+_key_locks: dict[tuple, threading.Lock] = {}
+_memo_lock = threading.Lock()  # guards the dicts above only, never held while reading
+
+
+def enable_shared_cache() -> str:
+    """
+
+    :return: a new temporary dir for this run, removed when this process exits
+    """
+    cache_dir = tempfile.mkdtemp(prefix="cta-shared-")
+    os.environ[ENV_SHARED_CACHE_DIR] = cache_dir
+    atexit.register(shutil.rmtree, cache_dir, ignore_errors=True)
+    return cache_dir
+
+
+def get_shared_cache_dir() -> str | None:
+    return os.environ.get(ENV_SHARED_CACHE_DIR)
+
+
+def get_key(db_struct: CDbStruct, bgn_date: str, stp_date: str, columns: list[str] | None) -> tuple:
+    db_path = os.path.abspath(os.path.join(db_struct.db_save_dir, db_struct.db_name))
+    mtime = os.path.getmtime(db_path) if os.path.exists(db_path) else None
+    return db_path, db_struct.table.name, bgn_date, stp_date, tuple(columns or ()), mtime
+
+
+def get_key_lock(key: tuple) -> threading.Lock:
+    with _memo_lock:
+        return _key_locks.setdefault(key, threading.Lock())
+
+
+def save_frame(data: pd.DataFrame, entry_dir: str):
+    """
+    Save to a temporary dir, then rename it, so that a half saved entry is never seen.
+    If another process has saved the same entry already, this one is dropped.
+    """
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(entry_dir))
+    kinds: list[str] = []
+    for i, c in enumerate(data.columns):
+        values = data[c].to_numpy()
+        if values.dtype.kind in "biuf":
+            kinds.append("num")
+            np.save(os.path.join(tmp_dir, f"{i}.npy"), values)
+        else:
+            kinds.append("str")
+            isnull = data[c].isna().to_numpy()
+            np.save(os.path.join(tmp_dir, f"{i}.npy"), np.where(isnull, "", data[c].astype(str)).astype(str))
+            np.save(os.path.join(tmp_dir, f"{i}.isnull.npy"), isnull)
+    with open(os.path.join(tmp_dir, SHARED_CACHE_META), "w") as f:
+        json.dump({"columns": list(data.columns), "kinds": kinds}, f)
+    try:
+        os.rename(tmp_dir, entry_dir)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def load_frame(entry_dir: str) -> pd.DataFrame:
+    with open(os.path.join(entry_dir, SHARED_CACHE_META), "r") as f:
+        meta = json.load(f)
+    data = {}
+    for i, (c, kind) in enumerate(zip(meta["columns"], meta["kinds"])):
+        values = np.load(os.path.join(entry_dir, f"{i}.npy"), mmap_mode="r")
+        if kind == "num":
+            data[c] = np.array(values)
+        else:
+            res = values.astype(object)
+            res[np.load(os.path.join(entry_dir, f"{i}.isnull.npy"))] = None
+            data[c] = res
+    return pd.DataFrame(data, columns=meta["columns"])
+
+
+def read_shared(
+    db_struct: CDbStruct,
+    bgn_date: str,
+    stp_date: str,
+    reader: Callable[[], pd.DataFrame],
+    columns: list[str] | None = None,
+    memo: bool = True,
+) -> pd.DataFrame:
+    """
+
+    :param db_struct: a database not keyed by instrument, or a shard of an instrument with memo=False
+    :param bgn_date:
+    :param stp_date:
+    :param reader: reads [bgn_date, stp_date) of columns from db_struct, called only on a miss
+    :param columns: columns read by reader, part of the key, None for all
+    :param memo: whether to keep the data in this process, if False it is shared only by the run dir
+    :return: a copy of the cached data
+    """
+    key = get_key(db_struct, bgn_date, stp_date, columns)
+    with get_key_lock(key):
+        with _memo_lock:
+            data = _memo.get(key)
+        if data is None:
+            with perf_step("shared_inputs", "load", tag=db_struct.db_name) as rec:
+                entry_dir = None
+                if (cache_dir := get_shared_cache_dir()) is not None:
+                    entry_dir = os.path.join(cache_dir, hashlib.sha1(repr(key).encode()).hexdigest())
+                if entry_dir is not None and os.path.exists(entry_dir):
+                    data = load_frame(entry_dir)
+                    rec.extra["source"] = "run"
+                else:
+                    data = reader()
+                    rec.extra["source"] = "db"
+                    if entry_dir is not None:
+                        save_frame(data, entry_dir)
+                rec.rows_out = len(data)
+            if not memo:
+                return data  # not kept, so the caller owns it
+            with _memo_lock:
+                _memo[key] = data
+    return data.copy()
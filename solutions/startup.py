@@ -0,0 +1,113 @@
+import re
+import sys
+import time
+import importlib
+import subprocess
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+# switch -> (module to be imported, config objects to be built)
+SWITCH_REQUIREMENTS: dict[str, tuple[str, list[str]]] = {
+    "panel": ("solutions.panel_store", ["proj_cfg", "db_struct_cfg"]),
+    "avlb": ("solutions.avlb", ["proj_cfg", "db_struct_cfg"]),
+    "css": ("solutions.css", ["proj_cfg"]),
+    "icov": ("solutions.icov", ["proj_cfg", "db_struct_cfg"]),
+    "mkt": ("solutions.mkt", ["proj_cfg"]),
+    "test_return": ("solutions.test_return", ["proj_cfg", "db_struct_cfg"]),
+    "factor": ("solutions.factor", ["proj_cfg", "db_struct_cfg", "cfg_factors"]),
+    "ic": ("solutions.qtests", ["proj_cfg", "cfg_factors"]),
+    "vt": ("solutions.qtests", ["proj_cfg", "cfg_factors"]),
+    "summary": ("solutions.qtests", ["proj_cfg", "cfg_factors"]),
+    "screen": ("solutions.screen", ["proj_cfg", "db_struct_cfg", "cfg_factors"]),
+    "repair": ("solutions.repair", ["proj_cfg", "db_struct_cfg", "cfg_factors"]),
+    "backfill": ("solutions.backfill", ["proj_cfg", "db_struct_cfg", "cfg_factors"]),
+    "update": ("solutions.update", ["proj_cfg", "db_struct_cfg", "cfg_factors"]),
+}
+
+
+@dataclass
+class CStartupStep:
+    name: str
+    elapsed: float  # seconds
+    new_modules: int
+
+
+class CStartupProfiler:
+    def __init__(self):
+        self.steps: list[CStartupStep] = []
+
+    @contextmanager
+    def step(self, name: str):
+        n0, t0 = len(sys.modules), time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            self.steps.append(CStartupStep(name=name, elapsed=elapsed, new_modules=len(sys.modules) - n0))
+
+    def report(self) -> str:
+        lines = [f"{'step':<48s} {'elapsed(ms)':>12s} {'new modules':>12s}"]
+        for s in self.steps:
+            lines.append(f"{s.name:<48s} {s.elapsed * 1000:>12.1f} {s.new_modules:>12d}")
+        total = sum(s.elapsed for s in self.steps)
+        lines.append(f"{'total':<48s} {total * 1000:>12.1f}")
+        return "\n".join(lines)
+
+
+def profile_imports(modules: list[str], top: int = 20) -> list[tuple[str, int, int]]:
+    """
+    Import modules in a fresh interpreter with '-X importtime', which is the only
+    way to get the time of each module regardless of what is already imported here.
+
+    :param modules: like ["config", "solutions.avlb"]
+    :param top: number of the most expensive modules to be returned
+    :return: a list of (module, self time in us, cumulative time in us), sorted by cumulative time
+    """
+    code = "; ".join(f"import {m}" for m in modules)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+    pattern = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+    res: list[tuple[str, int, int]] = []
+    for line in proc.stderr.splitlines():
+        if m := pattern.match(line):
+            res.append((m.group(4), int(m.group(1)), int(m.group(2))))
+    return sorted(res, key=lambda z: z[2], reverse=True)[:top]
+
+
+def profile_startup(switch: str, fclass: str | list[str] | None = None) -> str:
+    """
+
+    :param switch: switch of main.py, like "avlb", "factor"
+    :param fclass: factor class, only for switch in ("factor", "ic", "vt", "screen"),
+                   or factor classes for switch in ("summary", "repair", "backfill", "update")
+    :return: report of config build time and import time of each module
+    """
+    module, requirements = SWITCH_REQUIREMENTS[switch]
+    profiler = CStartupProfiler()
+    with profiler.step("import config"):
+        config = importlib.import_module("config")
+    with profiler.step("parse config.yaml"):
+        config.load_config()
+    with profiler.step("build proj_cfg"):
+        proj_cfg = config.get_proj_cfg()
+    if "db_struct_cfg" in requirements:
+        with profiler.step("parse db_struct.yaml and build db_struct_cfg"):
+            config.get_db_struct_cfg()
+    if "cfg_factors" in requirements:
+        with profiler.step("build cfg_factors"):
+            cfg_factors = config.get_cfg_factors()
+        for fc in [fclass] if isinstance(fclass, str) else fclass or []:
+            with profiler.step(f"register factor class {fc}"):
+                cfg_factors.get_cfg_and_fac(fc)
+    with profiler.step("load calendar"):
+        from husfort.qcalendar import CCalendar
+
+        CCalendar(proj_cfg.calendar_path)
+    with profiler.step(f"import {module}"):
+        importlib.import_module(module)
+
+    lines = [f"--- startup of switch '{switch}', in this process ---", profiler.report(), ""]
+    lines.append("--- import time of modules, in a fresh interpreter ---")
+    lines.append(f"{'module':<48s} {'self(ms)':>12s} {'cumulative(ms)':>15s}")
+    for name, t_self, t_cum in profile_imports(["config", module]):
+        lines.append(f"{name:<48s} {t_self / 1000:>12.1f} {t_cum / 1000:>15.1f}")
+    return "\n".join(lines)
@@ -1,13 +1,19 @@
 import pandas as pd
+from functools import partial
 from rich.progress import track
 from loguru import logger
 from husfort.qutility import SFG, check_and_makedirs
 from husfort.qcalendar import CCalendar
-from husfort.qsqlite import CDbStruct, CMgrSqlDb
+from husfort.qsqlite import CDbStruct
 from husfort.qsimquick import CTestReturnLoaderBase
 from solutions.db_generator import gen_test_returns_by_instru_db, gen_test_returns_avlb_db
-from typedefs.typedef_instrus import TUniverse
+from typedefs.typedef_instrus import TUniverse, CUniverseCodebook
 from typedefs.typedef_returns import CRet, TReturnClass
+from solutions.perf import perf_step
+from solutions.db_io import check_continuity, save_bulk, save_with_continuity, save_splice, read_by_range
+from solutions.panel_align import KEY_COLUMNS, sort_canonical
+from solutions.panel_store import read_preprocess
+from solutions.concurrency import map_loaders
 
 
 class __CTestReturnsByInstru:
@@ -24,14 +30,8 @@ class __CTestReturnsByInstru:
         self.db_struct_preprocess = db_struct_preprocess
 
     def load_preprocess(self, instru: str, bgn_date: str, stp_date: str) -> pd.DataFrame:
-        sqldb = CMgrSqlDb(
-            db_save_dir=self.db_struct_preprocess.db_save_dir,
-            db_name=f"{instru}.db",
-            table=self.db_struct_preprocess.table,
-            mode="r",
-        )
-        data = sqldb.read_by_range(
-            bgn_date=bgn_date, stp_date=stp_date,
+        data = read_preprocess(
+            self.db_struct_preprocess, instru, bgn_date, stp_date,
             value_columns=["trade_date", "ticker_major", "return_c_major", "return_o_major"]
         )
         return data
@@ -67,17 +67,14 @@ class __CTestReturnsByInstru:
             ret_class=self.ret.ret_class,
             ret=self.ret,
         )
-        check_and_makedirs(db_struct_instru.db_save_dir)
-        sqldb = CMgrSqlDb(
-            db_save_dir=db_struct_instru.db_save_dir,
-            db_name=db_struct_instru.db_name,
-            table=db_struct_instru.table,
-            mode="a",
-        )
-        if sqldb.check_continuity(base_bgn_date, calendar) == 0:
-            instru_ret_data = self.load_preprocess(instru, base_bgn_date, stp_date)
+        if check_continuity(db_struct_instru, base_bgn_date, calendar) == 0:
+            with perf_step("test_return", "load", tag=instru) as rec:
+                instru_ret_data = self.load_preprocess(instru, base_bgn_date, stp_date)
+                rec.rows_out = len(instru_ret_data)
             y_instru_data = self.cal_test_return(instru_ret_data, base_bgn_date, base_end_date)
-            sqldb.update(update_data=y_instru_data)
+            with perf_step("test_return", "save", tag=instru) as rec:
+                rec.rows_in = len(y_instru_data)
+                save_bulk(db_struct_instru, y_instru_data)
         return 0
 
     def main(self, bgn_date: str, stp_date: str, calendar: CCalendar):
@@ -107,6 +104,7 @@ class CTestReturnsAvlb:
         self.test_returns_by_instru_dir = test_returns_by_instru_dir
         self.test_returns_avlb_raw_dir = test_returns_avlb_raw_dir
         self.db_struct_avlb = db_struct_avlb
+        self.codebook = CUniverseCodebook.from_universe(universe)
 
     def load_ref_ret_by_instru(self, instru: str, bgn_date: str, stp_date: str) -> pd.DataFrame:
         db_struct_ref = gen_test_returns_by_instru_db(
@@ -115,57 +113,49 @@ class CTestReturnsAvlb:
             ret_class=self.ret.ret_class,
             ret=self.ret,
         )
-        sqldb = CMgrSqlDb(
-            db_save_dir=db_struct_ref.db_save_dir,
-            db_name=db_struct_ref.db_name,
-            table=db_struct_ref.table,
-            mode="r"
-        )
-        ref_data = sqldb.read_by_range(bgn_date, stp_date)
+        ref_data = read_by_range(db_struct_ref, bgn_date, stp_date)
         return ref_data
 
     def load_ref_ret(self, base_bgn_date: str, base_stp_date: str) -> pd.DataFrame:
-        ref_dfs: list[pd.DataFrame] = []
-        for instru in self.universe:
-            df = self.load_ref_ret_by_instru(instru, bgn_date=base_bgn_date, stp_date=base_stp_date)
+        ref_dfs: list[pd.DataFrame] = map_loaders(
+            partial(self.load_ref_ret_by_instru, bgn_date=base_bgn_date, stp_date=base_stp_date), self.universe
+        )
+        for instru, df in zip(self.universe, ref_dfs):
             df["instrument"] = instru
-            ref_dfs.append(df)
         res = pd.concat(ref_dfs, axis=0, ignore_index=False)
         res = res.reset_index().sort_values(by=["trade_date"], ascending=True)
         res = res[["trade_date", "instrument", self.ret.ret_name]]
-        return res
+        return self.codebook.encode_known(res, source=self.ret.ret_name)
 
     def load_available(self, base_bgn_date: str, base_stp_date: str) -> pd.DataFrame:
-        sqldb = CMgrSqlDb(
-            db_save_dir=self.db_struct_avlb.db_save_dir,
-            db_name=self.db_struct_avlb.db_name,
-            table=self.db_struct_avlb.table,
-            mode="r",
-        )
-        avlb_data = sqldb.read_by_range(bgn_date=base_bgn_date, stp_date=base_stp_date)
+        avlb_data = read_by_range(self.db_struct_avlb, bgn_date=base_bgn_date, stp_date=base_stp_date)
         avlb_data = avlb_data[["trade_date", "instrument", "sectorL1"]]
-        return avlb_data
+        return self.codebook.encode_known(avlb_data, source=self.db_struct_avlb.db_name)
 
-    def save(self, new_data: pd.DataFrame, calendar: CCalendar, ):
+    def save(self, new_data: pd.DataFrame, calendar: CCalendar, replace_range: tuple[str, str] | None = None):
         test_returns_avlb_dir = self.test_returns_avlb_raw_dir
         db_struct_ret = gen_test_returns_avlb_db(
             test_returns_avlb_dir=test_returns_avlb_dir,
             ret_class=self.ret.ret_class,
             ret=self.ret,
         )
-        check_and_makedirs(db_struct_ret.db_save_dir)
-        sqldb = CMgrSqlDb(
-            db_save_dir=db_struct_ret.db_save_dir,
-            db_name=db_struct_ret.db_name,
-            table=db_struct_ret.table,
-            mode="a",
-        )
-        if sqldb.check_continuity(new_data["trade_date"].iloc[0], calendar) == 0:
-            instru_tst_ret_agg_data = new_data[db_struct_ret.table.vars.names]
-            sqldb.update(update_data=instru_tst_ret_agg_data)
+        new_data = sort_canonical(new_data)
+        if replace_range is not None:
+            save_splice(db_struct_ret, new_data[db_struct_ret.table.vars.names], *replace_range)
+        else:
+            save_with_continuity(db_struct_ret, new_data[db_struct_ret.table.vars.names], calendar)
         return 0
 
-    def main(self, bgn_date: str, stp_date: str, calendar: CCalendar):
+    def main(self, bgn_date: str, stp_date: str, calendar: CCalendar, splice: bool = False):
+        """
+        Rows are saved by base dates, which are ret.shift trade dates before [bgn_date, stp_date)
+
+        :param bgn_date:
+        :param stp_date:
+        :param calendar:
+        :param splice: whether to replace saved rows of base dates, for backfills
+        :return:
+        """
         logger.info(f"Calculate available test return ret = {SFG(self.ret.ret_name)}")
         iter_dates = calendar.get_iter_list(bgn_date, stp_date)
         base_bgn_date = calendar.get_next_date(iter_dates[0], -self.ret.shift)
@@ -173,17 +163,24 @@ class CTestReturnsAvlb:
         base_stp_date = calendar.get_next_date(base_end_date, shift=1)
 
         # avlb raw
-        ref_tst_ret_data = self.load_ref_ret(base_bgn_date, base_stp_date)
-        available_data = self.load_available(base_bgn_date, base_stp_date)
-        tst_ret_avlb_data = pd.merge(
-            left=available_data,
-            right=ref_tst_ret_data,
-            on=["trade_date", "instrument"],
-            how="left",
-        ).sort_values(by=["trade_date", "sectorL1"])
+        with perf_step("test_returns_avlb", "load", tag=self.ret.ret_name) as rec:
+            ref_tst_ret_data = self.load_ref_ret(base_bgn_date, base_stp_date)
+            available_data = self.load_available(base_bgn_date, base_stp_date)
+            rec.rows_out = len(ref_tst_ret_data) + len(available_data)
+        with perf_step("test_returns_avlb", "merge", tag=self.ret.ret_name) as rec:
+            rec.rows_in = len(ref_tst_ret_data) + len(available_data)
+            tst_ret_avlb_data = pd.merge(
+                left=available_data,
+                right=ref_tst_ret_data,
+                on=["trade_date", "instrument"],
+                how="left",
+            ).sort_values(by=["trade_date", "sectorL1"])
+            rec.rows_out = len(tst_ret_avlb_data)
         tst_ret_avlb_raw_data = tst_ret_avlb_data.query(
             f"trade_date >= '{base_bgn_date}' & trade_date <= '{base_stp_date}'")
-        self.save(tst_ret_avlb_raw_data, calendar)
+        with perf_step("test_returns_avlb", "save", tag=self.ret.ret_name) as rec:
+            rec.rows_in = len(tst_ret_avlb_raw_data)
+            self.save(tst_ret_avlb_raw_data, calendar, replace_range=(base_bgn_date, base_stp_date) if splice else None)
 
         return 0
 
@@ -217,11 +214,7 @@ class CTestReturnLoader(CTestReturnLoaderBase):
             ret=self.ret,
         )
         check_and_makedirs(db_struct_ret.db_save_dir)
-        sqldb = CMgrSqlDb(
-            db_save_dir=db_struct_ret.db_save_dir,
-            db_name=db_struct_ret.db_name,
-            table=db_struct_ret.table,
-            mode="r",
+        data = read_by_range(
+            db_struct_ret, bgn_date, stp_date, value_columns=self.value_columns, order_by=KEY_COLUMNS
         )
-        data = sqldb.read_by_range(bgn_date, stp_date, value_columns=self.value_columns)
         return data
@@ -0,0 +1,384 @@
+"""
+Incremental updater keyed on high-water marks, the last trade date of each source and output table.
+
+Switch 'update' reads marks of sources (preprocess, minute_bar and position shards of each
+instrument, and the market index file) and of outputs, and works out the range of dates each stage
+could add, stage by stage in order of dependency. By-instrument stages get a task for each group of
+instruments with the same range, so an instrument without new data costs nothing. Marks are cached
+and re-read after each task, or in a dry run, predicted from its range, so the whole plan can be
+printed without running anything.
+
+Outputs saved by base dates, like test returns, are shifted to the dates of the stage reading them.
+An output not built yet starts from bgn_date. Universe-wide stages, like avlb, wait for instruments
+lagging behind the latest one, however long, since marks only move forward and rows of dates passed
+would never be built. An instrument which stopped trading is to be removed from universe in
+config.yaml, then it does not hold the others back. Instruments without any data, like those just
+added, are not waited for, they are to be built by switch 'backfill'.
+"""
+
+import os
+from dataclasses import dataclass
+from functools import partial
+from itertools import groupby
+from typing import Any, Callable
+from loguru import logger
+from husfort.qutility import SFG, SFY, qtimer
+from husfort.qsqlite import CDbStruct
+from husfort.qcalendar import CCalendar
+from typedefs.typedef_instrus import TUniverse
+from typedef import CCfgAvlbUnvrs
+from solutions.perf import perf_step
+from solutions.concurrency import map_loaders
+from solutions.db_io import read_last_date
+from solutions.db_generator import gen_test_returns_by_instru_db, gen_test_returns_avlb_db, gen_factors_avlb_db
+from solutions.avlb import main_available
+from solutions.mkt import main_market, load_market_index
+from solutions.css import CCrossSectionCalculator
+from solutions.icov import CICOV
+from solutions.test_return import CTestReturnsByInstru, CTestReturnsAvlb
+from solutions.factor import CFactorsByInstru, CFactorsAvlb
+from solutions.qtests import CICTest, CVTTest
+from solutions.repair import TDateRange
+
+
+@dataclass(frozen=True)
+class CUpdateTask:
+    stage: str  # like "avlb", "factor/MTM"
+    bgn_date: str
+    stp_date: str
+    instrus: tuple[str, ...] = ()  # for by-instrument stages only
+
+
+def get_mark_key(db_struct: CDbStruct) -> str:
+    return f"{os.path.join(db_struct.db_save_dir, db_struct.db_name)}:{db_struct.table.name}"
+
+
+def earliest(dates: list[str | None]) -> str | None:
+    return None if any(d is None for d in dates) else min(dates)  # type:ignore
+
+
+class CUpdater:
+    def __init__(self, calendar: CCalendar, bgn_date: str, stp_date: str | None, dry_run: bool):
+        """
+
+        :param calendar:
+        :param bgn_date: begin date of outputs not built yet
+        :param stp_date: no date after it is updated, None for no limit
+        :param dry_run: only plan tasks, with marks of outputs predicted
+        """
+        self.calendar = calendar
+        self.bgn_date = bgn_date
+        self.stp_date = stp_date
+        self.dry_run = dry_run
+        self.marks: dict[str, str | None] = {}
+        self.tasks: list[CUpdateTask] = []
+
+    def last_date(self, db_struct: CDbStruct) -> str | None:
+        return self.last_dates([db_struct])[0]
+
+    def last_dates(self, db_structs: list[CDbStruct]) -> list[str | None]:
+        keys = [get_mark_key(db_struct) for db_struct in db_structs]
+        missing = {key: db_struct for key, db_struct in zip(keys, db_structs) if key not in self.marks}
+        if missing:
+            with perf_step("update", "marks") as rec:
+                self.marks.update(zip(missing, map_loaders(read_last_date, missing.values())))
+                rec.rows_out = len(missing)
+        return [self.marks[key] for key in keys]
+
+    def set_mark(self, db_struct: CDbStruct, last_date: str | None):
+        self.marks[get_mark_key(db_struct)] = last_date
+
+    def shift(self, trade_date: str | None, n: int) -> str | None:
+        return None if trade_date is None else self.calendar.get_next_date(trade_date, shift=n)
+
+    def universe_last(self, last_dates: dict[str, str | None], name: str) -> str | None:
+        """
+
+        :param last_dates: instrument -> last date of its shard, in dates of the stage
+        :param name: of shards, for logging
+        :return: last date reached by all instruments with data
+        """
+        if not (dates := [d for d in last_dates.values() if d is not None]):
+            return None
+        latest, res = max(dates), min(dates)
+        if res < latest:
+            lagging = {instru: d for instru, d in sorted(last_dates.items()) if d is not None and d < latest}
+            logger.warning(
+                f"{SFY(name)} of {lagging} are behind {latest}, stages of the universe wait for them. "
+                f"Remove instruments which stopped trading from universe in config.yaml"
+            )
+        if empty := sorted(instru for instru, d in last_dates.items() if d is None):
+            logger.warning(f"{SFY(name)} of {empty} have no data, run switch 'backfill' for them")
+        return res
+
+    def get_range(self, out_last: str | None, in_last: str | None) -> TDateRange | None:
+        """
+
+        :param out_last: last date of output, in dates of the stage, None if it is not built yet
+        :param in_last: last date which inputs allow, in dates of the stage
+        :return: range of the task, None if there is nothing new
+        """
+        if in_last is None:
+            return None
+        bgn_date = self.bgn_date if out_last is None else self.shift(out_last, 1)
+        stp_date = self.shift(in_last, 1)
+        if self.stp_date is not None:
+            stp_date = min(stp_date, self.stp_date)
+        return (bgn_date, stp_date) if bgn_date < stp_date else None
+
+    def run(
+        self,
+        stage: str,
+        outputs: list[CDbStruct],
+        date_range: TDateRange | None,
+        func: Callable[[str, str], Any],
+        out_shift: int = 0,
+        instrus: tuple[str, ...] = (),
+    ):
+        """
+
+        :param stage:
+        :param outputs: tables written by func, whose marks are re-read, or predicted in a dry run
+        :param date_range: from self.get_range
+        :param func: (bgn_date, stp_date) -> anything, which runs the stage
+        :param out_shift: outputs are saved by dates out_shift trade dates before those of the stage
+        :param instrus: for by-instrument stages, to be logged
+        :return:
+        """
+        if date_range is None:
+            return
+        task = CUpdateTask(stage=stage, bgn_date=date_range[0], stp_date=date_range[1], instrus=instrus)
+        self.tasks.append(task)
+        desc = f" for {SFY(len(instrus))} instruments" if instrus else ""
+        logger.info(f"Update {SFG(stage)} from {SFG(task.bgn_date)} to {SFG(task.stp_date)}{desc}")
+        if self.dry_run:
+            predicted = self.shift(task.stp_date, -1 - out_shift)
+            for db_struct in outputs:
+                self.set_mark(db_struct, predicted)
+            return
+        with perf_step("update", "task", tag=stage) as rec:
+            func(task.bgn_date, task.stp_date)
+            rec.extra.update({"bgn_date": task.bgn_date, "stp_date": task.stp_date, "instrus": len(instrus)})
+        for db_struct in outputs:
+            self.marks.pop(get_mark_key(db_struct), None)
+
+    def run_by_instru(
+        self,
+        stage: str,
+        outputs: dict[str, CDbStruct],
+        ranges: dict[str, TDateRange | None],
+        func: Callable[[list[str], str, str], Any],
+        out_shift: int = 0,
+    ):
+        """
+        Instruments with the same range are run by one task
+
+        :param stage:
+        :param outputs: instrument -> table written
+        :param ranges: instrument -> range from self.get_range
+        :param func: (instruments, bgn_date, stp_date) -> anything
+        :param out_shift: see self.run
+        :return:
+        """
+        todo = sorted((r, instru) for instru, r in ranges.items() if r is not None)
+        for date_range, group in groupby(todo, key=lambda z: z[0]):
+            instrus = tuple(instru for _, instru in group)
+            self.run(
+                stage=stage,
+                outputs=[outputs[instru] for instru in instrus],
+                date_range=date_range,
+                func=lambda bgn_date, stp_date, _instrus=instrus: func(list(_instrus), bgn_date, stp_date),
+                out_shift=out_shift,
+                instrus=instrus,
+            )
+
+
+def run_test_returns_by_instrus(
+        test_returns_by_instru: CTestReturnsByInstru, instrus: list[str], bgn_date: str, stp_date: str,
+        calendar: CCalendar,
+):
+    for instru in instrus:
+        test_returns_by_instru.process_for_instru(instru, bgn_date, stp_date, calendar)
+
+
+def run_factor_by_instrus(
+        fac: CFactorsByInstru, instrus: list[str], bgn_date: str, stp_date: str, calendar: CCalendar,
+):
+    fac.raise_if_failed(fac.process_by_instrus(instrus, bgn_date, stp_date, calendar))
+
+
+def run_qtest(test: CICTest | CVTTest, bgn_date: str, stp_date: str, calendar: CCalendar):
+    test.main_cal(bgn_date, stp_date, calendar)
+    test.update_summary(stp_date)
+
+
+def read_market_index_last_date(path_mkt_idx_data: str, mkt_idxes: list[str]) -> str | None:
+    mkt_idx_df = load_market_index("00000000", "99999999", path_mkt_idx_data, mkt_idxes).dropna()
+    return None if mkt_idx_df.empty else mkt_idx_df["trade_date"].max()
+
+
+@qtimer
+def main_update(
+    bgn_date: str,
+    stp_date: str | None,
+    calendar: CCalendar,
+    dry_run: bool,
+    universe: TUniverse,
+    cfg_avlb_unvrs: CCfgAvlbUnvrs,
+    db_struct_preprocess: CDbStruct,
+    db_struct_avlb: CDbStruct,
+    db_struct_mkt: CDbStruct,
+    db_struct_css: CDbStruct,
+    path_mkt_idx_data: str,
+    mkt_idxes: list[str],
+    sectors: list[str],
+    css: CCrossSectionCalculator,
+    icov: CICOV,
+    test_returns: list[tuple[CTestReturnsByInstru, CTestReturnsAvlb]],
+    factors: list[tuple[CFactorsByInstru, CFactorsAvlb, list]],
+) -> list[CUpdateTask]:
+    """
+
+    :param bgn_date: begin date of outputs not built yet
+    :param stp_date: no date after it is updated, None for no limit
+    :param calendar:
+    :param dry_run: only print tasks
+    :param universe:
+    :param cfg_avlb_unvrs:
+    :param db_struct_preprocess:
+    :param db_struct_avlb:
+    :param db_struct_mkt:
+    :param db_struct_css:
+    :param path_mkt_idx_data:
+    :param mkt_idxes:
+    :param sectors:
+    :param css:
+    :param icov:
+    :param test_returns: by-instrument and available test returns of each return
+    :param factors: (factor, available factor, ic-tests and vt-tests from gen_qtests) of each factor class
+    :return: tasks run, or planned in a dry run
+    """
+    up = CUpdater(calendar, bgn_date, stp_date, dry_run)
+    instrus = list(universe)
+
+    # --- sources
+    shards_preprocess = {i: db_struct_preprocess.copy_to_another(another_db_name=f"{i}.db") for i in instrus}
+    preprocess_last = dict(zip(instrus, up.last_dates(list(shards_preprocess.values()))))
+    universe_preprocess_last = up.universe_last(preprocess_last, "preprocess")
+    mkt_idx_last = read_market_index_last_date(path_mkt_idx_data, mkt_idxes)
+    logger.info(f"Last date of preprocess = {SFG(universe_preprocess_last)}, market index = {SFG(mkt_idx_last)}")
+
+    # --- universe
+    up.run(
+        stage="avlb",
+        outputs=[db_struct_avlb],
+        date_range=up.get_range(up.last_date(db_struct_avlb), universe_preprocess_last),
+        func=lambda b, s: main_available(
+            b, s, universe, cfg_avlb_unvrs, db_struct_preprocess, db_struct_avlb, calendar
+        ),
+    )
+    up.run(
+        stage="mkt",
+        outputs=[db_struct_mkt],
+        date_range=up.get_range(up.last_date(db_struct_mkt), earliest([up.last_date(db_struct_avlb), mkt_idx_last])),
+        func=lambda b, s: main_market(
+            b, s, calendar, db_struct_avlb, db_struct_mkt, path_mkt_idx_data, mkt_idxes, sectors
+        ),
+    )
+    up.run(
+        stage="css",
+        outputs=[db_struct_css],
+        date_range=up.get_range(
+            up.last_date(db_struct_css), earliest([up.last_date(db_struct_avlb), up.last_date(db_struct_mkt)])
+        ),
+        func=lambda b, s: css.main(b, s, calendar),
+    )
+    up.run(
+        stage="icov",
+        outputs=[icov.db_struct_icov],
+        date_range=up.get_range(up.last_date(icov.db_struct_icov), universe_preprocess_last),
+        func=lambda b, s: icov.main(b, s, calendar),
+    )
+
+    # --- test returns, saved by base dates, ret.shift trade dates before
+    for test_returns_by_instru, test_returns_avlb in test_returns:
+        ret, shift = test_returns_by_instru.ret, test_returns_by_instru.ret.shift
+        shards_ret = {
+            i: gen_test_returns_by_instru_db(i, test_returns_by_instru.test_returns_by_instru_dir, ret.ret_class, ret)
+            for i in instrus
+        }
+        shards_ret_last = dict(zip(instrus, up.last_dates(list(shards_ret.values()))))
+        up.run_by_instru(
+            stage=f"test_return/{ret.ret_name}",
+            outputs=shards_ret,
+            ranges={i: up.get_range(up.shift(shards_ret_last[i], shift), preprocess_last[i]) for i in instrus},
+            func=partial(run_test_returns_by_instrus, test_returns_by_instru, calendar=calendar),
+            out_shift=shift,
+        )
+        shards_ret_last = dict(zip(instrus, up.last_dates(list(shards_ret.values()))))
+        db_struct_ret_avlb = gen_test_returns_avlb_db(test_returns_avlb.test_returns_avlb_raw_dir, ret.ret_class, ret)
+        in_last = earliest(
+            [
+                up.shift(up.last_date(db_struct_avlb), shift),
+                up.universe_last({i: up.shift(d, shift) for i, d in shards_ret_last.items()}, ret.ret_name),
+            ]
+        )
+        up.run(
+            stage=f"test_return_avlb/{ret.ret_name}",
+            outputs=[db_struct_ret_avlb],
+            date_range=up.get_range(up.shift(up.last_date(db_struct_ret_avlb), shift), in_last),
+            func=lambda b, s, _tra=test_returns_avlb: _tra.main(b, s, calendar),
+            out_shift=shift,
+        )
+
+    # --- factors, by instrument from their declared sources, then available ones and tests
+    for fac, fac_avlb, qtests in factors:
+        tag = fac.factor_grp.factor_class
+        db_struct_sources = {
+            "preprocess": fac.db_struct_preprocess,
+            "minute_bar": fac.db_struct_minute_bar,
+            "pos": fac.db_struct_pos,
+        }
+        sources_last: list[list[str | None]] = []
+        for source in fac.inputs or ["preprocess"]:
+            db_struct_source = db_struct_sources[source]
+            shards_source = [db_struct_source.copy_to_another(another_db_name=f"{i}.db") for i in instrus]
+            sources_last.append(up.last_dates(shards_source))
+        in_last_by_instru = {i: earliest([z[k] for z in sources_last]) for k, i in enumerate(instrus)}
+        shards_fac = {i: fac.get_instru_db(i) for i in instrus}
+        shards_fac_last = dict(zip(instrus, up.last_dates(list(shards_fac.values()))))
+        up.run_by_instru(
+            stage=f"factor/{tag}",
+            outputs=shards_fac,
+            ranges={i: up.get_range(shards_fac_last[i], in_last_by_instru[i]) for i in instrus},
+            func=partial(run_factor_by_instrus, fac, calendar=calendar),
+        )
+        shards_fac_last = dict(zip(instrus, up.last_dates(list(shards_fac.values()))))
+        db_structs_fac_avlb = [fac_avlb.get_avlb_db(save_type) for save_type in ("raw", "sig", "ewa")]  # type:ignore
+        up.run(
+            stage=f"factor_avlb/{tag}",
+            outputs=db_structs_fac_avlb,
+            date_range=up.get_range(
+                up.last_date(db_structs_fac_avlb[0]),
+                earliest([up.last_date(db_struct_avlb), up.universe_last(shards_fac_last, tag)]),
+            ),
+            func=lambda b, s, _fac_avlb=fac_avlb: _fac_avlb.main(b, s, calendar),
+        )
+        for test in qtests:
+            # a test of a date reads factors and test returns of ret.shift trade dates before
+            db_struct_test = test.gen_test_db_struct()
+            db_struct_fac = gen_factors_avlb_db(test.factors_avlb_dir, tag, test.factor_grp.factors)
+            db_struct_ret = gen_test_returns_avlb_db(test.test_returns_avlb_dir, test.ret.ret_class, test.ret)
+            in_last = up.shift(earliest([up.last_date(db_struct_fac), up.last_date(db_struct_ret)]), test.ret.shift)
+            up.run(
+                stage=f"{test.perf_stage}/{test.save_id}",
+                outputs=[db_struct_test],
+                date_range=up.get_range(up.last_date(db_struct_test), in_last),
+                func=partial(run_qtest, test, calendar=calendar),
+            )
+
+    logger.info(
+        f"{SFY(len(up.tasks))} tasks {'planned' if dry_run else 'done'}. "
+        f"Run switch 'summary' to update reports and plots of tests"
+    )
+    return up.tasks
@@ -0,0 +1,27 @@
+import os
+import sys
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class CFakeCalendar:
+    def __init__(self, trade_dates: list[str]):
+        self.trade_dates = trade_dates
+
+    def get_next_date(self, this_date: str, shift: int = 1) -> str:
+        return self.trade_dates[self.trade_dates.index(this_date) + shift]
+
+    def get_iter_list(self, bgn_date: str, stp_date: str) -> list[str]:
+        return [d for d in self.trade_dates if bgn_date <= d < stp_date]
+
+
+@pytest.fixture
+def trade_dates() -> list[str]:
+    return [d.strftime("%Y%m%d") for d in pd.bdate_range("2023-12-01", "2024-03-29")]
+
+
+@pytest.fixture
+def calendar(trade_dates: list[str]) -> CFakeCalendar:
+    return CFakeCalendar(trade_dates)
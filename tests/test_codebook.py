@@ -0,0 +1,57 @@
+import pandas as pd
+import pytest
+from typedefs.typedef_instrus import CCfgInstru, CUniverseCodebook
+from typedefs.typedef_returns import CRet, TReturnClass
+from solutions.db_generator import get_avlb_db
+from solutions.db_io import save_bulk
+from solutions.test_return import CTestReturnsAvlb
+
+UNIVERSE = {"B": CCfgInstru("C", "AGR"), "A": CCfgInstru("C", "MTL")}
+
+
+@pytest.fixture
+def codebook() -> CUniverseCodebook:
+    return CUniverseCodebook.from_universe(UNIVERSE)
+
+
+def test_encode_decode(codebook):
+    data = pd.DataFrame({"trade_date": ["20240102"] * 2, "instrument": ["B", "A"], "sectorL1": ["AGR", "MTL"]})
+    encoded = codebook.encode(data)
+    assert encoded["instrument"].cat.codes.tolist() == [1, 0]
+    assert codebook.decode(encoded)["instrument"].tolist() == ["B", "A"]
+
+
+def test_unknown_instrument(codebook):
+    # "X" is removed from universe, its rows are still in saved data
+    data = pd.DataFrame({"trade_date": ["20240102"] * 3, "instrument": ["A", "X", "B"], "v": [1.0, 2.0, 3.0]})
+    with pytest.raises(ValueError):
+        codebook.encode(data)
+    known = codebook.encode_known(data, source="test")
+    assert known["instrument"].astype(object).tolist() == ["A", "B"]
+    assert known["v"].tolist() == [1.0, 3.0]
+
+
+def test_load_available_of_retired_instrument(tmp_path, codebook):
+    db_struct_avlb = get_avlb_db(str(tmp_path))
+    avlb = pd.DataFrame(
+        {
+            "trade_date": ["20240102"] * 3,
+            "instrument": ["A", "B", "X"],
+            "return": 0.0,
+            "amount": 1.0,
+            "volatility": 0.1,
+            "sectorL0": "C",
+            "sectorL1": ["MTL", "AGR", "OIL"],
+        }
+    )
+    save_bulk(db_struct_avlb, avlb)
+    test_returns_avlb = CTestReturnsAvlb(
+        ret=CRet(TReturnClass.CLS, 1, 1),
+        universe=UNIVERSE,
+        test_returns_by_instru_dir=str(tmp_path),
+        test_returns_avlb_raw_dir=str(tmp_path),
+        db_struct_avlb=db_struct_avlb,
+    )
+    loaded = test_returns_avlb.load_available("20240101", "20240103")
+    assert loaded["instrument"].astype(object).tolist() == ["A", "B"]
+    assert loaded["instrument"].dtype == codebook.get_dtype("instrument")
@@ -0,0 +1,38 @@
+import os
+import pandas as pd
+import pytest
+from husfort.qsqlite import CDbStruct, CSqlTable, CSqlVar
+from solutions.db_io import save_bulk, save_with_continuity, get_reader, read_by_range, read_last_date
+
+
+@pytest.fixture
+def db_struct(tmp_path) -> CDbStruct:
+    return CDbStruct(
+        db_save_dir=str(tmp_path),
+        db_name="test.db",
+        table=CSqlTable(
+            name="test",
+            primary_keys=[CSqlVar("trade_date", "TEXT")],
+            value_columns=[CSqlVar("value", "REAL")],
+        ),
+    )
+
+
+def test_no_wal_left_for_immutable_readers(db_struct, trade_dates):
+    save_bulk(db_struct, pd.DataFrame({"trade_date": trade_dates[:10], "value": 1.0}))
+    assert not os.path.exists(os.path.join(db_struct.db_save_dir, f"{db_struct.db_name}-wal"))
+    assert len(read_by_range(db_struct, trade_dates[0], trade_dates[10])) == 10
+
+
+def test_reader_reused_until_written(db_struct, trade_dates, calendar):
+    db_path = os.path.join(db_struct.db_save_dir, db_struct.db_name)
+    save_with_continuity(db_struct, pd.DataFrame({"trade_date": trade_dates[:10], "value": 1.0}), calendar)
+    assert read_last_date(db_struct) == trade_dates[9]
+    con, reused = get_reader(db_path)
+    assert reused
+    assert get_reader(db_path) == (con, True)
+
+    # a reader opened before the database is written again is reopened, so new rows are seen
+    save_with_continuity(db_struct, pd.DataFrame({"trade_date": trade_dates[10:15], "value": 2.0}), calendar)
+    assert get_reader(db_path)[1] is False
+    assert read_last_date(db_struct) == trade_dates[14]
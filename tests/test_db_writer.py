@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+from husfort.qsqlite import CDbStruct, CSqlTable, CSqlVar
+from solutions.db_io import (
+    CDbWriter,
+    save_bulk,
+    save_with_continuity,
+    save_splice,
+    read_by_range,
+    read_last_date,
+    read_trade_dates,
+)
+
+
+@pytest.fixture(params=["TEXT", "INTEGER"])
+def db_struct(request, tmp_path) -> CDbStruct:
+    return CDbStruct(
+        db_save_dir=str(tmp_path),
+        db_name="test.db",
+        table=CSqlTable(
+            name="test",
+            primary_keys=[CSqlVar("trade_date", request.param), CSqlVar("instrument", "TEXT")],
+            value_columns=[CSqlVar("value", "REAL"), CSqlVar("ticker", "TEXT")],
+        ),
+    )
+
+
+def gen_data(dates: list[str], instruments: list[str], seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame([(d, i) for d in dates for i in instruments], columns=["trade_date", "instrument"])
+    data["value"] = rng.normal(size=len(data))
+    data["ticker"] = data["instrument"] + data["trade_date"].str[2:6]
+    return data
+
+
+def test_write_then_read(db_struct, trade_dates):
+    data = gen_data(trade_dates[:20], ["A", "B", "C"])
+    assert save_bulk(db_struct, data) == len(data)
+    assert read_last_date(db_struct) == trade_dates[19]
+    assert read_trade_dates(db_struct, trade_dates[5], trade_dates[10]) == trade_dates[5:10]
+    loaded = read_by_range(db_struct, trade_dates[0], trade_dates[20])
+    pd.testing.assert_frame_equal(loaded, data)
+
+
+def test_write_by_position(db_struct, trade_dates):
+    data = gen_data(trade_dates[:5], ["A", "B"])
+    renamed = data.set_axis(["date", "instru", "x", "y"], axis=1)
+    save_bulk(db_struct, renamed)
+    pd.testing.assert_frame_equal(read_by_range(db_struct, trade_dates[0], trade_dates[5]), data)
+    with pytest.raises(ValueError):
+        save_bulk(db_struct, data[["trade_date", "instrument", "value"]])
+
+
+def test_first_build_drops_duplicate_keys(db_struct, trade_dates):
+    data = gen_data(trade_dates[:5], ["A", "B"])
+    dup = data.iloc[[3]].assign(value=99.0)
+    save_bulk(db_struct, pd.concat([data, dup], ignore_index=True))
+    loaded = read_by_range(db_struct, trade_dates[0], trade_dates[5])
+    assert len(loaded) == len(data)
+    assert loaded.set_index(["trade_date", "instrument"]).loc[tuple(data.iloc[3, :2]), "value"] == 99.0
+
+
+def test_append_and_splice(db_struct, trade_dates, calendar):
+    data = gen_data(trade_dates[:15], ["A", "B"])
+    head, tail = data.iloc[:20], data.iloc[20:]
+    save_with_continuity(db_struct, head, calendar)
+    assert read_last_date(db_struct) == trade_dates[9]
+    save_with_continuity(db_struct, tail, calendar)
+    assert read_last_date(db_struct) == trade_dates[14]
+    # not continuous, so not saved
+    assert save_with_continuity(db_struct, gen_data(trade_dates[20:25], ["A", "B"]), calendar) == 0
+    pd.testing.assert_frame_equal(read_by_range(db_struct, trade_dates[0], trade_dates[15]), data)
+
+    patch = gen_data(trade_dates[3:6], ["A"], seed=1)
+    save_splice(db_struct, patch, trade_dates[3], trade_dates[6])
+    loaded = read_by_range(db_struct, trade_dates[3], trade_dates[6])
+    pd.testing.assert_frame_equal(loaded, patch)
+    with CDbWriter(db_struct) as writer:
+        assert writer.delete_range(trade_dates[10]) == 10
+    assert read_last_date(db_struct) == trade_dates[9]
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+from husfort.qsqlite import CDbStruct, CSqlTable, CSqlVar
+from typedefs.typedef_factors import CDecay, CArgsWin, CCfgFactorGrpWin, merge_factor_inputs
+from solutions.db_io import save_bulk
+from solutions.factor import CFactorsByInstru, select_inputs, share_inputs
+from solutions.shared_inputs import ENV_SHARED_CACHE_DIR
+
+
+class CFactorClose(CFactorsByInstru):
+    inputs = {"minute_bar": ["close"]}
+
+
+class CFactorVol(CFactorsByInstru):
+    inputs = {"minute_bar": ["close", "vol"]}
+
+
+def test_merge_and_select_inputs():
+    merged = merge_factor_inputs(CFactorClose.inputs, CFactorVol.inputs, {"pos": ["oi"]})
+    assert merged == {"minute_bar": ["close", "vol"], "pos": ["oi"]}
+    shared = {"minute_bar": pd.DataFrame({"trade_date": ["20240102", "20240103"], "close": 1.0, "vol": 2.0})}
+    selected = select_inputs(shared, CFactorClose.inputs, "20240103")
+    assert selected["minute_bar"].to_dict("list") == {"trade_date": ["20240103"], "close": [1.0]}
+
+
+def test_share_inputs_loads_once(tmp_path, monkeypatch, trade_dates, calendar):
+    run_dir = tmp_path / "run"
+    run_dir.mkdir()
+    monkeypatch.setenv(ENV_SHARED_CACHE_DIR, str(run_dir))
+    db_struct_minute_bar = CDbStruct(
+        db_save_dir=str(tmp_path),
+        db_name="minute_bar.db",
+        table=CSqlTable(
+            name="minute_bar",
+            primary_keys=[CSqlVar("trade_date", "TEXT")],
+            value_columns=[CSqlVar("close", "REAL"), CSqlVar("vol", "REAL")],
+        ),
+    )
+    rng = np.random.default_rng(0)
+    bar = pd.DataFrame({"trade_date": trade_dates, "close": rng.normal(size=len(trade_dates)), "vol": 1.0})
+    save_bulk(db_struct_minute_bar.copy_to_another(another_db_name="A.db"), bar)
+
+    facs = [
+        cls(
+            factor_grp=CCfgFactorGrpWin(factor_class=name, decay=CDecay(1.0, 5), args=CArgsWin(wins=[win])),
+            factors_by_instru_dir=str(tmp_path),
+            universe={},
+            db_struct_minute_bar=db_struct_minute_bar,
+        )
+        for cls, name, win in [(CFactorClose, "CLOSE", 5), (CFactorVol, "VOL", 20)]
+    ]
+    loads: list[list[str]] = []
+    for fac in facs:
+        load_minute_bar = fac.load_minute_bar
+        fac.load_minute_bar = lambda *a, _load=load_minute_bar, **k: loads.append(k["values"]) or _load(*a, **k)
+
+    bgn_date, stp_date = trade_dates[40], trade_dates[60]
+    alone: list[pd.DataFrame] = []
+    for fac in facs:
+        buffer_bgn_date = fac.factor_grp.buffer_bgn_date(bgn_date, calendar)
+        alone.append(fac.load_inputs("A", buffer_bgn_date, stp_date)["minute_bar"])
+    loads.clear()
+
+    assert share_inputs(facs) == 2
+    for fac, expected in zip(facs, alone):
+        inputs = fac.prefetch_inputs("A", bgn_date, stp_date, calendar)
+        pd.testing.assert_frame_equal(inputs["minute_bar"], expected, check_dtype=False)
+    # loaded by the first class only, with columns of both
+    assert loads == [["trade_date", "close", "vol"]]
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import pytest
+from husfort.qsqlite import CDbStruct, CSqlTable, CSqlVar
+from solutions.db_io import save_bulk, save_splice, read_tail
+from solutions.qsummary import CQTestSummaryStore, cal_mean_std
+
+FACTORS = ["f0", "f1"]
+
+
+@pytest.fixture
+def test_data() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    dates = [d.strftime("%Y%m%d") for d in pd.bdate_range("2021-11-01", periods=300)]
+    data = pd.DataFrame({"trade_date": dates})
+    for f in FACTORS:
+        data[f] = np.where(rng.random(len(dates)) > 0.1, rng.normal(size=len(dates)), np.nan)
+    return data
+
+
+@pytest.fixture
+def test_db_struct(tmp_path) -> CDbStruct:
+    return CDbStruct(
+        db_save_dir=str(tmp_path),
+        db_name="test.db",
+        table=CSqlTable(
+            name="test",
+            primary_keys=[CSqlVar("trade_date", "TEXT")],
+            value_columns=[CSqlVar(f, "REAL") for f in FACTORS],
+        ),
+    )
+
+
+@pytest.fixture
+def store(tmp_path) -> CQTestSummaryStore:
+    db_struct = CDbStruct(
+        db_save_dir=str(tmp_path),
+        db_name="summary.db",
+        table=CSqlTable(
+            name="summary",
+            primary_keys=[CSqlVar("trade_date", "TEXT")],
+            value_columns=[
+                CSqlVar(f"{f}_{s}", "INTEGER" if s == "n" else "REAL") for f in FACTORS for s in ("n", "s1", "s2")
+            ],
+        ),
+    )
+    return CQTestSummaryStore(db_struct, FACTORS)
+
+
+def test_cal_mean_std():
+    rng = np.random.default_rng(1)
+    x = pd.DataFrame(rng.normal(size=(50, 3)))
+    x.iloc[::7, 0] = np.nan
+    x.iloc[:49, 2] = np.nan
+    mean, std = cal_mean_std(x.notna().sum().to_frame().T, x.sum().to_frame().T, (x**2).sum().to_frame().T)
+    np.testing.assert_allclose(mean.iloc[0], x.mean(), rtol=1e-12)
+    np.testing.assert_allclose(std.iloc[0], x.std(), rtol=1e-12)
+    assert np.isnan(std.iloc[0, 2])
+
+
+def test_update_against_pandas(store, test_db_struct, test_data):
+    save_bulk(test_db_struct, test_data.iloc[:200])
+    assert store.update(test_db_struct, "99999999") == 200
+    save_bulk(test_db_struct, test_data.iloc[200:])
+    assert store.update(test_db_struct, "99999999") == 100
+    assert store.last_date() == test_data["trade_date"].iloc[-1]
+
+    indexed = test_data.set_index("trade_date")
+    mean, std = store.load_rolling(20, test_data["trade_date"].iloc[0], "99999999", min_periods=5)
+    expected = indexed.rolling(20, min_periods=5)
+    pd.testing.assert_frame_equal(mean, expected.mean(), check_names=False, atol=1e-10)
+    pd.testing.assert_frame_equal(std, expected.std(), check_names=False, atol=1e-10)
+
+    yearly = store.load_yearly(test_data["trade_date"].iloc[0], "99999999")
+    grouped = indexed.groupby(indexed.index.str[0:4])
+    for stat in ("mean", "std"):
+        res = yearly.pivot(index="trade_year", columns="factor", values=stat)[FACTORS]
+        pd.testing.assert_frame_equal(res, grouped.agg(stat), check_names=False, atol=1e-10)
+
+
+def test_rewind(store, test_db_struct, test_data):
+    save_bulk(test_db_struct, test_data)
+    store.update(test_db_struct, "99999999")
+    bgn_date, stp_date = test_data["trade_date"].iloc[[150, 160]]
+    patch = test_data.iloc[150:160].assign(**{f: 1.0 for f in FACTORS})
+    save_splice(test_db_struct, patch, bgn_date, stp_date)
+    assert store.rewind(bgn_date) == 150
+    assert store.update(test_db_struct, "99999999") == 150
+
+    patched = test_data.set_index("trade_date")
+    patched.iloc[150:160] = 1.0
+    cumsum = store.load_cumsum(test_data["trade_date"].iloc[0], "99999999")
+    pd.testing.assert_frame_equal(cumsum, patched.fillna(0).cumsum(), check_names=False, atol=1e-10)
+
+
+def test_not_summarized_yet(store):
+    assert store.last_date() is None
+    assert (store.read_last("20240101").drop(columns="trade_date") == 0).all(axis=None)
+    ir = store.load_rolling_ir(20, "20230101", "20240101")
+    assert ir.empty and ir.columns.tolist() == FACTORS
+    tail = read_tail(store.db_struct, "20240101", n_rows=5, value_columns=["trade_date", "f0_s1"])
+    assert tail.empty and tail.columns.tolist() == ["trade_date", "f0_s1"]
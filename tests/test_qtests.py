@@ -0,0 +1,50 @@
+import os
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from typedefs.typedef_factors import CDecay, CArgsWin, CCfgFactorGrpWin, TFactorNames
+from typedefs.typedef_instrus import CCfgInstru
+from typedefs.typedef_returns import CRet, TReturnClass
+from solutions.db_io import save_bulk
+from solutions.qtests import gen_qtests, main_qtests_summary
+
+
+@dataclass(frozen=True)
+class CCfgFactorGrpTest(CCfgFactorGrpWin):
+    @property
+    def factor_names(self) -> TFactorNames:
+        return self.names_vanilla
+
+
+def gen_tests(factor_class: str, tests_dir: str) -> list:
+    factor_grp = CCfgFactorGrpTest(factor_class=factor_class, decay=CDecay(1.0, 5), args=CArgsWin(wins=[5, 10]))
+    return gen_qtests(
+        rets=[CRet(TReturnClass.CLS, 1, 1)],
+        factor_grp=factor_grp,
+        aux_args_list=[("", "")],
+        tests_dir=tests_dir,
+        universe={"A": CCfgInstru("C", "MTL")},
+        test_type="ic",
+        cost_rate=0.0,
+    )
+
+
+def save_test_rows(test, dates: list[str]):
+    rng = np.random.default_rng(0)
+    names = test.factor_grp.factor_names
+    data = pd.DataFrame({"trade_date": dates, **{n: rng.normal(size=len(dates)) for n in names}})
+    save_bulk(test.gen_test_db_struct(), data)
+
+
+def test_summary_skips_missing_tests(tmp_path):
+    tests_dir = str(tmp_path / "ic")
+    built, not_built, out_of_range = gen_tests("X", tests_dir) + gen_tests("Y", tests_dir) + gen_tests("Z", tests_dir)
+    save_test_rows(built, [d.strftime("%Y%m%d") for d in pd.bdate_range("2023-01-02", "2023-12-29")])
+    save_test_rows(out_of_range, [d.strftime("%Y%m%d") for d in pd.bdate_range("2021-01-04", "2021-12-31")])
+
+    main_qtests_summary([built, not_built, out_of_range], "20230101", "20240101", call_multiprocess=False)
+    reports = os.listdir(os.path.join(tests_dir, "reports"))
+    assert reports == [f"{built.save_id}.csv"]
+    report = pd.read_csv(os.path.join(tests_dir, "reports", reports[0]), dtype={"trade_year": str})
+    assert report["trade_year"].unique().tolist() == ["2023"]
+    assert main_qtests_summary([not_built], "20230101", "20240101", call_multiprocess=False) == 0
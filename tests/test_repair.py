@@ -0,0 +1,73 @@
+import pandas as pd
+from husfort.qsqlite import CDbStruct, CSqlTable, CSqlVar
+from solutions.db_io import save_bulk
+from solutions.repair import to_ranges, find_gaps, merge_ranges, lag_ranges, scan_table
+
+
+def test_to_ranges():
+    all_dates = ["20240102", "20240103", "20240104", "20240105", "20240108"]
+    assert to_ranges(set(), all_dates, "20240109") == []
+    assert to_ranges({"20240103", "20240104"}, all_dates, "20240109") == [("20240103", "20240105")]
+    assert to_ranges({"20240102", "20240105", "20240108"}, all_dates, "20240109") == [
+        ("20240102", "20240103"),
+        ("20240105", "20240109"),
+    ]
+
+
+def test_find_gaps():
+    expected = ["20240102", "20240103", "20240104", "20240105", "20240108"]
+    assert find_gaps(expected, expected, "20240109", "20240102") == []
+    assert find_gaps(expected, ["20240102", "20240105"], "20240109", "20240102") == [
+        ("20240103", "20240105"),
+        ("20240108", "20240109"),
+    ]
+    # dates before the first saved one are not gaps
+    assert find_gaps(expected, ["20240104", "20240108"], "20240109", "20240104") == [("20240105", "20240108")]
+    assert find_gaps(expected, [], "20240109", None) == [("20240102", "20240109")]
+    # a gap at the start of the range, the table has rows before it
+    assert find_gaps(expected, ["20240104", "20240108"], "20240109", "20231229") == [
+        ("20240102", "20240104"),
+        ("20240105", "20240108"),
+    ]
+
+
+def test_scan_table_leading_gap(tmp_path, trade_dates):
+    db_struct = CDbStruct(
+        db_save_dir=str(tmp_path),
+        db_name="test.db",
+        table=CSqlTable(
+            name="test",
+            primary_keys=[CSqlVar("trade_date", "TEXT")],
+            value_columns=[CSqlVar("v", "REAL")],
+        ),
+    )
+    saved = trade_dates[:10] + trade_dates[13:20]
+    save_bulk(db_struct, pd.DataFrame({"trade_date": saved, "v": 1.0}))
+    bgn_date, stp_date = trade_dates[10], trade_dates[20]
+    assert scan_table(db_struct, trade_dates[10:20], bgn_date, stp_date) == [(trade_dates[10], trade_dates[13])]
+    # the first saved date of the table is still where nothing is missed
+    assert scan_table(db_struct, trade_dates[:20], trade_dates[0], stp_date) == [(trade_dates[10], trade_dates[13])]
+
+
+def test_merge_ranges():
+    assert merge_ranges([]) == []
+    assert merge_ranges([("20240110", "20240112"), ("20240102", "20240104")]) == [
+        ("20240102", "20240104"),
+        ("20240110", "20240112"),
+    ]
+    # overlapping and adjacent ones
+    assert merge_ranges([("20240102", "20240105"), ("20240104", "20240108"), ("20240108", "20240110")]) == [
+        ("20240102", "20240110")
+    ]
+    assert merge_ranges([("20240102", "20240110"), ("20240103", "20240104")]) == [("20240102", "20240110")]
+
+
+def test_lag_ranges(calendar):
+    ranges = [("20240103", "20240105"), ("20240110", "20240112")]
+    assert lag_ranges(ranges, 0, 0, "20240329", calendar) == ranges
+    assert lag_ranges(ranges, 1, 2, "20240329", calendar) == [("20240104", "20240109"), ("20240111", "20240116")]
+    # lagged ranges which meet are merged
+    assert lag_ranges(ranges, 0, 3, "20240329", calendar) == [("20240103", "20240117")]
+    # and clipped to stp_date
+    assert lag_ranges(ranges, 1, 2, "20240111", calendar) == [("20240104", "20240109")]
+    assert lag_ranges(ranges, 1, 2, "20240115", calendar) == [("20240104", "20240109"), ("20240111", "20240115")]
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+from math_tools.rolling import cal_rolling_moments, cal_rolling_multi_wins
+
+WINS = [3, 10, 40]
+
+
+@pytest.fixture
+def xy() -> tuple[pd.Series, pd.Series]:
+    rng = np.random.default_rng(0)
+    x = pd.Series(rng.normal(size=300) + 10.0)
+    y = 0.3 * x + pd.Series(rng.normal(size=300))
+    x.iloc[::17] = np.nan
+    y.iloc[5::23] = np.nan
+    return x, y
+
+
+def test_multi_wins_against_pandas(xy):
+    x, y = xy
+    min_periods = {win: int(2 * win / 3) for win in WINS}
+    res = cal_rolling_multi_wins(x, WINS, y=y, min_periods=min_periods, min_periods_pair=min_periods)
+    pair_ok = x.notna() & y.notna()
+    xp, yp = x.where(pair_ok), y.where(pair_ok)
+    for win in WINS:
+        rolling = x.rolling(win, min_periods=min_periods[win])
+        pd.testing.assert_series_equal(res["sum"][win], rolling.sum(), check_names=False, rtol=1e-9)
+        pd.testing.assert_series_equal(res["mean"][win], rolling.mean(), check_names=False, rtol=1e-9)
+        pd.testing.assert_series_equal(res["std"][win], rolling.std(), check_names=False, rtol=1e-6)
+        cov = xp.rolling(win, min_periods=min_periods[win]).cov(yp)
+        beta = cov / xp.rolling(win, min_periods=min_periods[win]).var()
+        pd.testing.assert_series_equal(res["cov"][win], cov, check_names=False, rtol=1e-6, atol=1e-9)
+        pd.testing.assert_series_equal(res["beta"][win], beta, check_names=False, rtol=1e-6, atol=1e-9)
+
+
+def test_multi_wins_panel_over_own_rows(xy):
+    x, y = xy
+    rng = np.random.default_rng(1)
+    cols: dict[str, tuple[pd.Series, pd.Series]] = {}
+    for k in range(3):
+        keep = rng.random(len(x)) > 0.3 * k
+        cols[f"I{k}"] = (x[keep].set_axis(np.arange(len(x))[keep]), y[keep].set_axis(np.arange(len(x))[keep]))
+    panel_x = pd.concat({c: v[0] for c, v in cols.items()}, axis=1)
+    panel_y = pd.concat({c: v[1] for c, v in cols.items()}, axis=1)
+    present = pd.concat({c: pd.Series(True, index=v[0].index) for c, v in cols.items()}, axis=1)
+    present = present.reindex(panel_x.index).fillna(False).astype(bool)
+    panel = cal_rolling_multi_wins(panel_x, WINS, y=panel_y, min_periods=2, present=present)
+    for c, (xc, yc) in cols.items():
+        single = cal_rolling_multi_wins(xc, WINS, y=yc, min_periods=2)
+        for key in ("sum", "mean", "std", "cov", "beta"):
+            for win in WINS:
+                own = panel[key][win][c][present[c]]
+                pd.testing.assert_series_equal(own, single[key][win], check_names=False, rtol=1e-9, atol=1e-12)
+                assert panel[key][win][c][~present[c]].isna().all()
+
+
+def test_moments_against_pandas(xy):
+    x, y = xy
+    x, y = x.fillna(0), y.fillna(0)
+    res = cal_rolling_moments(x, y, rolling_window=20)
+    pd.testing.assert_series_equal(res["cov"], x.rolling(20).cov(y), check_names=False, rtol=1e-6)
+    pd.testing.assert_series_equal(res["var_x"], x.rolling(20).var(), check_names=False, rtol=1e-6)
+    pd.testing.assert_series_equal(res["corr"], x.rolling(20).corr(y), check_names=False, rtol=1e-6)
+    pd.testing.assert_series_equal(res["beta"], x.rolling(20).cov(y) / x.rolling(20).var(), check_names=False,
+                                   rtol=1e-6)
@@ -5,6 +5,7 @@ from husfort.qsqlite import CDbStruct
 from typedefs.typedef_instrus import TUniverse, CCfgAvlbUnvrs
 from typedefs.typedef_css import CCfgCss, CCfgICov, CCfgMkt
 from typedefs.typedef_returns import CCfgTst, TReturnClass, CRet, TRets
+from typedefs.typedef_factors import CCfgScreen
 
 
 """
@@ -35,6 +36,19 @@ class CCfgConst:
     LAG: int
 
 
+@dataclass(frozen=True)
+class CCfgLoaders:
+    backend: str = "threads"  # serial, threads or processes, see solutions.concurrency
+    workers: int | None = None  # max number of threads or processes, None for the default
+
+
+@dataclass(frozen=True)
+class CCfgSqliteRead:
+    immutable: bool = True  # open with immutable=1, see solutions.db_io
+    mmap_size_mb: int = 256
+    cache_size_mb: int = 64
+
+
 @dataclass(frozen=True)
 class CCfgProj:
     # --- shared
@@ -59,6 +73,11 @@ class CCfgProj:
     mkt: CCfgMkt
     const: CCfgConst
     tst: CCfgTst
+    trade_date_dtype: str = "TEXT"  # of project databases, TEXT or INTEGER
+    by_instru_layout: str = "files"  # of by-instrument factors and test returns, files or consolidated
+    screen: CCfgScreen | None = None
+    loaders: CCfgLoaders = CCfgLoaders()
+    sqlite_read: CCfgSqliteRead = CCfgSqliteRead()
 
     @property
     def sectors(self) -> list[str]:
@@ -133,6 +152,18 @@ class CCfgProj:
     def vt_tests_dir(self):
         return os.path.join(self.project_root_dir, "vt_tests")
 
+    @property
+    def screen_dir(self):
+        return os.path.join(self.project_root_dir, "screen")
+
+    @property
+    def panel_store_dir(self):
+        return os.path.join(self.project_root_dir, "panel_store")
+
+    @property
+    def perf_dir(self):
+        return os.path.join(self.project_root_dir, "perf")
+
 
 TFactorsAvlbDirType = str
 TTestReturnsAvlbDirType = str
@@ -1,12 +1,36 @@
 import numpy as np
 from dataclasses import dataclass
 from itertools import product
+from typing import Literal
 from husfort.qcalendar import CCalendar
 
 TFactorClass = str
 TFactorName = str
 TFactorNames = list[TFactorName]
 
+"""
+--- inputs declared by factor classes ---
+source -> columns, like {"preprocess": ["closeI", "oi_major"], "minute_bar": ["close", "vol"]}
+"trade_date" is always loaded and need not be declared
+"""
+
+TFactorInputSource = Literal["preprocess", "minute_bar", "pos"]
+TFactorInputs = dict[TFactorInputSource, list[str]]
+
+
+def merge_factor_inputs(*inputs: TFactorInputs) -> TFactorInputs:
+    """
+
+    :param inputs: inputs declared by several factor classes
+    :return: union of columns for each source, order of first appearance kept
+    """
+    res: TFactorInputs = {}
+    for inp in inputs:
+        for source, columns in inp.items():
+            merged = res.setdefault(source, [])
+            merged.extend([c for c in columns if c not in merged])
+    return res
+
 
 @dataclass(frozen=True)
 class CFactor:
@@ -36,6 +60,13 @@ class CArgs:
     pass
 
 
+@dataclass(frozen=True)
+class CCfgScreen:
+    block_size: int  # number of grid values calculated at once
+    top_k: int  # number of variants whose full test series are kept
+    grids: dict[TFactorClass, dict[str, list]]  # factor class -> arg -> values, like {"REOC": {"wins": [2, 3]}}
+
+
 @dataclass(frozen=True)
 class CCfgFactorGrp:
     factor_class: TFactorClass
@@ -51,6 +82,13 @@ class CCfgFactorGrp:
         res = [CFactor(self.factor_class, factor_name) for factor_name in self.factor_names]
         return TFactors(res)
 
+    @property
+    def buffer_win(self) -> int:
+        return 0
+
+    def buffer_bgn_date(self, bgn_date: str, calendar: CCalendar, shift: int = -5) -> str:
+        return calendar.get_next_date(bgn_date, -self.buffer_win + shift)
+
 
 """
 --- CCfgFactorGrp with Arguments   ---
@@ -138,8 +176,9 @@ class CCfgFactorGrpWin(CCfgFactorGrp):
     def factor_names(self) -> TFactorNames:
         return self.names_vanilla
 
-    def buffer_bgn_date(self, bgn_date: str, calendar: CCalendar, shift: int = -5) -> str:
-        return calendar.get_next_date(bgn_date, -max(self.args.wins) + shift)
+    @property
+    def buffer_win(self) -> int:
+        return max(self.args.wins)
 
 
 @dataclass(frozen=True)
@@ -191,8 +230,9 @@ class CCfgFactorGrpWinLbd(CCfgFactorGrp):
     def factor_names(self) -> TFactorNames:
         return self.names_vanilla
 
-    def buffer_bgn_date(self, bgn_date: str, calendar: CCalendar, shift: int = -5) -> str:
-        return calendar.get_next_date(bgn_date, -max(self.args.wins) + shift)
+    @property
+    def buffer_win(self) -> int:
+        return max(self.args.wins)
 
 
 @dataclass(frozen=True)
@@ -1,4 +1,6 @@
+import pandas as pd
 from dataclasses import dataclass
+from loguru import logger
 
 
 @dataclass(frozen=True)
@@ -11,6 +13,86 @@ TInstruName = str
 TUniverse = dict[TInstruName, CCfgInstru]
 
 
+@dataclass(frozen=True)
+class CUniverseCodebook:
+    """
+    Stable integer codes of instruments and sectors in a universe. Codes follow sorted names,
+    so they do not depend on the order of instruments in config.yaml.
+    Long frames encoded by this codebook carry categorical columns, merges and groupbys on them
+    run on the integer codes, and CDbWriter saves them as names.
+    """
+
+    instruments: tuple[TInstruName, ...]
+    sectorsL0: tuple[str, ...]
+    sectorsL1: tuple[str, ...]
+
+    @staticmethod
+    def from_universe(universe: TUniverse) -> "CUniverseCodebook":
+        return CUniverseCodebook(
+            instruments=tuple(sorted(universe)),
+            sectorsL0=tuple(sorted({v.sectorL0 for v in universe.values()})),
+            sectorsL1=tuple(sorted({v.sectorL1 for v in universe.values()})),
+        )
+
+    @property
+    def categories(self) -> dict[str, tuple[str, ...]]:
+        return {
+            "instrument": self.instruments,
+            "instrument0": self.instruments,
+            "instrument1": self.instruments,
+            "sectorL0": self.sectorsL0,
+            "sectorL1": self.sectorsL1,
+        }
+
+    def get_dtype(self, column: str) -> pd.CategoricalDtype:
+        return pd.CategoricalDtype(categories=list(self.categories[column]), ordered=False)
+
+    def encode(self, data: pd.DataFrame) -> pd.DataFrame:
+        """
+
+        :param data: a long frame, columns in self.categories are encoded if found, others are kept
+        :return: a new frame
+        """
+        res = data.copy(deep=False)
+        for column in self.categories:
+            if column not in res.columns:
+                continue
+            dtype = self.get_dtype(column)
+            if res[column].dtype == dtype:
+                continue
+            if (unknown := ~res[column].isin(dtype.categories) & res[column].notna()).any():
+                raise ValueError(f"Unknown {column} = {res.loc[unknown, column].unique().tolist()}")
+            res[column] = res[column].astype(dtype)
+        return res
+
+    def encode_known(self, data: pd.DataFrame, source: str) -> pd.DataFrame:
+        """
+        Like encode, for saved data. Rows of instruments or sectors not in the universe, like those of
+        an instrument removed from config.yaml, are dropped with a warning, as merges on the universe did.
+
+        :param data: a long frame
+        :param source: for logging, like "avlb"
+        :return: a new frame
+        """
+        known = pd.Series(True, index=data.index)
+        for column, categories in self.categories.items():
+            if column not in data.columns or data[column].dtype == self.get_dtype(column):
+                continue
+            is_known = data[column].isin(categories) | data[column].isna()
+            if not is_known.all():
+                unknown = data.loc[~is_known, column].unique().tolist()
+                logger.warning(f"Rows of {column} = {unknown} in {source} are not in universe, they are dropped")
+                known &= is_known
+        return self.encode(data if known.all() else data[known])
+
+    def decode(self, data: pd.DataFrame) -> pd.DataFrame:
+        res = data.copy(deep=False)
+        for column in self.categories:
+            if column in res.columns and isinstance(res[column].dtype, pd.CategoricalDtype):
+                res[column] = res[column].astype(object)
+        return res
+
+
 @dataclass(frozen=True)
 class CCfgAvlbUnvrs:
     win: int